@@ -0,0 +1,57 @@
+"""Benchmarks for the project's performance features.
+
+Each module runs against a throwaway test database and a private cache, so it
+never touches ``db.sqlite3`` or the shared cache file. Run from the project
+directory, for example::
+
+    python -m benchmarks.conditional_get
+"""
+import json
+import os
+import statistics
+import tempfile
+import time
+
+
+def setup(database_file=False):
+    """Configures Django with a fresh test database, which the replica alias
+    mirrors, and an empty private cache and metrics directory. SQLite test
+    databases live in memory unless ``database_file`` is set, which lets
+    many threads use the database the way a deployment does."""
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "yatube.settings")
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    scratch = tempfile.mkdtemp()
+    os.environ["CACHE_LOCATION"] = os.path.join(scratch, "cache.sqlite3")
+    os.environ["METRICS_DIR"] = os.path.join(scratch, "metrics")
+    import django
+    django.setup()
+    from django.db import connection, connections
+    from django.test.utils import setup_test_environment
+    setup_test_environment(debug=False)
+    if database_file:
+        connection.settings_dict["TEST"]["NAME"] = os.path.join(scratch, "db.sqlite3")
+    connection.creation.create_test_db(verbosity=0)
+    connections["replica"].creation.set_as_test_mirror(connection.settings_dict)
+
+
+def measure(func, repeat=200):
+    """Calls ``func`` ``repeat`` times and returns per-call timings in milliseconds."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def summary(timings):
+    ordered = sorted(timings)
+    return {
+        "mean_ms": round(statistics.mean(ordered), 3),
+        "p50_ms": round(ordered[len(ordered) // 2], 3),
+        "p95_ms": round(ordered[int(len(ordered) * 0.95) - 1], 3),
+    }
+
+
+def report(results):
+    print(json.dumps(results, indent=2, ensure_ascii=False))
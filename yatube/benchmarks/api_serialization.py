@@ -0,0 +1,68 @@
+"""Serialization and rendering of large post lists.
+
+The same 10k posts are turned into JSON by ``PostSerializer`` with the stock
+``JSONRenderer`` and by the read projection with both renderers. Fetching
+(and parsing ``pub_date``) is included, as in the API::
+
+    python -m benchmarks.api_serialization --posts 10000
+"""
+import argparse
+
+from . import measure, report, setup, summary
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--posts", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    setup()
+    from django.contrib.auth.models import User
+    from rest_framework.renderers import JSONRenderer
+    from rest_framework.request import Request
+    from rest_framework.test import APIRequestFactory
+
+    from posts.models import Group, Post
+    from posts.projections import Projection
+    from posts.renderers import ORJSONRenderer
+    from posts.serializers import PostSerializer
+
+    user = User.objects.create_user(username="bench", password="12345")
+    groups = [Group.objects.create(title=f"Bench {n}", slug=f"bench-{n}", description="Bench") for n in range(10)]
+    Post.objects.bulk_create(
+        Post(text=f"Benchmark post {n} " * 10, author=user, group=groups[n % 10] if n % 3 else None,
+             image=f"posts/00/00/{n:064x}.jpg" if n % 2 else None)
+        for n in range(args.posts)
+    )
+    request = Request(APIRequestFactory().get("/api/posts/"))
+    expanded = Request(APIRequestFactory().get("/api/posts/", {"expand": "author,group"}))
+    posts = Post.objects.feed()[:args.posts]
+
+    def serializer(renderer):
+        return lambda: renderer.render(PostSerializer(posts, many=True, context={"request": request}).data)
+
+    def projection(request, renderer):
+        def run():
+            project = Projection.from_request(request)
+            return renderer.render(project(project.rows(posts)))
+        return run
+
+    results = {"posts": args.posts}
+    for name, run in (
+        ("serializer_json", serializer(JSONRenderer())),
+        ("projection_json", projection(request, JSONRenderer())),
+        ("projection_orjson", projection(request, ORJSONRenderer())),
+        ("projection_expanded_orjson", projection(expanded, ORJSONRenderer())),
+    ):
+        results[name] = dict(summary(measure(run, args.repeat)), bytes=len(run()))
+    # Rendering alone, on the same already projected data.
+    project = Projection.from_request(request)
+    data = project(project.rows(posts))
+    for name, renderer in (("render_json", JSONRenderer()), ("render_orjson", ORJSONRenderer())):
+        results[name] = summary(measure(lambda: renderer.render(data), args.repeat))
+    report(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""Throughput of the WSGI and ASGI deployments at high concurrency.
+
+Both applications are served from this process on a database file, with the
+page cache off so every request runs its queries: WSGI by a single-threaded
+``wsgiref`` server, like one sync worker, and ASGI (yatube/asgi.py) by a
+minimal asyncio HTTP server. Concurrent clients fetch profile and post pages,
+one connection per request.
+
+A local SQLite file answers in microseconds, so requests are CPU-bound and
+threads mostly wait for the GIL. ``--db-latency-ms`` adds a sleep to every
+query, like the round-trip to a database server::
+
+    python -m benchmarks.asgi_load --concurrency 64 --requests 2000 --db-latency-ms 2
+"""
+import argparse
+import asyncio
+import itertools
+import statistics
+import threading
+import time
+from urllib.parse import unquote
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer
+
+from . import report, setup
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class BacklogWSGIServer(WSGIServer):
+    # Clients above the default backlog of 5 would be refused.
+    request_queue_size = 1024
+
+
+def serve_wsgi(application):
+    server = BacklogWSGIServer(("127.0.0.1", 0), QuietHandler)
+    server.set_app(application)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.server_address[1], server.shutdown
+
+
+def serve_asgi(application):
+    """Runs ``application`` behind an HTTP/1.1 server (one request per
+    connection) on an event loop in a thread. Returns the port and a stop function."""
+    started = threading.Event()
+    state = {}
+
+    async def handle(reader, writer):
+        head = (await reader.readuntil(b"\r\n\r\n")).decode("latin1").split("\r\n")
+        method, target, _ = head[0].split(" ", 2)
+        headers = [
+            (name.strip().lower().encode("latin1"), value.strip().encode("latin1"))
+            for name, value in (line.split(":", 1) for line in head[1:] if line)
+        ]
+        length = int(dict(headers).get(b"content-length", 0))
+        body = await reader.readexactly(length) if length else b""
+        path, _, query = target.partition("?")
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method,
+            "scheme": "http", "path": unquote(path), "raw_path": path.encode(), "root_path": "",
+            "query_string": query.encode(), "headers": headers,
+            "client": writer.get_extra_info("peername")[:2], "server": ("127.0.0.1", state["port"]),
+        }
+        messages = iter([{"type": "http.request", "body": body, "more_body": False}])
+
+        async def receive():
+            return next(messages, {"type": "http.disconnect"})
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                lines = [f"HTTP/1.1 {message['status']} -"] + [
+                    f"{name.decode('latin1')}: {value.decode('latin1')}" for name, value in message["headers"]
+                ] + ["Connection: close", "", ""]
+                writer.write("\r\n".join(lines).encode("latin1"))
+            else:
+                writer.write(message.get("body", b""))
+                if not message.get("more_body", False):
+                    await writer.drain()
+                    writer.close()
+
+        await application(scope, receive, send)
+
+    async def main():
+        server = await asyncio.start_server(handle, "127.0.0.1", 0, backlog=1024)
+        state["port"] = server.sockets[0].getsockname()[1]
+        state["loop"], state["stop"] = asyncio.get_running_loop(), asyncio.Event()
+        started.set()
+        async with server:
+            await state["stop"].wait()
+
+    threading.Thread(target=asyncio.run, args=(main(),), daemon=True).start()
+    started.wait()
+    return state["port"], lambda: state["loop"].call_soon_threadsafe(state["stop"].set)
+
+
+async def load(port, urls, total, concurrency):
+    """Fetches ``total`` URLs (cycling through ``urls``) with ``concurrency``
+    clients. Returns per-request latencies in ms, elapsed seconds and errors."""
+    targets = itertools.islice(itertools.cycle(urls), total)
+    latencies, errors = [], 0
+
+    async def client():
+        nonlocal errors
+        for url in targets:
+            started = time.perf_counter()
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(f"GET {url} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n".encode())
+            response = await reader.read()
+            writer.close()
+            if not response.startswith(b"HTTP/1.") or response.split(b" ", 2)[1] != b"200":
+                errors += 1
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return latencies, time.perf_counter() - started, errors
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--posts", type=int, default=2000)
+    parser.add_argument("--db-latency-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    setup(database_file=True)
+    from django.db.backends.signals import connection_created
+    from django.contrib.auth.models import User
+    from django.core.wsgi import get_wsgi_application
+    from django.test import override_settings
+    from django.urls import reverse
+
+    from posts.models import Comment, Post
+    from yatube.asgi import get_asgi_application
+
+    authors = [User.objects.create_user(username=f"author{n}", password="12345") for n in range(20)]
+    posts = [
+        Post.objects.create(text=f"Benchmark post {n} " * 10, author=authors[n % len(authors)])
+        for n in range(args.posts)
+    ]
+    for post in posts[-200:]:
+        for n in range(5):
+            Comment.objects.create(post=post, author=authors[n], text="Benchmark comment")
+    if args.db_latency_ms:
+        def round_trip(execute, sql, params, many, context):
+            time.sleep(args.db_latency_ms / 1000)
+            return execute(sql, params, many, context)
+
+        def add_latency(sender, connection, **kwargs):
+            # First in the list: execute_wrapper() blocks open around the
+            # connect pop the last wrapper when they exit.
+            if round_trip not in connection.execute_wrappers:
+                connection.execute_wrappers.insert(0, round_trip)
+        # Every thread opens connections of its own.
+        connection_created.connect(add_latency, weak=False)
+
+    urls = [reverse("profile", args=[author.username]) for author in authors] + [
+        reverse("post", args=[post.author.username, post.pk]) for post in posts[-20:]
+    ]
+
+    results = {"concurrency": args.concurrency, "requests": args.requests, "db_latency_ms": args.db_latency_ms}
+    with override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}):
+        for name, serve, application in (
+            ("wsgi", serve_wsgi, get_wsgi_application()),
+            ("asgi", serve_asgi, get_asgi_application()),
+        ):
+            port, stop = serve(application)
+            asyncio.run(load(port, urls, 50, 8))
+            latencies, elapsed, errors = asyncio.run(load(port, urls, args.requests, args.concurrency))
+            stop()
+            ordered = sorted(latencies)
+            results[name] = {
+                "requests_per_s": round(len(latencies) / elapsed, 1),
+                "mean_ms": round(statistics.mean(ordered), 1),
+                "p50_ms": round(ordered[len(ordered) // 2], 1),
+                "p99_ms": round(ordered[int(len(ordered) * 0.99) - 1], 1),
+                "errors": errors,
+            }
+    report(results)
+
+
+if __name__ == "__main__":
+    main()
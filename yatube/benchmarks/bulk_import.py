@@ -0,0 +1,89 @@
+"""Throughput and memory of ``manage.py import_yatube``.
+
+Writes a synthetic community as NDJSON, imports it into a database file and
+reports rows per second, against creating the same posts one ``save()`` at a
+time, and the peak memory of the process before and after the import::
+
+    python -m benchmarks.bulk_import --posts 200000
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import tempfile
+import time
+
+from . import report, setup
+
+
+def write_community(path, users, posts, comments, follows, seed=1):
+    rng = random.Random(seed)
+    with open(path, "w") as file:
+        def write(record):
+            file.write(json.dumps(record) + "\n")
+
+        for n in range(users):
+            write({"type": "user", "id": f"u{n}", "username": f"imported{n}"})
+        for n in range(10):
+            write({"type": "group", "id": f"g{n}", "slug": f"imported-{n}", "title": f"Group {n}"})
+        for n in range(posts):
+            write({
+                "type": "post", "id": f"p{n}", "author": f"u{rng.randrange(users)}",
+                "group": f"g{n % 10}" if n % 3 else None, "text": f"Imported post number {n} " * 5,
+                "pub_date": f"2019-{n % 12 + 1:02}-{n % 28 + 1:02}T12:00:00Z",
+            })
+        for n in range(comments):
+            write({"type": "comment", "post": f"p{rng.randrange(posts)}", "author": f"u{rng.randrange(users)}",
+                   "text": f"Imported comment {n}"})
+        for n in range(follows):
+            write({"type": "follow", "user": f"u{rng.randrange(users)}", "author": f"u{rng.randrange(users)}"})
+    return users + 10 + posts + comments + follows
+
+
+def peak_rss_mb():
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--posts", type=int, default=100000)
+    parser.add_argument("--comments", type=int, default=100000)
+    parser.add_argument("--follows", type=int, default=20000)
+    parser.add_argument("--save-sample", type=int, default=2000, help="Posts created with save() for comparison.")
+    args = parser.parse_args()
+
+    setup(database_file=True)
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+
+    from posts.models import Post
+
+    path = os.path.join(tempfile.mkdtemp(), "community.ndjson")
+    rows = write_community(path, args.users, args.posts, args.comments, args.follows)
+
+    author = User.objects.create_user(username="saver", password="12345")
+    started = time.perf_counter()
+    for n in range(args.save_sample):
+        Post.objects.create(text=f"Saved post number {n}", author=author)
+    save_rate = args.save_sample / (time.perf_counter() - started)
+
+    before = peak_rss_mb()
+    started = time.perf_counter()
+    with open(os.devnull, "w") as devnull:
+        call_command("import_yatube", path, stdout=devnull)
+    elapsed = time.perf_counter() - started
+    report({
+        "rows": rows,
+        "import_s": round(elapsed, 1),
+        "import_rows_per_s": round(rows / elapsed),
+        "save_posts_per_s": round(save_rate),
+        "peak_rss_before_mb": before,
+        "peak_rss_after_mb": peak_rss_mb(),
+        "input_mb": round(os.path.getsize(path) / 1024 / 1024, 1),
+    })
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Ingestion throughput of the posts API.
+
+The same posts are sent one per request to ``/api/posts/`` and in batches
+to ``/api/posts/bulk/`` as a JSON array and as NDJSON::
+
+    python -m benchmarks.bulk_posts --posts 5000 --batch 1000
+"""
+import argparse
+import json
+import time
+
+from . import report, setup
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--posts", type=int, default=5000)
+    parser.add_argument("--batch", type=int, default=1000)
+    args = parser.parse_args()
+
+    setup()
+    from django.contrib.auth.models import User
+    from django.test import Client
+    from rest_framework.authtoken.models import Token
+
+    from posts.models import Follow, Group
+
+    user = User.objects.create_user(username="bench", password="12345")
+    for n in range(50):
+        follower = User.objects.create_user(username=f"follower{n}", password="12345")
+        Follow.objects.create(user=follower, author=user)
+    Group.objects.create(title="Bench", slug="bench", description="Bench")
+    client = Client(HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=user).key}")
+    items = [{"text": f"Benchmark post {n} " * 10, "group": "bench"} for n in range(args.posts)]
+    batches = [items[start:start + args.batch] for start in range(0, len(items), args.batch)]
+
+    def single():
+        for item in items:
+            client.post("/api/posts/", json.dumps(item), content_type="application/json")
+
+    def bulk_json():
+        for batch in batches:
+            client.post("/api/posts/bulk/", json.dumps(batch), content_type="application/json")
+
+    def bulk_ndjson():
+        for batch in batches:
+            body = "\n".join(json.dumps(item) for item in batch)
+            client.post("/api/posts/bulk/", body, content_type="application/x-ndjson")
+
+    results = {"posts": args.posts, "batch": args.batch, "followers": 50}
+    for name, run in (("single", single), ("bulk_json", bulk_json), ("bulk_ndjson", bulk_ndjson)):
+        started = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - started
+        results[name] = {"seconds": round(elapsed, 3), "posts_per_second": round(args.posts / elapsed)}
+    report(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""Bandwidth and server time saved by conditional GET on feed pages.
+
+Every page is fetched rendered from scratch, from the page cache and
+revalidated with its ETag; the revalidation is answered with 304 before the
+view or the page cache run.
+"""
+from . import measure, report, setup, summary
+
+
+def main():
+    setup()
+    from django.contrib.auth.models import User
+    from django.core.cache import cache
+    from django.test import Client
+    from django.urls import reverse
+
+    from posts.models import Group, Post
+
+    user = User.objects.create_user(username="bench", password="12345")
+    group = Group.objects.create(title="Bench", slug="bench", description="Bench")
+    posts = [Post.objects.create(text="Benchmark post " * 20, author=user, group=group) for _ in range(30)]
+    client = Client()
+    results = {}
+    for name, url in (
+        ("index", reverse("index")),
+        ("group_posts", reverse("group", args=[group.slug])),
+        ("profile", reverse("profile", args=[user.username])),
+        ("post_view", reverse("post", args=[user.username, posts[-1].pk])),
+    ):
+        cache.clear()
+        full = client.get(url)
+        etag = full["ETag"]
+        revalidated = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        rendered_timings = measure(lambda: (cache.clear(), client.get(url)))
+        cached_timings = measure(lambda: client.get(url))
+        revalidate_timings = measure(lambda: client.get(url, HTTP_IF_NONE_MATCH=etag))
+        results[name] = {
+            "rendered": dict(summary(rendered_timings), status=full.status_code, bytes=len(full.content)),
+            "page_cached": dict(summary(cached_timings), status=full.status_code, bytes=len(full.content)),
+            "revalidated": dict(summary(revalidate_timings), status=revalidated.status_code,
+                                bytes=len(revalidated.content)),
+            "bytes_saved": len(full.content) - len(revalidated.content),
+        }
+    report(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Cost of the always-on request profiling (yatube/profiling.py).
+
+The same requests are timed without the profiling middleware and template
+backend, with them, and with every request sampled into cProfile::
+
+    python -m benchmarks.profiling_overhead
+"""
+from . import measure, report, setup, summary
+
+
+def main():
+    setup()
+    import logging
+    from unittest import mock
+
+    from django.conf import settings
+    from django.contrib.auth.models import User
+    from django.core.cache import cache
+    from django.test import Client, override_settings
+    from django.urls import reverse
+    from rest_framework.authtoken.models import Token
+
+    from posts.models import Group, Post
+    from yatube import profiling
+
+    # The log line is formatted but not written out.
+    logging.getLogger("yatube.requests").handlers = [logging.NullHandler()]
+    user = User.objects.create_user(username="bench", password="12345")
+    group = Group.objects.create(title="Bench", slug="bench", description="Bench")
+    posts = [Post.objects.create(text="Benchmark post " * 20, author=user, group=group) for _ in range(30)]
+    token = Token.objects.create(user=user).key
+    requests = {
+        "index_cached": (reverse("index"), {}, False),
+        "index_rendered": (reverse("index"), {}, True),
+        "post_view": (reverse("post", args=[user.username, posts[-1].pk]), {}, False),
+        "api_posts": ("/api/posts/", {"HTTP_AUTHORIZATION": f"Token {token}"}, False),
+    }
+    plain = override_settings(
+        MIDDLEWARE=[name for name in settings.MIDDLEWARE if name != "yatube.profiling.RequestProfilingMiddleware"],
+        TEMPLATES=[dict(settings.TEMPLATES[0], BACKEND="django.template.backends.django.DjangoTemplates")],
+    )
+    modes = {
+        "off": lambda: plain,
+        "on": lambda: mock.patch.object(profiling, "SAMPLE_RATE", 0.0),
+        "cprofile_every_request": lambda: mock.patch.multiple(profiling, SAMPLE_RATE=1.0, SLOW_MS=float("inf")),
+    }
+
+    results = {}
+    for name, (url, headers, clear) in requests.items():
+        timings = {mode: [] for mode in modes}
+        # Modes take turns in short blocks, so drift over the run hits all of
+        # them; each has its own client, which loads the middleware it sees.
+        clients = {}
+        for _ in range(10):
+            for mode, context in modes.items():
+                with context():
+                    client = clients.setdefault(mode, Client())
+
+                    def get():
+                        if clear:
+                            cache.clear()
+                        client.get(url, **headers)
+                    get()
+                    timings[mode].extend(measure(get, 50))
+        timings = {mode: summary(values) for mode, values in timings.items()}
+        overhead = timings["on"]["p50_ms"] - timings["off"]["p50_ms"]
+        results[name] = dict(
+            timings,
+            overhead_p50_ms=round(overhead, 3),
+            overhead_percent=round(100 * overhead / timings["off"]["p50_ms"], 1),
+        )
+    report(results)
+
+
+if __name__ == "__main__":
+    main()
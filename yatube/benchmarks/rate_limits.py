@@ -0,0 +1,85 @@
+"""Cost and accuracy of the token-bucket rate limits.
+
+Reports the SQL statements one check sends to the shared cache (traced on
+its SQLite connection), the latency of allowed and refused checks, and, with
+``--processes`` processes taking tokens from one bucket as fast as they can
+for ``--seconds``, how many requests got through against the ``capacity +
+refill`` the bucket allows::
+
+    python -m benchmarks.rate_limits --processes 8
+"""
+import argparse
+import multiprocessing
+import time
+
+from . import measure, report, setup, summary
+
+
+def hammer(scope, user_id, seconds, allowed):
+    from django.contrib.auth.models import User
+    from django.test import RequestFactory
+
+    from yatube import throttling
+
+    request = RequestFactory().post("/")
+    request.user = User(pk=user_id)
+    taken = 0
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        taken += throttling.take(scope, request) == 0
+    with allowed.get_lock():
+        allowed.value += taken
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--rate", default="100/s")
+    args = parser.parse_args()
+
+    setup()
+    from django.contrib.auth.models import User
+    from django.core.cache import cache
+    from django.test import RequestFactory
+
+    from yatube import throttling
+
+    throttling.LIMITS.update({"open": "1000000/s", "closed": "1/d", "shared": args.rate})
+    user = User.objects.create_user(username="limited", password="12345")
+    request = RequestFactory().post("/")
+    request.user = user
+
+    statements = []
+    connection = cache._connection()
+    connection.set_trace_callback(statements.append)
+    throttling.take("open", request)
+    throttling.take("closed", request)
+    throttling.take("closed", request)
+    connection.set_trace_callback(None)
+    results = {"statements_per_check": len(statements) / 3, "statements": sorted(set(statements))[:1]}
+    results["allowed_check"] = summary(measure(lambda: throttling.take("open", request), 2000))
+    results["refused_check"] = summary(measure(lambda: throttling.take("closed", request), 2000))
+
+    allowed = multiprocessing.Value("i", 0)
+    # Forked workers open their own connections to the cache file.
+    workers = [
+        multiprocessing.Process(target=hammer, args=("shared", user.pk, args.seconds, allowed))
+        for _ in range(args.processes)
+    ]
+    started = time.time()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    rate = throttling.parse_rate(args.rate)
+    results["shared_bucket"] = {
+        "processes": args.processes,
+        "allowed": allowed.value,
+        "bucket_allows": rate.capacity + int((time.time() - started) / rate.interval),
+    }
+    report(results)
+
+
+if __name__ == "__main__":
+    main()
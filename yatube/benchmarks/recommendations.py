@@ -0,0 +1,77 @@
+"""Cost of the "who to follow" batch job, its incremental updates and reads.
+
+Builds a synthetic Follow graph in which a few authors are followed much
+more than others, then reports the time ``rebuild`` takes on one and on
+``--workers`` processes, the time a follow plus an unfollow spends updating
+suggestions, and reading the stored suggestions against counting the other
+followers of a user's authors live::
+
+    python -m benchmarks.recommendations --users 20000 --follows 400000
+"""
+import argparse
+import os
+import random
+import time
+
+from . import measure, report, setup, summary
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--follows", type=int, default=200000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    setup(database_file=True)
+    from django.contrib.auth.models import User
+    from django.db.models import Count
+
+    from posts import recommendations
+    from posts.models import Follow, UserStats
+
+    rng = random.Random(1)
+    User.objects.bulk_create(
+        (User(username=f"member{n}") for n in range(args.users)), batch_size=500,
+    )
+    ids = list(User.objects.order_by("pk").values_list("pk", flat=True))
+    UserStats.objects.bulk_create(
+        (UserStats(user_id=user_id, posts_count=rng.randrange(50)) for user_id in ids), batch_size=500,
+    )
+    pairs = set()
+    while len(pairs) < args.follows:
+        # Pareto-distributed authors: a few of them gather most followers.
+        author = ids[min(int(rng.paretovariate(1.2)) - 1, len(ids) - 1)] if rng.random() < 0.3 else rng.choice(ids)
+        user = rng.choice(ids)
+        if user != author:
+            pairs.add((user, author))
+    Follow.objects.bulk_create((Follow(user_id=user, author_id=author) for user, author in pairs), batch_size=500)
+
+    results = {"users": args.users, "follows": args.follows}
+    for workers in sorted({1, args.workers}):
+        started = time.perf_counter()
+        written = recommendations.rebuild(workers=workers)
+        results[f"rebuild_{workers}_workers_s"] = round(time.perf_counter() - started, 2)
+    results["suggestions_stored"] = written
+
+    samples = rng.sample(sorted(pairs), 50)
+
+    def follow_and_unfollow():
+        user, author = samples.pop()
+        Follow.objects.filter(user=user, author=author).delete()
+        Follow.objects.create(user_id=user, author_id=author)
+
+    results["unfollow_and_follow"] = summary(measure(follow_and_unfollow, repeat=len(samples)))
+    viewer = User.objects.get(pk=ids[len(ids) // 2])
+    results["stored_read"] = summary(measure(lambda: recommendations.for_user(viewer)))
+    following = Follow.objects.filter(user=viewer).values("author")
+    live = (
+        Follow.objects.filter(author__in=following).exclude(user=viewer)
+        .values("user").annotate(shared=Count("author")).order_by("-shared")[:recommendations.TOP_K]
+    )
+    results["live_count"] = summary(measure(lambda: list(live.all()), repeat=20))
+    report(results)
+
+
+if __name__ == "__main__":
+    main()
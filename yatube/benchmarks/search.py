@@ -0,0 +1,78 @@
+"""Search latency over a large synthetic corpus.
+
+Posts are inserted straight into ``posts_post`` so the FTS triggers index
+them as in production. Ranked full-text queries (first page, a deep page
+and a group-filtered page) are compared with the ``LIKE '%...%'`` scan the
+admin used before::
+
+    python -m benchmarks.search --posts 2000000
+"""
+import argparse
+import itertools
+import random
+import time
+
+from . import measure, report, setup, summary
+
+WORDS = [f"слово{index}" for index in range(20000)]
+# Zipf-distributed vocabulary, like natural text.
+CUM_WEIGHTS = list(itertools.accumulate(1 / rank for rank in range(1, len(WORDS) + 1)))
+
+
+def populate(count, author_id, group_ids, batch=20000):
+    from django.db import connection, transaction
+    from django.utils import timezone
+
+    rng = random.Random(42)
+    now = timezone.now()
+    sql = (
+        "INSERT INTO posts_post (text, pub_date, author_id, group_id, image, comment_count, version)"
+        " VALUES (%s, %s, %s, %s, '', 0, 1)"
+    )
+    for start in range(0, count, batch):
+        rows = [
+            (" ".join(rng.choices(WORDS, cum_weights=CUM_WEIGHTS, k=rng.randint(8, 40))), now, author_id, rng.choice(group_ids))
+            for _ in range(min(batch, count - start))
+        ]
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(sql, rows)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--posts", type=int, default=2000000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    setup()
+    from django.contrib.auth.models import User
+
+    from posts import search
+    from posts.models import Group, Post
+
+    user = User.objects.create_user(username="bench", password="12345")
+    groups = [Group.objects.create(title=f"Bench {n}", slug=f"bench-{n}", description="Bench") for n in range(20)]
+    started = time.perf_counter()
+    populate(args.posts, user.pk, [group.pk for group in groups] + [None])
+    indexed_in = time.perf_counter() - started
+
+    results = {"posts": args.posts, "insert_and_index_s": round(indexed_in, 1)}
+    for label, query in (("common_word", WORDS[1]), ("rare_word", WORDS[5000]), ("two_words", f"{WORDS[3]} {WORDS[40]}")):
+        first = search.search(query, 10)
+        deep = first
+        for _ in range(20):
+            if deep.has_next():
+                deep = search.search(query, 10, deep.next_cursor)
+        results[label] = {
+            "fts_first_page": summary(measure(lambda: search.search(query, 10), args.repeat)),
+            "fts_page_21": summary(measure(lambda: search.search(query, 10, deep.next_cursor), args.repeat)),
+            "fts_in_group": summary(measure(lambda: search.search(query, 10, group=groups[0]), args.repeat)),
+            "like_scan": summary(measure(
+                lambda: list(Post.objects.feed().filter(text__icontains=query)[:10]), max(args.repeat // 10, 3)
+            )),
+        }
+    report(results)
+
+
+if __name__ == "__main__":
+    main()
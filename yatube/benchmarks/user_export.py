@@ -0,0 +1,55 @@
+"""Peak memory of the streamed user export for small and large users.
+
+Streams the gzipped export of users with 10 and ``--posts`` posts through
+the test client and reports the bytes sent, the time taken and the peak
+memory allocated while streaming (tracemalloc)::
+
+    python -m benchmarks.user_export --posts 200000
+"""
+import argparse
+import time
+import tracemalloc
+
+from . import report, setup
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--posts", type=int, default=100000)
+    args = parser.parse_args()
+
+    setup()
+    from django.contrib.auth.models import User
+    from django.test import Client
+    from django.urls import reverse
+
+    from posts.models import Post
+
+    results = {}
+    for count in (10, args.posts):
+        user = User.objects.create_user(username=f"exporter{count}", password="12345", is_staff=True)
+        Post.objects.bulk_create(
+            (Post(text=f"Exported post number {n} " * 5, author=user) for n in range(count)), batch_size=500,
+        )
+        client = Client()
+        client.force_login(user)
+        url = reverse("profile_export", args=[user.username])
+        started = time.perf_counter()
+        sent = sum(len(chunk) for chunk in client.get(url, HTTP_ACCEPT_ENCODING="gzip").streaming_content)
+        elapsed = time.perf_counter() - started
+        # tracemalloc slows allocations down, so memory is measured on a second run.
+        tracemalloc.start()
+        for _ in client.get(url, HTTP_ACCEPT_ENCODING="gzip").streaming_content:
+            pass
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        results[f"{count} posts"] = {
+            "gzipped_kb": round(sent / 1024, 1),
+            "seconds": round(elapsed, 2),
+            "peak_memory_kb": round(peak / 1024),
+        }
+    report(results)
+
+
+if __name__ == "__main__":
+    main()
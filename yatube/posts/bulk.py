@@ -0,0 +1,70 @@
+"""Bulk writes of posts for the API.
+
+``bulk_create`` and ``bulk_update`` skip model signals, so the side effects
+the signals have for single posts (counters, timelines, card versions and
+page cache generations) are applied here once per batch.
+"""
+from django.db import transaction
+from django.db.models import F
+
+from . import counters, page_cache, timeline
+from .models import Post
+
+BATCH_SIZE = 500
+
+
+def assign_ids(objects, **filters):
+    """Sets the ids of ``objects`` just saved with ``bulk_create`` in the
+    current transaction, on backends that don't return them; ``filters``
+    narrow down the rows of the model they are among."""
+    if not objects or objects[0].pk is not None:
+        return
+    # SQLite can't return ids from bulk inserts. It holds the write lock until
+    # the transaction commits, so the newest rows are the ones just inserted,
+    # in order.
+    model = type(objects[0])
+    ids = model.objects.filter(**filters).order_by("-id").values_list("id", flat=True)[:len(objects)]
+    for instance, pk in zip(objects, reversed(list(ids))):
+        instance.pk = pk
+
+
+def _namespaces(author, groups):
+    namespaces = {page_cache.GLOBAL, page_cache.author_namespace(author.username)}
+    namespaces.update(page_cache.group_namespace(group.slug) for group in groups if group is not None)
+    return namespaces
+
+
+@transaction.atomic
+def create_posts(author, items):
+    """Creates posts of ``author`` from validated serializer data, in one
+    transaction. Returns the saved posts."""
+    posts = [Post(author=author, **data) for data in items]
+    if not posts:
+        return posts
+    Post.objects.bulk_create(posts, batch_size=BATCH_SIZE)
+    assign_ids(posts, author=author)
+    counters.bump_user(author.pk, posts_count=len(posts))
+    timeline.fan_out_many(author.pk, posts)
+    page_cache.bump(*_namespaces(author, {post.group for post in posts}))
+    return posts
+
+
+@transaction.atomic
+def update_posts(author, changes):
+    """Applies ``(post, validated_data)`` pairs to posts of ``author`` with
+    one UPDATE per batch. Returns the updated posts."""
+    posts, fields, groups = [], {"version"}, set()
+    for post, data in changes:
+        groups.add(post.group)
+        for field, value in data.items():
+            setattr(post, field, value)
+        fields.update(data)
+        groups.add(post.group)
+        # The card cache is keyed on the version, see cards.py.
+        post.version = F("version") + 1
+        posts.append(post)
+    if not posts:
+        return posts
+    Post.objects.bulk_update(posts, sorted(fields), batch_size=BATCH_SIZE)
+    page_cache.bump(*_namespaces(author, groups))
+    return posts
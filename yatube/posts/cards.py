@@ -0,0 +1,56 @@
+"""Fragment cache for rendered ``post_item.html`` cards.
+
+A card is cached under the post id and ``Post.version``; the version is bumped
+whenever anything shown on the card changes (edits, image changes, comments),
+so stale cards are never looked up again and simply expire.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import get_template
+
+from yatube import metrics
+
+CARD_TEMPLATE = "post_item.html"
+CARD_TIMEOUT = getattr(settings, "POST_CARD_CACHE_TIMEOUT", 60 * 60 * 24)
+
+
+LOOKUPS = metrics.Counter("yatube_post_card_cache_lookups", "Post card cache lookups.", ["result"])
+
+
+class CardCacheStats:
+    """Hit/miss counters of the card cache, kept in ``yatube.metrics``."""
+
+    def record(self, hits, misses):
+        if hits:
+            LOOKUPS.inc("hit", amount=hits)
+        if misses:
+            LOOKUPS.inc("miss", amount=misses)
+
+    def snapshot(self):
+        """Totals over all worker processes."""
+        return {"hits": int(LOOKUPS.value("hit")), "misses": int(LOOKUPS.value("miss"))}
+
+
+stats = CardCacheStats()
+
+
+def card_key(post, is_author):
+    return f"post_card:{post.pk}:{post.version}:{int(is_author)}"
+
+
+def render_cards(posts, user):
+    """Returns the rendered cards of ``posts``, rendering only those missing
+    from the cache. Cached cards are fetched with a single ``get_many``."""
+    keys = [card_key(post, user == post.author) for post in posts]
+    cached = cache.get_many(keys)
+    missing = {}
+    template = get_template(CARD_TEMPLATE)
+    cards = []
+    for key, post in zip(keys, posts):
+        if key not in cached:
+            missing[key] = template.render({"post": post, "user": user})
+        cards.append(cached[key] if key in cached else missing[key])
+    if missing:
+        cache.set_many(missing, CARD_TIMEOUT)
+    stats.record(len(keys) - len(missing), len(missing))
+    return cards
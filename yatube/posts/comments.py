@@ -0,0 +1,76 @@
+"""Comment threads, newest first, in pages keyed on ``(created, id)``.
+
+Pages hold comments as ``as_dict`` rows with their author's username and are
+cached. Comments are only ever added at the head of a thread, so a page
+reached with a forward cursor never changes when one is added: a new comment
+invalidates the first page (and pages walked back towards it) only, while
+deleting or editing one invalidates the whole thread.
+"""
+from contextlib import nullcontext
+
+from django.conf import settings
+from django.core.cache import cache
+
+from yatube.databases import may_be_stale, replica_reads
+
+from . import page_cache
+from .models import Comment
+from .pagination import CursorPaginator
+
+PER_PAGE = getattr(settings, "COMMENTS_PER_PAGE", 20)
+KEYS = ("created", "id")
+
+
+def thread_namespace(post_id):
+    return f"comments:{post_id}"
+
+
+def head_namespace(post_id):
+    return f"comments_head:{post_id}"
+
+
+FIELDS = ("id", "author__username", "text", "created")
+
+
+def paginator(post_id):
+    return CursorPaginator(Comment.objects.filter(post_id=post_id).values(*FIELDS), PER_PAGE, keys=KEYS)
+
+
+def get_page(post_id, cursor=None):
+    """Returns the page of the thread following ``cursor`` (the newest
+    comments for none or a malformed one)."""
+    thread = paginator(post_id)
+    decoded = thread.decode_cursor(cursor) if cursor else None
+    namespaces = [thread_namespace(post_id)]
+    if decoded is None or decoded[1]:
+        namespaces.append(head_namespace(post_id))
+        if decoded is None:
+            cursor = ""
+    current, bumped = page_cache.snapshot(namespaces)
+    key = f"comment_page:{post_id}:{cursor}:{'.'.join(map(str, current))}"
+    page = cache.get(key)
+    if page is None:
+        # As in cache_by_generation: a lagging replica may miss the comment
+        # behind the last bump, which the page would keep.
+        with replica_reads(False) if may_be_stale(bumped) else nullcontext():
+            page = thread.get_page(cursor)
+            page.object_list = [as_dict(row) for row in page]
+        cache.set(key, page, page_cache.PAGE_TIMEOUT)
+    return page
+
+
+def added(comment):
+    page_cache.bump(head_namespace(comment.post_id))
+
+
+def changed(comment):
+    page_cache.bump(thread_namespace(comment.post_id))
+
+
+def as_dict(row):
+    return {
+        "id": row["id"],
+        "author": row["author__username"],
+        "text": row["text"],
+        "created": row["created"],
+    }
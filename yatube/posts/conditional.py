@@ -0,0 +1,90 @@
+"""Conditional GET for feeds, posts and the posts API.
+
+Validators are computed without rendering: the page-cache generations of the
+requested scope (bumped by every signalled write) plus one indexed query for
+the newest post and the stored counters, which also catches bulk writes that
+skip signals. Matching ``If-None-Match``/``If-Modified-Since`` requests get
+a 304 before the view runs.
+"""
+import hashlib
+from calendar import timegm
+from functools import wraps
+
+from django.contrib.auth import get_user_model
+from django.db.models import OuterRef, Subquery
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from yatube.databases import may_be_stale
+
+from . import page_cache
+from .models import Post
+
+User = get_user_model()
+
+
+def _latest(posts):
+    return posts.order_by("-pub_date", "-id").values_list("pub_date", "id").first()
+
+
+def index_scope(request):
+    return [page_cache.GLOBAL], _latest(Post.objects.all())
+
+
+def group_scope(request, slug):
+    return [page_cache.group_namespace(slug)], _latest(Post.objects.filter(group__slug=slug))
+
+
+def profile_scope(request, username):
+    latest = Post.objects.filter(author=OuterRef("pk")).order_by("-pub_date", "-id")
+    row = User.objects.filter(username=username).values_list(
+        "stats__posts_count", "stats__followers_count", "stats__following_count",
+        Subquery(latest.values("pub_date")), Subquery(latest.values("id")),
+    ).first()
+    return [page_cache.author_namespace(username)], row
+
+
+def post_scope(request, username, post_id):
+    row = Post.objects.filter(pk=post_id).values_list(
+        "pub_date", "version", "comment_count",
+        "author__stats__posts_count", "author__stats__followers_count", "author__stats__following_count",
+    ).first()
+    return [page_cache.author_namespace(username)], row
+
+
+def validators(request, namespaces, row):
+    """Returns (etag, last_modified) for a response showing ``row`` within ``namespaces``."""
+    gens, bumped = page_cache.snapshot(namespaces)
+    dates = [value for value in row or () if hasattr(value, "utctimetuple")]
+    last_modified = max([bumped] + [timegm(date.utctimetuple()) for date in dates])
+    # Pages differ per user and per representation, so both are part of the tag.
+    fingerprint = "|".join(map(str, (
+        gens, row, request.user.pk, request.get_full_path(), request.META.get("HTTP_ACCEPT", ""),
+    )))
+    return f'"{hashlib.md5(fingerprint.encode()).hexdigest()}"', last_modified
+
+
+def conditional(scope):
+    """Answers GET/HEAD requests with 304 when the client's copy of the page
+    is still current; ``scope(request, *args, **kwargs)`` returns the page's
+    namespaces and the row of values it depends on."""
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return view(request, *args, **kwargs)
+            etag, last_modified = validators(request, *scope(request, *args, **kwargs))
+            if may_be_stale(last_modified):
+                # Validators of a page read from a lagging replica could
+                # outlive the stale content; the client revalidates later.
+                return view(request, *args, **kwargs)
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = view(request, *args, **kwargs)
+            if response.status_code in (200, 304):
+                response["ETag"] = etag
+                response["Last-Modified"] = http_date(last_modified)
+                patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapped
+    return decorator
@@ -0,0 +1,76 @@
+"""Denormalized counters.
+
+``Post.comment_count`` and the ``UserStats`` counters are changed with
+F-expressions from the create/delete signals of ``Post``, ``Comment`` and
+``Follow``. Bulk writes bypass signals; ``reconcile`` recomputes everything
+from the source tables (``manage.py reconcile_counters``).
+"""
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Comment, Follow, Post, UserStats
+
+User = get_user_model()
+
+
+def bump_user(user_id, **deltas):
+    """Atomically adds ``deltas`` to the user's stats, creating the row for
+    increments. Decrements without a row are skipped (they come from deletes
+    cascading from the user, or from rows ``reconcile`` will repair)."""
+    updates = {field: F(field) + delta for field, delta in deltas.items()}
+    if not UserStats.objects.filter(user_id=user_id).update(**updates):
+        if any(delta < 0 for delta in deltas.values()):
+            return
+        UserStats.objects.get_or_create(user_id=user_id)
+        UserStats.objects.filter(user_id=user_id).update(**updates)
+
+
+def bump_post(post_id, delta):
+    # The comment count is shown on the post card, so its version goes up too.
+    Post.objects.filter(pk=post_id).update(
+        comment_count=F("comment_count") + delta, version=F("version") + 1
+    )
+
+
+def _count(queryset, field):
+    """Correlated subquery counting rows of ``queryset`` whose ``field`` is the outer pk."""
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{field: OuterRef("pk")}).order_by()
+            .values(field).annotate(total=Count("pk")).values("total"),
+            output_field=IntegerField(),
+        ),
+        0,
+    )
+
+
+USER_COUNTERS = {
+    "posts_count": (Post.objects.all(), "author"),
+    "followers_count": (Follow.objects.all(), "author"),
+    "following_count": (Follow.objects.all(), "user"),
+}
+
+
+def reconcile():
+    """Recomputes every counter in bulk. Returns the number of drifted rows per counter."""
+    existing = UserStats.objects.values("user")
+    UserStats.objects.bulk_create(
+        (UserStats(user_id=pk) for pk in User.objects.exclude(pk__in=existing).values_list("pk", flat=True)),
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+
+    drift = {}
+    actual_comments = _count(Comment.objects.all(), "post")
+    # Only drifted posts get a new version; the others keep their cached cards.
+    drift["comment_count"] = Post.objects.annotate(actual=actual_comments).exclude(
+        comment_count=F("actual")
+    ).update(comment_count=F("actual"), version=F("version") + 1)
+
+    for counter, (queryset, field) in USER_COUNTERS.items():
+        actual = _count(queryset, field)
+        # Subqueries correlate on UserStats.pk, which is the user id.
+        drift[counter] = UserStats.objects.annotate(actual=actual).exclude(**{counter: F("actual")}).count()
+        UserStats.objects.update(**{counter: actual})
+    return drift
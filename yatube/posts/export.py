@@ -0,0 +1,95 @@
+"""Streaming NDJSON export of a user's data.
+
+``records(user)`` yields the user, the groups they posted in, their posts,
+their comments and the authors they follow, in the record format of
+``posts.importer``. The user, groups and posts import back as they are, but
+comments on other users' posts and follows refer to posts and users that
+are not in the file: ``import_yatube`` stops at the first of them ("unknown
+post"), so drop those records before importing an export. Rows are read
+in keyset batches of ``BATCH_SIZE`` (one query each, never an OFFSET) and
+``ndjson`` joins the lines into chunks of about ``CHUNK_BYTES``, so memory
+use is the same for ten posts or a million.
+"""
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Comment, Follow, Group, Post
+
+BATCH_SIZE = getattr(settings, "EXPORT_BATCH_SIZE", 1000)
+CHUNK_BYTES = 64 * 1024
+CONTENT_TYPE = "application/x-ndjson; charset=utf-8"
+
+
+def keyset(queryset, fields, size=None):
+    """Yields ``values("id", *fields)`` of ``queryset`` in id order, one
+    query per ``size`` rows."""
+    size = size or BATCH_SIZE
+    queryset = queryset.order_by("id").values("id", *fields)
+    last = None
+    while True:
+        batch = queryset if last is None else queryset.filter(id__gt=last)
+        rows = 0
+        for row in batch[:size].iterator(chunk_size=size):
+            rows += 1
+            last = row["id"]
+            yield row
+        if rows < size:
+            return
+
+
+def records(user):
+    author = str(user.pk)
+    yield {
+        "type": "user",
+        "id": author,
+        "username": user.username,
+        "first_name": user.first_name,
+        "last_name": user.last_name,
+        "email": user.email,
+        "date_joined": user.date_joined,
+    }
+    for group in keyset(Group.objects.filter(post__author=user).distinct(), ("slug", "title", "description")):
+        yield {"type": "group", **group, "id": str(group["id"])}
+    for post in keyset(Post.objects.filter(author=user), ("group", "text", "pub_date", "image")):
+        yield {
+            "type": "post",
+            "id": str(post["id"]),
+            "author": author,
+            "group": str(post["group"]) if post["group"] else None,
+            "text": post["text"],
+            "pub_date": post["pub_date"],
+            "image": post["image"] or None,
+        }
+    for comment in keyset(Comment.objects.filter(author=user), ("post", "text", "created")):
+        yield {
+            "type": "comment",
+            "id": str(comment["id"]),
+            "post": str(comment["post"]),
+            "author": author,
+            "text": comment["text"],
+            "created": comment["created"],
+        }
+    for follow in keyset(Follow.objects.filter(user=user), ("author", "author__username", "followed")):
+        yield {
+            "type": "follow",
+            "user": author,
+            "author": str(follow["author"]),
+            "author_username": follow["author__username"],
+            "followed": follow["followed"],
+        }
+
+
+def ndjson(records):
+    """Encodes records as NDJSON, yielding chunks of about ``CHUNK_BYTES``."""
+    chunk, size = [], 0
+    for record in records:
+        line = json.dumps(record, cls=DjangoJSONEncoder, ensure_ascii=False).encode() + b"\n"
+        chunk.append(line)
+        size += len(line)
+        if size >= CHUNK_BYTES:
+            yield b"".join(chunk)
+            chunk, size = [], 0
+    if chunk:
+        yield b"".join(chunk)
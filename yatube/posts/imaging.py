@@ -0,0 +1,52 @@
+"""Image processing run in worker processes.
+
+Nothing here touches Django, so workers can be spawned without setting the
+project up; callers pass plain file paths in and get plain paths back.
+"""
+import os
+
+from PIL import Image, ImageOps
+
+
+def _save_atomically(image, path, image_format, **options):
+    # Readers check for the file's existence, so it must never be seen half-written.
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f"{path}.{os.getpid()}.tmp"
+    image.save(temporary, image_format, **options)
+    os.replace(temporary, path)
+
+
+def render_renditions(source, targets):
+    """Crops ``source`` to the centre and scales it (up if needed) to every
+    ``(path, width, height, format)`` in ``targets``. Returns the written paths."""
+    written = []
+    with Image.open(source) as original:
+        image = ImageOps.exif_transpose(original)
+        for path, width, height, image_format in targets:
+            rendition = ImageOps.fit(image, (width, height), Image.LANCZOS, centering=(0.5, 0.5))
+            if rendition.mode not in ("RGB", "L"):
+                rendition = rendition.convert("RGB")
+            _save_atomically(rendition, path, image_format, quality=85, optimize=True)
+            written.append(path)
+    return written
+
+
+def normalize_original(path, max_side):
+    """Caps an uploaded original at ``max_side`` pixels and drops its
+    metadata by re-encoding it in place. Returns whether it was rewritten."""
+    with Image.open(path) as original:
+        image_format = original.format
+        if max(original.size) <= max_side and not original.getexif() and "exif" not in original.info:
+            return False
+        image = ImageOps.exif_transpose(original)
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+        if image_format == "JPEG" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        _save_atomically(image, path, image_format, quality=85, optimize=True)
+    return True
+
+
+def process_upload(source, max_side, targets):
+    """Normalizes a new original, then renders its renditions."""
+    normalize_original(source, max_side)
+    return render_renditions(source, targets)
@@ -0,0 +1,376 @@
+"""Streaming import of users, groups, posts, comments and follows.
+
+Input is NDJSON, one record per line, or CSV with a header row. Each record
+has a ``type`` (or the importer is given one for all of them)::
+
+    {"type": "user", "id": "17", "username": "leo", "first_name": "Leo"}
+    {"type": "group", "id": "3", "slug": "cats", "title": "Cats"}
+    {"type": "post", "id": "9", "author": "17", "group": "3", "text": "...", "pub_date": "2019-05-01T10:00:00Z"}
+    {"type": "comment", "post": "9", "author": "17", "text": "...", "created": "2019-05-02T08:00:00Z"}
+    {"type": "follow", "user": "17", "author": "18"}
+
+Records refer to each other by their ids in the source, which are shared by
+all imports, so a community may come in several files. Users and groups
+with a username or slug that already exists are merged into it. Users and
+groups are resolved through a map held in memory; posts, which are too many
+for that, through ``ImportedId`` rows with one query per chunk. A record may
+only refer to records before it or in the same chunk.
+
+Records are read and written ``CHUNK_SIZE`` at a time, every chunk in a
+transaction that also saves the byte offset reached in ``ImportProgress``.
+Memory use is bounded by the chunk size, and an import that stopped half-way
+resumes after its last committed chunk.
+
+Rows are written with ``bulk_create``, so model signals don't run: the
+search index, counters, timelines and cached pages are rebuilt once by
+``finish()``.
+"""
+import csv
+import json
+from collections import ChainMap
+from contextlib import contextmanager
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import comments, counters, page_cache, search, timeline
+from .bulk import assign_ids
+from .models import Comment, Follow, Group, ImportedId, ImportProgress, Post, User
+
+KINDS = ("user", "group", "post", "comment", "follow")
+CHUNK_SIZE = 5000
+BATCH_SIZE = 500
+
+
+class InvalidRecord(ValueError):
+    def __init__(self, line, message):
+        super().__init__(f"Line {line}: {message}")
+        self.line = line
+
+
+def _batches(items, size=BATCH_SIZE):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def read_ndjson(file, position=0, line=0):
+    """Yields ``(record, line, position)`` for the records of a binary NDJSON
+    file from byte ``position`` on, ``position`` being the end of the record."""
+    file.seek(position)
+    for raw in file:
+        position += len(raw)
+        line += 1
+        if not raw.strip():
+            continue
+        try:
+            record = json.loads(raw)
+        except ValueError as error:
+            raise InvalidRecord(line, f"invalid JSON ({error}).")
+        if not isinstance(record, dict):
+            raise InvalidRecord(line, "a record must be an object.")
+        yield record, line, position
+
+
+def read_csv(file, position=0, line=0):
+    """Like ``read_ndjson`` for a binary CSV file with a header row. Empty
+    cells are left out of the records."""
+    file.seek(0)
+    first = file.readline()
+    header = next(csv.reader([first.decode("utf-8-sig")]), None)
+    if not header:
+        return
+    if position < len(first):
+        position, line = len(first), 1
+    file.seek(position)
+    consumed = {"position": position, "line": line}
+
+    def lines():
+        # A quoted cell may span lines, so positions are taken from the
+        # lines the reader actually consumed.
+        for raw in file:
+            consumed["position"] += len(raw)
+            consumed["line"] += 1
+            try:
+                yield raw.decode("utf-8")
+            except UnicodeDecodeError as error:
+                raise InvalidRecord(consumed["line"], f"invalid UTF-8 ({error}).")
+
+    for row in csv.reader(lines()):
+        if not any(row):
+            continue
+        if len(row) != len(header):
+            raise InvalidRecord(consumed["line"], f"expected {len(header)} cells, got {len(row)}.")
+        record = {name: value for name, value in zip(header, row) if value != ""}
+        yield record, consumed["line"], consumed["position"]
+
+
+READERS = {"ndjson": read_ndjson, "csv": read_csv}
+
+
+@contextmanager
+def fast_sqlite():
+    """Trades durability for speed while importing into SQLite.
+
+    With ``synchronous=OFF`` a crash of the process loses nothing, the OS
+    still writes its buffers out; a power failure may lose the last chunks,
+    which a resumed import writes again. The search index triggers are
+    dropped while it lasts and recreated however the import ends, so posts
+    written afterwards are indexed; ``finish()`` indexes the imported ones.
+    """
+    if connection.vendor != "sqlite":
+        yield
+        return
+    # SQLite refuses to change the safety level and temporary storage
+    # inside a transaction (e.g. of a test).
+    in_transaction = connection.in_atomic_block
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA synchronous")
+        synchronous = cursor.fetchone()[0]
+        cursor.execute("PRAGMA cache_size")
+        cache_size = cursor.fetchone()[0]
+        if not in_transaction:
+            cursor.execute("PRAGMA synchronous = OFF")
+            cursor.execute("PRAGMA temp_store = MEMORY")
+        cursor.execute("PRAGMA cache_size = -65536")
+        search.uninstall_triggers(cursor)
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            if not in_transaction:
+                cursor.execute(f"PRAGMA synchronous = {int(synchronous)}")
+                cursor.execute("PRAGMA temp_store = DEFAULT")
+            cursor.execute(f"PRAGMA cache_size = {int(cache_size)}")
+            if search.is_supported():
+                search.install(cursor)
+
+
+@contextmanager
+def explicit_dates():
+    """Keeps the dates given to new rows instead of the insert time that
+    ``auto_now_add`` puts there. Affects the whole process while it lasts."""
+    fields = [
+        Post._meta.get_field("pub_date"),
+        Comment._meta.get_field("created"),
+        Follow._meta.get_field("followed"),
+    ]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def _required(record, field, line):
+    value = record.get(field)
+    if value is None or value == "":
+        raise InvalidRecord(line, f"{record.get('type', 'record')} without {field}.")
+    return value
+
+
+def _date(record, field, line):
+    value = record.get(field)
+    if not value:
+        return timezone.now()
+    try:
+        date = parse_datetime(str(value))
+    except ValueError:
+        date = None
+    if date is None:
+        raise InvalidRecord(line, f"{field} is not an ISO 8601 date and time.")
+    if timezone.is_naive(date):
+        date = timezone.make_aware(date)
+    return date
+
+
+class Importer:
+    """Imports records from ``(record, line, position)`` tuples, see ``read_ndjson``."""
+
+    def __init__(self, source, chunk_size=CHUNK_SIZE, default_type=None):
+        self.progress, _ = ImportProgress.objects.get_or_create(source=source)
+        self.chunk_size = chunk_size
+        self.default_type = default_type
+        self.counts = dict.fromkeys(KINDS, 0)
+        self.last_post_id = Post.objects.order_by("-id").values_list("id", flat=True).first() or 0
+        self.ids = {
+            kind: dict(ImportedId.objects.filter(kind=kind).values_list("external_id", "local_id"))
+            for kind in ("user", "group")
+        }
+
+    def restart(self):
+        """Starts the source over. Refused once rows of it are committed,
+        which a second pass would write again."""
+        if self.progress.line:
+            raise ValueError(
+                f"Records up to line {self.progress.line} of {self.progress.source} are already imported."
+            )
+        self.progress.position, self.progress.line, self.progress.finished = 0, 0, False
+        self.progress.save()
+
+    def run(self, records):
+        chunk, line, position = [], self.progress.line, self.progress.position
+        for record, line, position in records:
+            chunk.append((line, record))
+            if len(chunk) >= self.chunk_size:
+                self.write_chunk(chunk, line, position)
+                chunk = []
+        self.write_chunk(chunk, line, position)
+
+    def write_chunk(self, chunk, line, position):
+        by_kind = {kind: [] for kind in KINDS}
+        for record_line, record in chunk:
+            kind = record.get("type") or self.default_type
+            if kind not in by_kind:
+                raise InvalidRecord(record_line, f"unknown record type {kind!r}.")
+            by_kind[kind].append((record_line, record))
+        # Ids are kept in memory once their rows are committed.
+        ids = {kind: ChainMap({}, self.ids.get(kind, {})) for kind in ("user", "group", "post")}
+        with transaction.atomic():
+            self.write_users(by_kind["user"], ids)
+            self.write_groups(by_kind["group"], ids)
+            self.write_posts(by_kind["post"], ids)
+            self.write_comments(by_kind["comment"], ids)
+            self.write_follows(by_kind["follow"], ids)
+            ImportProgress.objects.filter(pk=self.progress.pk).update(position=position, line=line)
+        for kind in ("user", "group"):
+            self.ids[kind].update(ids[kind].maps[0])
+        for kind, records in by_kind.items():
+            self.counts[kind] += len(records)
+        self.progress.position, self.progress.line = position, line
+
+    def _resolve(self, ids, kind, record, field, line, required=True):
+        value = record.get(field)
+        if value is None or value == "":
+            if required:
+                raise InvalidRecord(line, f"{record.get('type', 'record')} without {field}.")
+            return None
+        try:
+            return ids[kind][str(value)]
+        except KeyError:
+            raise InvalidRecord(line, f"unknown {kind} {value!r} in {field}.")
+
+    def _remember(self, ids, kind, external_to_local):
+        ids[kind].maps[0].update(external_to_local)
+        ImportedId.objects.bulk_create(
+            (ImportedId(kind=kind, external_id=external, local_id=local) for external, local in external_to_local.items()),
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+
+    def _merge(self, ids, kind, model, field, records, build):
+        """Creates the rows of ``records`` whose ``field`` value isn't taken yet
+        and maps every record's id to its row."""
+        by_external = {}
+        for line, record in records:
+            value = str(_required(record, field, line))
+            by_external[str(record.get("id", value))] = (value, line, record)
+        values = {value for value, _, _ in by_external.values()}
+        existing = set()
+        for batch in _batches(values):
+            existing.update(model.objects.filter(**{f"{field}__in": batch}).values_list(field, flat=True))
+        new = {}
+        for value, line, record in by_external.values():
+            if value not in existing and value not in new:
+                new[value] = build(value, record, line)
+        model.objects.bulk_create(new.values(), batch_size=BATCH_SIZE)
+        local = {}
+        for batch in _batches(values):
+            local.update(model.objects.filter(**{f"{field}__in": batch}).values_list(field, "id"))
+        self._remember(ids, kind, {external: local[value] for external, (value, _, _) in by_external.items()})
+
+    def write_users(self, records, ids):
+        def build(username, record, line):
+            return User(
+                username=username,
+                first_name=record.get("first_name", ""),
+                last_name=record.get("last_name", ""),
+                email=record.get("email", ""),
+                password=make_password(None),
+                date_joined=_date(record, "date_joined", line),
+            )
+        self._merge(ids, "user", User, "username", records, build)
+
+    def write_groups(self, records, ids):
+        def build(slug, record, line):
+            return Group(
+                slug=slug,
+                title=_required(record, "title", line),
+                description=record.get("description", ""),
+            )
+        self._merge(ids, "group", Group, "slug", records, build)
+
+    def write_posts(self, records, ids):
+        posts, externals = [], []
+        for line, record in records:
+            posts.append(Post(
+                author_id=self._resolve(ids, "user", record, "author", line),
+                group_id=self._resolve(ids, "group", record, "group", line, required=False),
+                text=_required(record, "text", line),
+                pub_date=_date(record, "pub_date", line),
+                image=record.get("image") or None,
+            ))
+            externals.append(record.get("id"))
+        if not posts:
+            return
+        Post.objects.bulk_create(posts, batch_size=BATCH_SIZE)
+        assign_ids(posts)
+        self._remember(ids, "post", {
+            str(external): post.pk for external, post in zip(externals, posts) if external is not None
+        })
+
+    def write_comments(self, records, ids):
+        wanted = {str(record["post"]) for _, record in records if record.get("post")} - set(ids["post"])
+        for batch in _batches(wanted):
+            ids["post"].maps[0].update(
+                ImportedId.objects.filter(kind="post", external_id__in=batch).values_list("external_id", "local_id")
+            )
+        rows = [
+            Comment(
+                post_id=self._resolve(ids, "post", record, "post", line),
+                author_id=self._resolve(ids, "user", record, "author", line),
+                text=_required(record, "text", line),
+                created=_date(record, "created", line),
+            )
+            for line, record in records
+        ]
+        Comment.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+        # Threads of posts that existed before this run may be cached.
+        page_cache.bump(*{
+            comments.head_namespace(comment.post_id) for comment in rows if comment.post_id <= self.last_post_id
+        })
+
+    def write_follows(self, records, ids):
+        rows = []
+        for line, record in records:
+            user = self._resolve(ids, "user", record, "user", line)
+            author = self._resolve(ids, "user", record, "author", line)
+            if user != author:
+                rows.append(Follow(user_id=user, author_id=author, followed=_date(record, "followed", line)))
+        Follow.objects.bulk_create(rows, batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+    def finish(self, rebuild=True):
+        """Marks the import finished and brings everything derived from the
+        imported rows up to date, unless ``rebuild`` is false."""
+        self.progress.finished = True
+        self.progress.save(update_fields=["finished"])
+        if not rebuild:
+            return
+        if search.is_supported():
+            search.rebuild()
+        counters.reconcile()
+        # Feeds stay whole while their entries are replaced, and if that fails.
+        with transaction.atomic():
+            timeline.rebuild()
+        namespaces = {page_cache.GLOBAL}
+        namespaces.update(page_cache.group_namespace(slug) for slug in Group.objects.values_list("slug", flat=True))
+        for batch in _batches(self.ids["user"].values()):
+            namespaces.update(
+                page_cache.author_namespace(username)
+                for username in User.objects.filter(pk__in=batch).values_list("username", flat=True)
+            )
+        page_cache.bump(*namespaces)
@@ -0,0 +1,266 @@
+import itertools
+import json
+import math
+import os
+import random
+import re
+import tempfile
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import URLPattern, reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from posts import counters, timeline, urls
+from posts.models import Comment, Follow, Group, Post
+from yatube.databases import REPLICA
+
+User = get_user_model()
+
+WORDS = [f"слово{index}" for index in range(5000)]
+SERVER_TIMING_QUERIES = re.compile(r'db;[^,]*desc="(\d+) queries"')
+
+
+def zipf(count, exponent=1.1):
+    """Cumulative Zipf weights for ``count`` ranks."""
+    return list(itertools.accumulate(1 / rank ** exponent for rank in range(1, count + 1)))
+
+
+def seed_dataset(users=200, groups=10, posts=5000, follows=20, comments=2, seed=1):
+    """Creates a reproducible site: post authorship and followed authors are
+    Zipf-distributed, posts are spread over the last 90 days. Returns the
+    sizes of the dataset."""
+    rng = random.Random(seed)
+    password = make_password("bench")
+    with transaction.atomic():
+        User.objects.bulk_create(
+            (User(username=f"user{n}", password=password) for n in range(users)), batch_size=500,
+        )
+        user_ids = list(User.objects.order_by("pk").values_list("pk", flat=True))
+        Group.objects.bulk_create(
+            Group(title=f"Group {n}", slug=f"group-{n}", description=f"Group number {n}") for n in range(groups)
+        )
+        group_ids = list(Group.objects.values_list("pk", flat=True)) + [None]
+
+        weights = zipf(len(user_ids))
+        word_weights = zipf(len(WORDS))
+        Post.objects.bulk_create((
+            Post(
+                text=" ".join(rng.choices(WORDS, cum_weights=word_weights, k=rng.randint(8, 60))),
+                author_id=author_id,
+                group_id=rng.choice(group_ids),
+            )
+            for author_id in rng.choices(user_ids, cum_weights=weights, k=posts)
+        ), batch_size=500)
+        # pub_date is set on insert, so the history is written afterwards.
+        created = list(Post.objects.order_by("pk").only("pk"))
+        start = timezone.now() - timedelta(days=90)
+        step = timedelta(days=90) / max(len(created), 1)
+        for n, post in enumerate(created):
+            post.pub_date = start + step * n
+        Post.objects.bulk_update(created, ["pub_date"], batch_size=500)
+
+        pairs = set()
+        for user_id in user_ids:
+            for author_id in rng.choices(user_ids, cum_weights=weights, k=follows):
+                if author_id != user_id:
+                    pairs.add((user_id, author_id))
+        Follow.objects.bulk_create(
+            (Follow(user_id=user_id, author_id=author_id) for user_id, author_id in sorted(pairs)), batch_size=500,
+        )
+        Comment.objects.bulk_create((
+            Comment(post_id=post.pk, author_id=rng.choice(user_ids), text=" ".join(rng.choices(WORDS, k=8)))
+            for post in created
+            for _ in range(rng.randint(0, 2 * comments))
+        ), batch_size=500)
+    counters.reconcile()
+    timeline.rebuild()
+    return {
+        "users": len(user_ids),
+        "groups": len(group_ids) - 1,
+        "posts": len(created),
+        "follows": len(pairs),
+        "comments": Comment.objects.count(),
+        "seed": seed,
+    }
+
+
+def bench_requests(reader):
+    """Returns the (name, method, url, headers) requests to time, one or more
+    per named route of ``posts/urls.py`` plus the API, viewed by ``reader``.
+
+    Views that write on POST are timed with GET (their form or redirect).
+    Following and unfollowing write on GET and run one after the other, so
+    every round leaves the data as it found it."""
+    followed = reader.follower.select_related("author").order_by("pk").first().author
+    stranger = User.objects.exclude(pk=reader.pk).exclude(following__user=reader).order_by("-pk").first()
+    post = Post.objects.filter(author=followed).order_by("-pub_date", "-id").first()
+    own = Post.objects.create(text="Bench post", author=reader)
+    group = Group.objects.order_by("pk").first()
+    word = WORDS[1]
+    api = {"HTTP_AUTHORIZATION": f"Token {Token.objects.get_or_create(user=reader)[0].key}"}
+    return [
+        ("index", "GET", reverse("index"), {}),
+        ("group", "GET", reverse("group", args=[group.slug]), {}),
+        ("new_post", "GET", reverse("new_post"), {}),
+        ("follow_index", "GET", reverse("follow_index"), {}),
+        ("follow_suggestions", "GET", reverse("follow_suggestions"), {}),
+        ("cache_stats", "GET", reverse("cache_stats"), {}),
+        ("search", "GET", f"{reverse('search')}?q={word}", {}),
+        ("profile", "GET", reverse("profile", args=[followed.username]), {}),
+        ("profile_export", "GET", reverse("profile_export", args=[reader.username]), {}),
+        ("post", "GET", reverse("post", args=[followed.username, post.pk]), {}),
+        ("post_edit", "GET", reverse("post_edit", args=[reader.username, own.pk]), {}),
+        ("post_comments", "GET", reverse("post_comments", args=[followed.username, post.pk]), {}),
+        ("add_comment", "GET", reverse("add_comment", args=[followed.username, post.pk]), {}),
+        ("profile_follow", "GET", reverse("profile_follow", args=[stranger.username]), {}),
+        ("profile_unfollow", "GET", reverse("profile_unfollow", args=[stranger.username]), {}),
+        ("api posts", "GET", "/api/posts/", api),
+        ("api posts expanded", "GET", "/api/posts/?fields=id,text,pub_date,author&expand=author", api),
+        ("api post", "GET", f"/api/posts/{post.pk}/", api),
+        ("api search", "GET", f"/api/search/?q={word}", api),
+    ]
+
+
+def query_count(response):
+    """Queries of the request on every thread, from its Server-Timing header
+    (see yatube/profiling.py)."""
+    return int(SERVER_TIMING_QUERIES.search(response["Server-Timing"]).group(1))
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of sorted values."""
+    return ordered[max(math.ceil(len(ordered) * fraction) - 1, 0)]
+
+
+def compare(results, baseline, tolerance, slack_ms=1.0):
+    """Returns the regressions of ``results`` against ``baseline``: a p95 more
+    than ``tolerance`` (and ``slack_ms``) slower, or any extra query."""
+    regressions = []
+    for name, current in results["views"].items():
+        previous = baseline.get("views", {}).get(name)
+        if previous is None:
+            continue
+        limit = previous["p95_ms"] * (1 + tolerance) + slack_ms
+        if current["p95_ms"] > limit:
+            regressions.append(f"{name}: p95 {current['p95_ms']} ms, baseline {previous['p95_ms']} ms")
+        if current["queries"] > previous["queries"]:
+            regressions.append(f"{name}: {current['queries']} queries, baseline {previous['queries']}")
+    return regressions
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds a synthetic dataset on a scratch database, times every view of "
+        "posts/urls.py and the API through the test client and prints p50/p95/p99 "
+        "latency, query count and response size per view as JSON. With --baseline, "
+        "exits with an error when a view got slower or runs more queries."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=200)
+        parser.add_argument("--groups", type=int, default=10)
+        parser.add_argument("--posts", type=int, default=5000)
+        parser.add_argument("--follows", type=int, default=20, help="Authors followed per user.")
+        parser.add_argument("--comments", type=int, default=2, help="Average comments per post.")
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--repeat", type=int, default=50, help="Timed requests per view.")
+        parser.add_argument("--warmup", type=int, default=3, help="Untimed requests per view.")
+        parser.add_argument("--no-cache", action="store_true", help="Time views with a dummy cache.")
+        parser.add_argument("--output", help="Writes the results to this file, e.g. to use as a baseline.")
+        parser.add_argument("--baseline", help="Results of an earlier run to compare with.")
+        parser.add_argument(
+            "--tolerance", type=float, default=0.25, help="Allowed p95 slowdown against the baseline (0.25 = 25%%).",
+        )
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options["baseline"]:
+            with open(options["baseline"]) as file:
+                baseline = json.load(file)
+        setup_test_environment(debug=False)
+        old_name = connection.creation.create_test_db(verbosity=0)
+        connections[REPLICA].creation.set_as_test_mirror(connection.settings_dict)
+        try:
+            with override_settings(CACHES=self.caches(options["no_cache"])):
+                results = self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        output = json.dumps(results, indent=2, ensure_ascii=False)
+        self.stdout.write(output)
+        if options["output"]:
+            with open(options["output"], "w") as file:
+                file.write(output + "\n")
+        if baseline is not None:
+            regressions = compare(results, baseline, options["tolerance"])
+            if regressions:
+                raise CommandError("Regressions against the baseline:\n  " + "\n  ".join(regressions))
+            self.stderr.write(self.style.SUCCESS("No regressions against the baseline."))
+
+    @staticmethod
+    def caches(disabled):
+        if disabled:
+            return {"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+        # The configured backend, without the data of the running site.
+        location = os.path.join(tempfile.mkdtemp(), "cache.sqlite3")
+        return {"default": dict(settings.CACHES["default"], LOCATION=location)}
+
+    def run(self, options):
+        dataset = seed_dataset(
+            options["users"], options["groups"], options["posts"], options["follows"], options["comments"],
+            options["seed"],
+        )
+        # The least active user, who follows the most popular authors.
+        reader = User.objects.order_by("-pk").first()
+        reader.is_staff = True
+        reader.save()
+        requests = bench_requests(reader)
+        missing = {
+            pattern.name for pattern in urls.urlpatterns if isinstance(pattern, URLPattern)
+        } - {name for name, *_ in requests}
+        if missing:
+            raise CommandError(f"No benchmark request for: {', '.join(sorted(missing))}.")
+
+        client = Client()
+        client.force_login(reader)
+        timings = {name: [] for name, *_ in requests}
+        queries = {name: [] for name, *_ in requests}
+        sizes = {}
+        # Round-robin, so drift over the run spreads over every view.
+        for round_ in range(options["warmup"] + options["repeat"]):
+            for name, method, url, headers in requests:
+                started = time.perf_counter()
+                response = client.generic(method, url, **headers)
+                # Queries of streamed content are not in Server-Timing, which
+                # is sent before it.
+                body = b"".join(response.streaming_content) if response.streaming else response.content
+                elapsed = (time.perf_counter() - started) * 1000
+                if response.status_code >= 400:
+                    raise CommandError(f"{name} ({url}) answered {response.status_code}.")
+                if round_ >= options["warmup"]:
+                    timings[name].append(elapsed)
+                    queries[name].append(query_count(response))
+                    sizes[name] = len(body)
+
+        views = {}
+        for name, method, url, _ in requests:
+            ordered = sorted(timings[name])
+            views[name] = {
+                "url": url,
+                "p50_ms": round(percentile(ordered, 0.50), 3),
+                "p95_ms": round(percentile(ordered, 0.95), 3),
+                "p99_ms": round(percentile(ordered, 0.99), 3),
+                "queries": max(queries[name]),
+                "bytes": sizes[name],
+            }
+        return {"dataset": dataset, "repeat": options["repeat"], "cache": not options["no_cache"], "views": views}
@@ -0,0 +1,29 @@
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from yatube import assets
+
+
+class Command(BaseCommand):
+    help = (
+        "Builds the bundles of STATIC_BUNDLES, collects the static files into "
+        "STATIC_ROOT under content-hashed names with a manifest and writes .gz "
+        "(and .br) copies of them (see yatube/assets.py)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--clear", action="store_true", help="Empties STATIC_ROOT first.")
+
+    def handle(self, *args, **options):
+        try:
+            sizes = assets.build_bundles()
+        except FileNotFoundError as error:
+            raise CommandError(error)
+        for name, size in sizes.items():
+            self.stdout.write(f"{assets.bundle_path(name)}: {size} bytes")
+        call_command("collectstatic", interactive=False, clear=options["clear"], verbosity=0)
+        compressed = assets.precompress()
+        self.stdout.write(self.style.SUCCESS(
+            f"Collected {len(staticfiles_storage.hashed_files)} files, wrote {compressed} compressed copies."
+        ))
@@ -0,0 +1,116 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+
+from posts.models import Comment, Follow, Group, Post
+from posts.pagination import CursorPaginator
+from yatube.concurrency import serial
+from yatube.databases import REPLICA
+
+User = get_user_model()
+
+# Every view has to run its queries, so nothing may come from the cache.
+NO_CACHE = {"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+
+# (view, part of the SQL) of plans that are expected.
+ACCEPTED = [
+    # Ranking sorts at most SEARCH_MAX_CANDIDATES matches, see posts/search.py.
+    ("search", "ORDER BY rank, id"),
+    ("api search", "ORDER BY rank, id"),
+    # Every group, for the search form's filter.
+    ("search", 'FROM "posts_group" ORDER BY'),
+]
+
+
+def is_problem(detail):
+    """Full table scans and sorts in a temporary B-tree, in any SQLite version's wording."""
+    if detail.startswith("USE TEMP B-TREE"):
+        return True
+    return (
+        detail.startswith("SCAN ")
+        and "USING" not in detail
+        and "VIRTUAL TABLE" not in detail
+        and "CONSTANT ROW" not in detail
+        and "subquery" not in detail
+    )
+
+
+def seed():
+    """Creates a small site and returns the (name, url, headers) requests to replay."""
+    user = User.objects.create_user(username="reader", password="12345")
+    author = User.objects.create_user(username="writer", password="12345")
+    group = Group.objects.create(title="Group", slug="group", description="Group")
+    Follow.objects.create(user=user, author=author)
+    posts = [Post.objects.create(text=f"Post number {n}", author=author, group=group) for n in range(25)]
+    for post in posts[-3:]:
+        Comment.objects.create(post=post, author=user, text="Comment")
+    post = posts[-1]
+    cursor = CursorPaginator(Post.objects.feed(), 10).get_page().next_cursor
+    api = {"HTTP_AUTHORIZATION": f"Token {Token.objects.create(user=user).key}"}
+    return user, [
+        ("index", reverse("index"), {}),
+        ("index page 2", f"{reverse('index')}?cursor={cursor}", {}),
+        ("group_posts", reverse("group", args=[group.slug]), {}),
+        ("profile", reverse("profile", args=[author.username]), {}),
+        ("post_view", reverse("post", args=[author.username, post.pk]), {}),
+        ("post_comments", reverse("post_comments", args=[author.username, post.pk]), {}),
+        ("follow_index", reverse("follow_index"), {}),
+        ("search", f"{reverse('search')}?q=number&group={group.slug}", {}),
+        ("api posts", "/api/posts/", api),
+        ("api posts expanded", "/api/posts/?expand=author,group", api),
+        ("api post", f"/api/posts/{post.pk}/", api),
+        ("api search", "/api/search/?q=number", api),
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        "Replays the queries of the main views on a scratch database and reports "
+        "full table scans and temporary B-tree sorts in their SQLite query plans. "
+        "Exits with an error when any are found."
+    )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            raise CommandError("Query plans are read with SQLite's EXPLAIN QUERY PLAN.")
+        setup_test_environment(debug=False)
+        old_name = connection.creation.create_test_db(verbosity=0)
+        connections[REPLICA].creation.set_as_test_mirror(connection.settings_dict)
+        try:
+            # Queries are captured on this thread only.
+            with override_settings(CACHES=NO_CACHE), serial():
+                problems = self.explain_views()
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+        if problems:
+            raise CommandError(f"{problems} queries with full table scans or temp B-tree sorts.")
+        self.stdout.write(self.style.SUCCESS("No full table scans or temp B-tree sorts."))
+
+    def explain_views(self):
+        user, requests = seed()
+        client = Client()
+        client.force_login(user)
+        problems = 0
+        for name, url, headers in requests:
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get(url, **headers)
+            if response.status_code != 200:
+                raise CommandError(f"{name} ({url}) answered {response.status_code}.")
+            selects = [query["sql"] for query in queries if query["sql"].lstrip().upper().startswith("SELECT")]
+            self.stdout.write(f"{name} ({url}): {len(queries)} queries")
+            for sql in selects:
+                with connection.cursor() as cursor:
+                    cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+                    found = [row[-1] for row in cursor.fetchall() if is_problem(row[-1])]
+                if found and any(view == name and part in sql for view, part in ACCEPTED):
+                    self.stdout.write(f"  accepted: {' | '.join(found)}")
+                elif found:
+                    problems += 1
+                    self.stdout.write(self.style.WARNING(f"  {' | '.join(found)}"))
+                    self.stdout.write(f"    {sql}")
+        return problems
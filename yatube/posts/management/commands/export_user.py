@@ -0,0 +1,31 @@
+import gzip
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import export
+
+
+class Command(BaseCommand):
+    help = (
+        "Writes a user's posts, comments and follows as NDJSON (see posts/export.py), "
+        "gzipped when the output file name ends with .gz."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("username")
+        parser.add_argument("--output", help="Defaults to <username>.ndjson.gz.")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options["username"])
+        except User.DoesNotExist:
+            raise CommandError(f"No user {options['username']!r}.")
+        path = options["output"] or f"{user.username}.ndjson.gz"
+        opener = gzip.open if path.endswith(".gz") else open
+        written = 0
+        with opener(path, "wb") as file:
+            for chunk in export.ndjson(export.records(user)):
+                file.write(chunk)
+                written += len(chunk)
+        self.stdout.write(self.style.SUCCESS(f"Exported {written} bytes of NDJSON to {path}."))
@@ -0,0 +1,61 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import importer
+
+
+class Command(BaseCommand):
+    help = (
+        "Imports users, groups, posts, comments and follows from an NDJSON or CSV "
+        "file in chunks (see posts/importer.py). An interrupted import resumes "
+        "where it stopped when run again with the same file."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--format", choices=sorted(importer.READERS), help="Defaults to the file extension.")
+        parser.add_argument("--type", choices=importer.KINDS, help="Type of the records without one, e.g. a CSV of posts.")
+        parser.add_argument("--chunk-size", type=int, default=importer.CHUNK_SIZE, help="Records per transaction.")
+        parser.add_argument(
+            "--restart", action="store_true",
+            help="Starts over instead of resuming; refused once records of the file are imported.",
+        )
+        parser.add_argument(
+            "--no-rebuild", action="store_true",
+            help=(
+                "Skips the rebuild of the search index, counters and timelines, e.g. when "
+                "another file follows. The last import must rebuild them."
+            ),
+        )
+
+    def handle(self, *args, **options):
+        path = os.path.abspath(options["path"])
+        extension = os.path.splitext(path)[1].lstrip(".").lower()
+        file_format = options["format"] or {"jsonl": "ndjson", "json": "ndjson"}.get(extension, extension)
+        if file_format not in importer.READERS:
+            raise CommandError(f"Unknown format of {path}, use --format.")
+
+        run = importer.Importer(path, chunk_size=options["chunk_size"], default_type=options["type"])
+        if options["restart"]:
+            try:
+                run.restart()
+            except ValueError as error:
+                raise CommandError(f"{error} Importing them again would duplicate them.")
+        elif run.progress.finished:
+            self.stdout.write(f"{path} is already imported.")
+            return
+        elif run.progress.line:
+            self.stdout.write(f"Resuming after line {run.progress.line}.")
+
+        started = time.perf_counter()
+        with open(path, "rb") as file, importer.fast_sqlite(), importer.explicit_dates():
+            try:
+                run.run(importer.READERS[file_format](file, run.progress.position, run.progress.line))
+            except importer.InvalidRecord as error:
+                raise CommandError(f"{error} Records up to line {run.progress.line} are imported.")
+            run.finish(rebuild=not options["no_rebuild"])
+        elapsed = time.perf_counter() - started
+        imported = ", ".join(f"{count} {kind}s" for kind, count in run.counts.items())
+        self.stdout.write(self.style.SUCCESS(f"Imported {imported} in {elapsed:.1f} s."))
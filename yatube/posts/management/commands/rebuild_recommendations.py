@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from posts import recommendations
+
+
+class Command(BaseCommand):
+    help = "Recomputes the stored \"who to follow\" suggestions from the Follow graph (see posts/recommendations.py)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user", dest="user_ids", type=int, action="append",
+            help="Only rebuild the suggestions of this user id (can be repeated).",
+        )
+        parser.add_argument(
+            "--workers", type=int, default=recommendations.WORKERS,
+            help="Processes scoring users (default: RECOMMENDATIONS_WORKERS).",
+        )
+
+    def handle(self, *args, **options):
+        written = recommendations.rebuild(options["user_ids"], workers=options["workers"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt suggestions: {written} rows."))
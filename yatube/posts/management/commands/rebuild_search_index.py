@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import search
+
+
+class Command(BaseCommand):
+    help = "Recreates the full-text search index of posts from the posts table."
+
+    def handle(self, *args, **options):
+        if not search.is_supported():
+            raise CommandError("The full-text search index needs SQLite with FTS5.")
+        search.rebuild()
+        self.stdout.write(self.style.SUCCESS("Search index rebuilt."))
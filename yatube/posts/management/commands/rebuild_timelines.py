@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import timeline
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the materialized follow timelines from the Follow graph."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user", dest="user_ids", type=int, action="append",
+            help="Only rebuild the timeline of this user id (can be repeated).",
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            written = timeline.rebuild(options["user_ids"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt timelines: {written} entries."))
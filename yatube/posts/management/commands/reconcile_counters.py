@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import counters
+
+
+class Command(BaseCommand):
+    help = "Recomputes stored post, comment and follow counters from the source tables."
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            drift = counters.reconcile()
+        for counter, rows in drift.items():
+            self.stdout.write(f"{counter}: {rows} rows fixed")
+        self.stdout.write(self.style.SUCCESS("Counters reconciled."))
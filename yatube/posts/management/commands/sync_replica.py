@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from yatube.databases import REPLICA, copy_database, mark_synced
+
+
+class Command(BaseCommand):
+    help = "Copies the primary SQLite database to the local replica, once or every --interval seconds."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", type=float, help="Keep syncing, waiting this many seconds in between.")
+
+    def handle(self, *args, **options):
+        primary, replica = connections["default"].settings_dict, connections[REPLICA].settings_dict
+        if primary["ENGINE"] != "django.db.backends.sqlite3" or replica["ENGINE"] != primary["ENGINE"]:
+            raise CommandError("Only a SQLite primary can be copied to a SQLite replica.")
+        while True:
+            started, taken_at = time.monotonic(), time.time()
+            copy_database(primary["NAME"], replica["NAME"])
+            # The copy holds at least every write committed before it started.
+            mark_synced(taken_at)
+            self.stdout.write(f"Replica synced in {time.monotonic() - started:.2f}s.")
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
@@ -0,0 +1,53 @@
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from posts import imaging, renditions
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = "Renders the image renditions of all existing posts in parallel."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=renditions.WORKERS)
+        parser.add_argument("--force", action="store_true", help="Re-render renditions that already exist.")
+
+    def handle(self, *args, **options):
+        images = (
+            Post.objects.exclude(image="").exclude(image=None)
+            .order_by().values_list("image", flat=True).distinct()
+        )
+        pending = set()
+        self.rendered = self.failed = 0
+        with ProcessPoolExecutor(max_workers=options["workers"]) as pool:
+            for name in images.iterator():
+                if not options["force"] and renditions.is_complete(name):
+                    continue
+                if not default_storage.exists(name):
+                    self.failed += 1
+                    self.stderr.write(f"Missing source image {name}")
+                    continue
+                future = pool.submit(imaging.render_renditions, default_storage.path(name), renditions.targets(name))
+                future.image_name = name
+                pending.add(future)
+                # Keep a bounded number of jobs in flight so memory stays flat.
+                if len(pending) >= options["workers"] * 4:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    self.collect(done)
+            self.collect(pending)
+        self.stdout.write(self.style.SUCCESS(f"Rendered {self.rendered} images, {self.failed} failed."))
+
+    def collect(self, futures):
+        """Waits for ``futures`` and refreshes the posts of the rendered images."""
+        names = []
+        for future in futures:
+            try:
+                future.result()
+                names.append(future.image_name)
+            except Exception as error:
+                self.failed += 1
+                self.stderr.write(f"Could not render {future.image_name}: {error}")
+        renditions.refresh_posts(names)
+        self.rendered += len(names)
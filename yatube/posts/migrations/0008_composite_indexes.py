@@ -0,0 +1,48 @@
+# Generated by Django 2.2 on 2026-10-18 01:03
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, Min
+
+
+def remove_duplicate_follows(apps, schema_editor):
+    """Keeps the first of every repeated (user, author) follow and takes the
+    removed rows out of the stored counters."""
+    Follow = apps.get_model('posts', 'Follow')
+    UserStats = apps.get_model('posts', 'UserStats')
+    repeated = (
+        Follow.objects.values('user', 'author').annotate(first=Min('id'), rows=Count('id')).filter(rows__gt=1)
+    )
+    for pair in repeated:
+        Follow.objects.filter(user=pair['user'], author=pair['author']).exclude(id=pair['first']).delete()
+        extra = pair['rows'] - 1
+        UserStats.objects.filter(user=pair['author']).update(followers_count=F('followers_count') - extra)
+        UserStats.objects.filter(user=pair['user']).update(following_count=F('following_count') - extra)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0007_post_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_follows, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='follow',
+            unique_together={('user', 'author')},
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'created', 'id'], name='posts_comme_post_id_9660d8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['author', '-pub_date', '-id'], name='posts_post_author__075f1d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['group', '-pub_date', '-id'], name='posts_post_group_i_6a7ae9_idx'),
+        ),
+    ]
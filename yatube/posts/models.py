@@ -1,6 +1,8 @@
 from django.db import models
 from django.contrib.auth import get_user_model
 
+from .storage import ContentAddressedStorage
+
 User = get_user_model()
 
 
@@ -13,12 +15,31 @@ class Group(models.Model):
         return self.title
 
 
+class PostQuerySet(models.QuerySet):
+    def feed(self):
+        """Posts ready to be rendered as feed cards, with author and group
+        joined in the same query."""
+        return self.select_related("author", "group").order_by("-pub_date")
+
+
 class Post(models.Model):
     text = models.TextField()
-    pub_date = models.DateTimeField("date published", auto_now_add=True)
+    pub_date = models.DateTimeField("date published", auto_now_add=True, db_index=True)
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name="posts")
     group = models.ForeignKey(Group, blank=True, null=True, on_delete=models.CASCADE)
-    image = models.ImageField(upload_to='posts/', blank=True, null=True)
+    image = models.ImageField(upload_to='posts/', storage=ContentAddressedStorage(), blank=True, null=True)
+    comment_count = models.IntegerField(default=0, editable=False)
+    # Bumped on every change visible on the post card, see ``posts.cards``.
+    version = models.IntegerField(default=1, editable=False)
+
+    objects = PostQuerySet.as_manager()
+
+    class Meta:
+        # Author and group feeds are keyset-paginated on (pub_date, id).
+        indexes = [
+            models.Index(fields=["author", "-pub_date", "-id"]),
+            models.Index(fields=["group", "-pub_date", "-id"]),
+        ]
 
     def __str__(self):
         return self.text
@@ -30,6 +51,9 @@ class Comment(models.Model):
     text = models.CharField(max_length=500)
     created = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [models.Index(fields=["post", "created", "id"])]
+
     def __str__(self):
         return self.post,self.author,self.text,self.created
 
@@ -39,6 +63,83 @@ class Follow(models.Model):
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name="following")
     followed = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        unique_together = ("user", "author")
+
     def __str__(self):
         return f"{self.author} followed by {self.user}"
 
+
+class UserStats(models.Model):
+    """Stored counters shown on profile pages, see ``posts.counters``."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name="stats")
+    posts_count = models.IntegerField(default=0)
+    followers_count = models.IntegerField(default=0)
+    following_count = models.IntegerField(default=0)
+
+    @classmethod
+    def for_user(cls, user):
+        try:
+            return user.stats
+        except cls.DoesNotExist:
+            return cls(user=user)
+
+    def __str__(self):
+        return f"Stats of {self.user_id}"
+
+
+class TimelineEntry(models.Model):
+    """A post pushed to the follow feed of one of its author's followers."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="timeline")
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="timeline_entries")
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        unique_together = ("user", "post")
+        indexes = [
+            models.Index(fields=["user", "-pub_date", "-post"]),
+            models.Index(fields=["user", "author"]),
+        ]
+
+    def __str__(self):
+        return f"{self.post_id} in timeline of {self.user_id}"
+
+
+class ImportProgress(models.Model):
+    """How far ``import_yatube`` got through an input file, saved in the
+    transaction of each chunk of rows."""
+    source = models.CharField(max_length=255, unique=True)
+    position = models.BigIntegerField(default=0)
+    line = models.IntegerField(default=0)
+    finished = models.BooleanField(default=False)
+
+    def __str__(self):
+        return f"{self.source} at line {self.line}"
+
+
+class ImportedId(models.Model):
+    """Maps the id of an imported record in its source to the row created for it."""
+    kind = models.CharField(max_length=10)
+    external_id = models.CharField(max_length=255)
+    local_id = models.IntegerField()
+
+    class Meta:
+        unique_together = ("kind", "external_id")
+
+    def __str__(self):
+        return f"{self.kind} {self.external_id} -> {self.local_id}"
+
+
+class Suggestion(models.Model):
+    """An author recommended to a user by ``posts.recommendations``."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="suggestions")
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    score = models.FloatField()
+
+    class Meta:
+        unique_together = ("user", "author")
+        indexes = [models.Index(fields=["user", "-score"])]
+
+    def __str__(self):
+        return f"{self.author_id} suggested to {self.user_id}"
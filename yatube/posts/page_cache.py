@@ -0,0 +1,110 @@
+"""Generational full-page cache.
+
+Every cached page belongs to one or more namespaces (the whole site, a group,
+an author). Each namespace has a generation counter that is part of the page
+key; writes bump the generations of the namespaces they touch, so every page
+showing stale data stops being looked up at once while pages can be kept for
+a long time.
+"""
+import hashlib
+import time
+from contextlib import nullcontext
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+from yatube.databases import may_be_stale, replica_reads
+
+PAGE_TIMEOUT = getattr(settings, "PAGE_CACHE_TIMEOUT", 60 * 60 * 24)
+
+GLOBAL = "global"
+
+
+def group_namespace(slug):
+    return f"group:{slug}"
+
+
+def author_namespace(username):
+    return f"author:{username}"
+
+
+def _generation_key(namespace):
+    return f"page_gen:{namespace}"
+
+
+def _bumped_key(namespace):
+    return f"page_bumped:{namespace}"
+
+
+def _new_generation():
+    # Evicted counters restart from the clock instead of 1, so they can never
+    # match a generation that was already used for cached pages.
+    return int(time.time() * 1000)
+
+
+def snapshot(namespaces):
+    """Returns the current generation of each namespace, in order, and the
+    latest time (in seconds) any of them was bumped, with one cache read."""
+    keys = [_generation_key(namespace) for namespace in namespaces]
+    bumped_keys = [_bumped_key(namespace) for namespace in namespaces]
+    current = cache.get_many(keys + bumped_keys)
+    for key in keys:
+        if key not in current:
+            cache.add(key, _new_generation(), None)
+            current[key] = cache.get(key)
+    return [current[key] for key in keys], max((current.get(key, 0) for key in bumped_keys), default=0)
+
+
+def generations(namespaces):
+    """Returns the current generation of each namespace, in order."""
+    return snapshot(namespaces)[0]
+
+
+def bump(*namespaces):
+    """Invalidates every cached page of ``namespaces``."""
+    now = int(time.time())
+    for namespace in namespaces:
+        key = _generation_key(namespace)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, _new_generation(), None)
+    cache.set_many({_bumped_key(namespace): now for namespace in namespaces}, None)
+
+
+def bump_for_post(post):
+    """Invalidates the pages a post is shown on."""
+    namespaces = [GLOBAL, author_namespace(post.author.username)]
+    if post.group_id:
+        namespaces.append(group_namespace(post.group.slug))
+    bump(*namespaces)
+
+
+def cache_by_generation(namespaces_for, timeout=PAGE_TIMEOUT):
+    """Caches successful GET responses of a view under the generations of
+    ``namespaces_for(*args, **kwargs)``, separately for each user."""
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return view(request, *args, **kwargs)
+            namespaces = namespaces_for(*args, **kwargs)
+            path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+            current, bumped = snapshot(namespaces)
+            gens = ".".join(str(gen) for gen in current)
+            key = f"page:{view.__name__}:{path}:{request.user.pk or 0}:{gens}"
+            cached = cache.get(key)
+            if cached is not None:
+                content, content_type = cached
+                return HttpResponse(content, content_type=content_type)
+            # A lagging replica may not show the write behind the last bump
+            # yet, and the page would be kept under the new generation.
+            with replica_reads(False) if may_be_stale(bumped) else nullcontext():
+                response = view(request, *args, **kwargs)
+            if response.status_code == 200 and not response.cookies and not response.streaming:
+                cache.set(key, (response.content, response["Content-Type"]), timeout)
+            return response
+        return wrapped
+    return decorator
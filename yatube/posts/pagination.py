@@ -0,0 +1,130 @@
+import base64
+import binascii
+import json
+from collections.abc import Sequence
+
+from django.db.models import Q
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class CursorPage(Sequence):
+    """One page of a keyset-paginated queryset."""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """Paginates a queryset by the values of its ordering keys instead of
+    OFFSET, so every page costs one indexed range scan no matter how deep it is.
+
+    Cursors are opaque url-safe tokens holding the keys of the boundary row.
+    Keys are ordered descending (newest first), the last key has to be unique.
+    """
+
+    def __init__(self, queryset, per_page, keys=("pub_date", "id")):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.keys = keys
+
+    def encode_cursor(self, obj, reverse=False):
+        # Pages of ``values()`` querysets hold dicts instead of instances.
+        position = [str(obj[key] if isinstance(obj, dict) else getattr(obj, key)) for key in self.keys]
+        payload = json.dumps({"p": position, "r": int(reverse)}, separators=(",", ":"))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+    def decode_cursor(self, cursor):
+        """Returns (position, reverse) or None for a malformed cursor."""
+        try:
+            padded = cursor + "=" * (-len(cursor) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            fields = [self.queryset.model._meta.get_field(key) for key in self.keys]
+            position = [field.to_python(value) for field, value in zip(fields, payload["p"])]
+            if len(position) != len(self.keys) or None in position:
+                return None
+            return position, bool(payload["r"])
+        except (binascii.Error, ValueError, TypeError, KeyError, AttributeError):
+            return None
+
+    @staticmethod
+    def keyset(queryset, keys, position, reverse):
+        """Orders ``queryset`` by ``keys`` and keeps the rows strictly after
+        ``position`` in the walking direction."""
+        queryset = queryset.order_by(*[key if reverse else f"-{key}" for key in keys])
+        if position is None:
+            return queryset
+        lookup = "gt" if reverse else "lt"
+        condition = Q()
+        for index, key in enumerate(keys):
+            equal = dict(zip(keys[:index], position[:index]))
+            condition |= Q(**equal, **{f"{key}__{lookup}": position[index]})
+        return queryset.filter(condition)
+
+    def fetch(self, position, reverse, limit):
+        """Returns up to ``limit`` rows after ``position``, in walking order."""
+        return list(self.keyset(self.queryset, self.keys, position, reverse)[:limit])
+
+    def get_page(self, cursor=None):
+        """Returns the page following ``cursor``; unknown cursors give the first page."""
+        decoded = self.decode_cursor(cursor) if cursor else None
+        position, reverse = decoded if decoded else (None, False)
+        rows = self.fetch(position, reverse, self.per_page + 1)
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if reverse:
+            rows.reverse()
+        if not rows:
+            return CursorPage(rows)
+        has_next = has_more if not reverse else True
+        has_previous = position is not None if not reverse else has_more
+        return CursorPage(
+            rows,
+            next_cursor=self.encode_cursor(rows[-1]) if has_next else None,
+            previous_cursor=self.encode_cursor(rows[0], reverse=True) if has_previous else None,
+        )
+
+
+class PostCursorPagination(BasePagination):
+    """REST framework adapter for :class:`CursorPaginator`."""
+
+    page_size = 10
+    cursor_query_param = "cursor"
+    keys = ("pub_date", "id")
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        paginator = CursorPaginator(queryset, self.page_size, keys=self.keys)
+        self.page = paginator.get_page(request.query_params.get(self.cursor_query_param))
+        return list(self.page)
+
+    def get_link(self, cursor):
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            "next": self.get_link(self.page.next_cursor),
+            "previous": self.get_link(self.page.previous_cursor),
+            "results": data,
+        })
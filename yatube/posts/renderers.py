@@ -0,0 +1,18 @@
+"""JSON renderer backed by orjson.
+
+Indented output, which orjson only does with two spaces, falls back to
+rest_framework's ``JSONRenderer``.
+"""
+import orjson
+from rest_framework.renderers import JSONRenderer
+
+
+class ORJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if self.get_indent(accepted_media_type or "", renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b""
+        # The encoder handles the types orjson does not know (lazy strings,
+        # decimals, querysets), as it does for JSONRenderer.
+        return orjson.dumps(data, default=self.encoder_class().default, option=orjson.OPT_UTC_Z)
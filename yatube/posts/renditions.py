@@ -0,0 +1,126 @@
+"""Pre-generated image renditions.
+
+Renditions are rendered in a process pool as soon as a post's image is saved
+(or the first time one is asked for), never inside the request. Until a
+rendition exists templates get a placeholder; once the pool has written it,
+the post's card and pages are invalidated so the real image shows up.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from PIL import features
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.db.models import F
+from django.templatetags.static import static
+
+from yatube import metrics
+
+from . import imaging, page_cache
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+# name: (width, height, format)
+RENDITIONS = {
+    "card": (960, 339, "JPEG"),
+    "mobile": (480, 170, "JPEG"),
+    "webp": (960, 339, "WEBP"),
+}
+if not features.check("webp"):
+    # Pillow built without libwebp: serve the JPEG renditions only.
+    del RENDITIONS["webp"]
+EXTENSIONS = {"JPEG": ".jpg", "WEBP": ".webp"}
+PLACEHOLDER = "img/placeholder.svg"
+WORKERS = getattr(settings, "THUMBNAIL_WORKERS", 2)
+# Originals larger than this are scaled down before renditions are made.
+MAX_SIDE = getattr(settings, "IMAGE_MAX_SIDE", 2048)
+# How long a scheduled (or failed) job keeps others from scheduling the same image.
+JOB_TIMEOUT = 300
+
+JOBS = metrics.Counter("yatube_thumbnail_jobs", "Rendition jobs by outcome.", ["result"])
+PLACEHOLDERS = metrics.Counter("yatube_thumbnail_placeholders", "Placeholders served for missing renditions.")
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def rendition_name(image_name, rendition):
+    width, height, image_format = RENDITIONS[rendition]
+    stem = os.path.splitext(image_name)[0]
+    return f"renditions/{rendition}/{stem}{EXTENSIONS[image_format]}"
+
+
+def targets(image_name):
+    return [
+        (default_storage.path(rendition_name(image_name, rendition)), width, height, image_format)
+        for rendition, (width, height, image_format) in RENDITIONS.items()
+    ]
+
+
+def is_complete(image_name):
+    return all(default_storage.exists(rendition_name(image_name, rendition)) for rendition in RENDITIONS)
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=WORKERS)
+        return _pool
+
+
+def refresh_posts(image_names):
+    """Invalidates cards and pages of the posts showing ``image_names``."""
+    posts = Post.objects.filter(image__in=image_names)
+    posts.update(version=F("version") + 1)
+    for post in posts.select_related("author", "group"):
+        page_cache.bump_for_post(post)
+
+
+def _finished(image_name, future):
+    try:
+        future.result()
+        refresh_posts([image_name])
+        JOBS.inc("rendered")
+    except Exception:
+        JOBS.inc("failed")
+        logger.exception("Could not render renditions of %s", image_name)
+    finally:
+        connection.close()
+
+
+def _submit(image_name):
+    if not cache.add(f"rendition_job:{image_name}", 1, JOB_TIMEOUT):
+        return
+    future = get_pool().submit(
+        imaging.process_upload, default_storage.path(image_name), MAX_SIDE, targets(image_name)
+    )
+    future.add_done_callback(partial(_finished, image_name))
+    JOBS.inc("scheduled")
+
+
+def schedule(image_name):
+    """Queues rendering of ``image_name`` once the current transaction commits."""
+    if image_name:
+        transaction.on_commit(partial(_submit, str(image_name)))
+
+
+def url(image, rendition):
+    """Returns the rendition's URL without blocking: a placeholder is returned
+    (and rendering scheduled) while the rendition does not exist yet, and an
+    empty string for renditions this installation cannot produce."""
+    if rendition not in RENDITIONS:
+        return ""
+    name = rendition_name(image.name, rendition)
+    if default_storage.exists(name):
+        return default_storage.url(name)
+    schedule(image.name)
+    PLACEHOLDERS.inc()
+    return static(PLACEHOLDER)
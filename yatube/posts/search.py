@@ -0,0 +1,147 @@
+"""Full-text search over ``Post.text``.
+
+On SQLite posts are indexed by the FTS5 table ``posts_post_fts``, an
+external-content index over ``posts_post`` kept in sync by triggers. Other
+databases fall back to a (slow) ``icontains`` scan.
+
+SQLite migrations that rebuild ``posts_post`` drop its triggers, so they are
+recreated after every ``migrate`` (see ``PostsConfig.ready``).
+"""
+import base64
+import binascii
+import json
+import re
+
+from django.conf import settings
+from django.db import connection
+
+from .models import Post
+from .pagination import CursorPage
+
+TABLE = "posts_post_fts"
+
+CREATE_TABLE = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5("
+    "text, content='posts_post', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+)
+TRIGGERS = (
+    f"""CREATE TRIGGER IF NOT EXISTS {TABLE}_insert AFTER INSERT ON posts_post BEGIN
+        INSERT INTO {TABLE}(rowid, text) VALUES (new.id, new.text);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {TABLE}_delete AFTER DELETE ON posts_post BEGIN
+        INSERT INTO {TABLE}({TABLE}, rowid, text) VALUES ('delete', old.id, old.text);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {TABLE}_update AFTER UPDATE OF text ON posts_post BEGIN
+        INSERT INTO {TABLE}({TABLE}, rowid, text) VALUES ('delete', old.id, old.text);
+        INSERT INTO {TABLE}(rowid, text) VALUES (new.id, new.text);
+    END""",
+)
+
+MAX_CANDIDATES = getattr(settings, "SEARCH_MAX_CANDIDATES", 10000)
+
+WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def is_supported(using=None):
+    return (connection if using is None else using).vendor == "sqlite"
+
+
+def install(cursor):
+    """Creates the index table and its triggers if they are missing."""
+    cursor.execute(CREATE_TABLE)
+    for statement in TRIGGERS:
+        cursor.execute(statement)
+
+
+def uninstall_triggers(cursor):
+    """Drops the triggers, for bulk loads that call ``rebuild()`` afterwards."""
+    for name in ("insert", "delete", "update"):
+        cursor.execute(f"DROP TRIGGER IF EXISTS {TABLE}_{name}")
+
+
+def rebuild():
+    """Reindexes every post from ``posts_post`` and merges the index segments."""
+    with connection.cursor() as cursor:
+        install(cursor)
+        cursor.execute(f"INSERT INTO {TABLE}({TABLE}) VALUES ('rebuild')")
+        cursor.execute(f"INSERT INTO {TABLE}({TABLE}) VALUES ('optimize')")
+
+
+def match_expression(query):
+    """Turns free text into an FTS5 query in which every word must appear.
+    Words are quoted, so user input never reaches the FTS5 query syntax.
+    Returns '' when the text has no words."""
+    return " ".join(f'"{word}"' for word in WORD.findall(query))
+
+
+def filter_posts(queryset, query):
+    """Restricts a ``Post`` queryset to the posts matching ``query``."""
+    if not is_supported():
+        return queryset.filter(text__icontains=query)
+    expression = match_expression(query)
+    if not expression:
+        return queryset.none()
+    # Not pk__in=RawSQL(...): SQLite reads "IN ((SELECT ...))" as a scalar
+    # subquery and would only match the first row.
+    return queryset.extra(
+        where=[f'"{Post._meta.db_table}"."id" IN (SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s)'],
+        params=[expression],
+    )
+
+
+def _encode(rank, post_id):
+    payload = json.dumps([rank, post_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def _decode(cursor):
+    try:
+        rank, post_id = json.loads(base64.urlsafe_b64decode((cursor + "=" * (-len(cursor) % 4)).encode()))
+        return float(rank), int(post_id)
+    except (binascii.Error, ValueError, TypeError):
+        return None
+
+
+def search(query, per_page, cursor=None, group=None):
+    """Returns a page of feed posts matching ``query``, best matches first.
+
+    Pages are keyed on (bm25 rank, id), so going deeper costs no OFFSET.
+    """
+    if not is_supported():
+        posts = filter_posts(Post.objects.feed(), query)
+        if group is not None:
+            posts = posts.filter(group=group)
+        return CursorPage(list(posts[:per_page]))
+    expression = match_expression(query)
+    if not expression:
+        return CursorPage([])
+    # Ranking costs one bm25() call per match, so very common words would
+    # rank the whole table: only the newest MAX_CANDIDATES matches are ranked.
+    candidates = [f"SELECT f.rowid AS id, f.rank AS rank FROM {TABLE} f"]
+    params = []
+    if group is not None:
+        candidates.append("JOIN posts_post p ON p.id = f.rowid")
+    candidates.append(f"WHERE {TABLE} MATCH %s")
+    params.append(expression)
+    if group is not None:
+        candidates.append("AND p.group_id = %s")
+        params.append(group.pk)
+    candidates.append("ORDER BY f.rowid DESC LIMIT %s")
+    params.append(MAX_CANDIDATES)
+    sql = [f"SELECT id, rank FROM ({' '.join(candidates)})"]
+    position = _decode(cursor) if cursor else None
+    if position is not None:
+        sql.append("WHERE rank > %s OR (rank = %s AND id > %s)")
+        params.extend([position[0], position[0], position[1]])
+    sql.append("ORDER BY rank, id LIMIT %s")
+    params.append(per_page + 1)
+    with connection.cursor() as db_cursor:
+        db_cursor.execute(" ".join(sql), params)
+        rows = db_cursor.fetchall()
+    has_next = len(rows) > per_page
+    rows = rows[:per_page]
+    posts = Post.objects.feed().in_bulk([post_id for post_id, _ in rows])
+    return CursorPage(
+        [posts[post_id] for post_id, _ in rows if post_id in posts],
+        next_cursor=_encode(*reversed(rows[-1])) if has_next else None,
+    )
@@ -1,8 +1,27 @@
+from django.utils.encoding import smart_str
 from rest_framework import serializers
-from .models import Post
+from .models import Post, Group
+
+
+class GroupSlugField(serializers.SlugRelatedField):
+    """Looks groups up in ``context["groups"]`` (slug -> Group) when the
+    caller has loaded them up front, as bulk writes do."""
+
+    def to_internal_value(self, data):
+        groups = self.context.get("groups")
+        if groups is None:
+            return super().to_internal_value(data)
+        try:
+            return groups[data]
+        except (KeyError, TypeError):
+            self.fail("does_not_exist", slug_name=self.slug_field, value=smart_str(data))
 
 
 class PostSerializer(serializers.HyperlinkedModelSerializer):
+    group = GroupSlugField(
+        slug_field='slug', queryset=Group.objects.all(), required=False, allow_null=True
+    )
+
     class Meta:
         model = Post
-        fields = ['group', 'text', 'image']
\ No newline at end of file
+        fields = ['group', 'text', 'image']
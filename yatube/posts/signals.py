@@ -0,0 +1,137 @@
+from django.db import connections
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import comments, counters, page_cache, recommendations, search, timeline
+from .models import Comment, Follow, Group, Post
+
+
+@receiver(post_save, sender=Post)
+def count_new_post(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.bump_user(instance.author_id, posts_count=1)
+
+
+@receiver(post_save, sender=Post)
+def invalidate_post_card(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        Post.objects.filter(pk=instance.pk).update(version=F("version") + 1)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    counters.bump_user(instance.author_id, posts_count=-1)
+
+
+@receiver(post_save, sender=Comment)
+def count_new_comment(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.bump_post(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    counters.bump_post(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Comment)
+def invalidate_comment_thread(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        comments.added(instance)
+    else:
+        comments.changed(instance)
+
+
+@receiver(post_delete, sender=Comment)
+def invalidate_deleted_comment(sender, instance, **kwargs):
+    comments.changed(instance)
+
+
+@receiver(post_save, sender=Follow)
+def count_new_follow(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.bump_user(instance.author_id, followers_count=1)
+        counters.bump_user(instance.user_id, following_count=1)
+
+
+@receiver(post_delete, sender=Follow)
+def count_deleted_follow(sender, instance, **kwargs):
+    counters.bump_user(instance.author_id, followers_count=-1)
+    counters.bump_user(instance.user_id, following_count=-1)
+
+
+@receiver(post_save, sender=Post)
+def push_post_to_timelines(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        timeline.fan_out(instance)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        timeline.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def prune_timeline(sender, instance, **kwargs):
+    timeline.prune(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Follow)
+def update_suggestions(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        recommendations.followed(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def update_suggestions_on_unfollow(sender, instance, **kwargs):
+    recommendations.unfollowed(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_pages(sender, instance, raw=False, **kwargs):
+    if not raw:
+        page_cache.bump_for_post(instance)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment_pages(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    post = Post.objects.select_related("author", "group").filter(pk=instance.post_id).first()
+    if post is not None:
+        page_cache.bump_for_post(post)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_follow_pages(sender, instance, raw=False, **kwargs):
+    if not raw:
+        page_cache.bump(
+            page_cache.author_namespace(instance.author.username),
+            page_cache.author_namespace(instance.user.username),
+        )
+
+
+@receiver(post_save, sender=Group)
+def invalidate_group_pages(sender, instance, raw=False, **kwargs):
+    if not raw:
+        # Post cards show the group's title and slug.
+        Post.objects.filter(group=instance).update(version=F("version") + 1)
+        page_cache.bump(page_cache.GLOBAL, page_cache.group_namespace(instance.slug))
+
+
+def restore_search_triggers(sender, using, **kwargs):
+    """Connected to ``post_migrate``: SQLite drops the triggers of tables that
+    migrations rebuild, which would silently stop the search index updating."""
+    connection = connections[using]
+    if not search.is_supported(connection) or search.TABLE not in connection.introspection.table_names():
+        return
+    with connection.cursor() as cursor:
+        for statement in search.TRIGGERS:
+            cursor.execute(statement)
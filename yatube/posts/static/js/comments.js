@@ -0,0 +1,20 @@
+// Loads older comments from the JSON endpoint instead of following the link.
+$(document).on("click", "a.load-comments", function (event) {
+    event.preventDefault();
+    var link = $(this);
+    $.getJSON(link.data("url"), function (data) {
+        $.each(data.results, function (_, comment) {
+            var heading = $("<h5 class='mt-0'>").append(
+                $("<a>").attr({href: "/" + comment.author + "/", name: "comment_" + comment.id}).text(comment.author)
+            );
+            $("#comments").append(
+                $("<div class='media mb-4'>").append($("<div class='media-body'>").append(heading, document.createTextNode(comment.text)))
+            );
+        });
+        if (data.next) {
+            link.data("url", data.next).attr("href", "?comments=" + data.next_cursor + "#comments");
+        } else {
+            link.remove();
+        }
+    });
+});
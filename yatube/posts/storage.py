@@ -0,0 +1,76 @@
+"""Content-addressed storage for post images.
+
+Uploads are hashed while they stream to disk (``HashingFileUploadHandler``)
+and stored under their SHA-256, so the same picture uploaded again is kept
+only once.
+"""
+import hashlib
+import os
+import tempfile
+
+from django.core.files import File
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.utils.deconstruct import deconstructible
+
+
+def file_digest(content):
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+class HashingFileUploadHandler(TemporaryFileUploadHandler):
+    """Streams every upload to a temporary file, hashing it chunk by chunk."""
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.digest = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.digest.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        uploaded = super().file_complete(file_size)
+        uploaded.content_hash = self.digest.hexdigest()
+        return uploaded
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Stores files as ``<upload_to>/ab/cd/abcd….ext`` after their content hash."""
+
+    def hashed_name(self, name, digest):
+        directory = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        return os.path.join(directory, digest[:2], digest[2:4], f"{digest}{extension}")
+
+    def save(self, name, content, max_length=None):
+        if not hasattr(content, "chunks"):
+            content = File(content, name)
+        digest = getattr(content, "content_hash", None) or file_digest(content)
+        name = self.hashed_name(name, digest).replace("\\", "/")
+        if self.exists(name):
+            return name
+        return self._save(name, content)
+
+    def _save(self, name, content):
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(dir=directory, suffix=".part")
+        if hasattr(content, "temporary_file_path"):
+            os.close(descriptor)
+            file_move_safe(content.temporary_file_path(), temporary, allow_overwrite=True)
+        else:
+            with os.fdopen(descriptor, "wb") as destination:
+                for chunk in content.chunks():
+                    destination.write(chunk)
+        os.chmod(temporary, self.file_permissions_mode or 0o644)
+        # Identical concurrent uploads replace each other with the same bytes.
+        os.replace(temporary, full_path)
+        return name
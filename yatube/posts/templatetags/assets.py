@@ -0,0 +1,12 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from yatube import assets
+
+register = template.Library()
+
+
+@register.simple_tag
+def bundle(name):
+    """Loads a bundle of ``STATIC_BUNDLES``, see yatube/assets.py."""
+    return mark_safe(assets.bundle_tags(name))
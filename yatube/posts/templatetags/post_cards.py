@@ -0,0 +1,17 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from posts.cards import render_cards
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def post_cards(context, posts, separator=""):
+    """Renders the cards of a page of posts through the card cache."""
+    return mark_safe(separator.join(render_cards(list(posts), context.get("user"))))
+
+
+@register.simple_tag(takes_context=True)
+def post_card(context, post):
+    return mark_safe(render_cards([post], context.get("user"))[0])
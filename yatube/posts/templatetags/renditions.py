@@ -0,0 +1,11 @@
+from django import template
+
+from posts import renditions
+
+register = template.Library()
+
+
+@register.simple_tag
+def rendition_url(image, name):
+    """URL of a pre-generated rendition of ``image``, or a placeholder."""
+    return renditions.url(image, name)
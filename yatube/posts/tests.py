@@ -1,13 +1,43 @@
-from django.contrib.auth.models import User
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache.backends.locmem import LocMemCache
 from django.shortcuts import get_object_or_404
-from django.test import TestCase, Client
+from django.test import SimpleTestCase, TestCase, Client, RequestFactory, override_settings
 from django.core.cache import cache
+from django.http import HttpResponse, parse_cookie
+from django.db import IntegrityError, connection, router, transaction
+from django.db.models import Q, Sum
+from django.test.utils import CaptureQueriesContext
 
+import asyncio
+import gzip
+import io
+import json
+import math
+import multiprocessing
+import os
+import pstats
+import sqlite3
 import tempfile
+import threading
+import time
+from unittest import mock
+from django.core.management import CommandError, call_command
 from django.urls import reverse
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework import permissions
+from rest_framework.renderers import JSONRenderer
+
+from yatube import assets, concurrency, databases, metrics, profiling, throttling
+from yatube.asgi import ASGIHandler
+from yatube.sqlite_cache import SQLiteCache
 
 from .forms import PostForm, CommentForm
-from .models import Post, Group, Follow
+from .models import Post, Group, Comment, Follow, ImportProgress, Suggestion, TimelineEntry, UserStats
+from .renderers import ORJSONRenderer
+from .serializers import PostSerializer
+from . import cards, comments, export, imaging, importer, page_cache, recommendations, renditions, search, timeline, views
+from .management.commands import bench, explain_views
 
 
 TEST_CACHE_SETTING = {}
@@ -15,6 +45,7 @@ TEST_CACHE_SETTING = {}
 
 class ProfileTestCase(TestCase):
     def setUp(self):
+        cache.clear()
         self.client = Client()
         self.user = User.objects.create_user(
             username="testuser",
@@ -88,6 +119,7 @@ class ErrorTestCase(TestCase):
 
 class ImageTestCase(TestCase):
     def setUp(self):
+        cache.clear()
         self.client = Client()
         self.user = User.objects.create_user(
             username="testuser",
@@ -120,6 +152,7 @@ class ImageTestCase(TestCase):
 
 class FollowingTestCase(TestCase):
     def setUp(self):
+        cache.clear()
         self.client = Client()
         self.user = User.objects.create_user(
             username="testuser",
@@ -170,3 +203,1530 @@ class FollowingTestCase(TestCase):
 
 
 
+class FeedQueryCountTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username="testuser",
+            email="test@test.com",
+            password="12345"
+        )
+        self.author = User.objects.create_user(
+            username="testauthor",
+            email="author@test.com",
+            password="12345"
+        )
+        self.group = Group.objects.create(title="Test title", slug="testgroupf", description="Test description")
+        Follow.objects.create(user=self.user, author=self.author)
+        for i in range(15):
+            post = Post.objects.create(text=f"Post {i}", author=self.author, group=self.group)
+            Comment.objects.create(post=post, author=self.user, text=f"Comment {i}")
+        self.client.login(username="testuser", password="12345")
+
+    def test_index_queries(self):
+        # newest post (validators), user (the session is cached), page
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse("index"))
+        self.assertEqual(len(response.context["page"]), 10)
+        self.assertContains(response, "1 комментариев")
+
+    def test_group_queries(self):
+        # newest post of the group, user, group, page
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse("group", args=[self.group.slug]))
+        self.assertEqual(len(response.context["page"]), 10)
+
+    def test_profile_queries(self):
+        # counters and newest post, user, then author with stats, page and
+        # follow status (loaded concurrently outside of tests)
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse("profile", args=[self.author.username]))
+        self.assertEqual(len(response.context["page"]), 10)
+
+    def test_follow_index_queries(self):
+        # user, hot authors, timeline entries, posts
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse("follow_index"))
+        self.assertEqual(len(response.context["page"]), 10)
+
+    def test_api_list_queries(self):
+        token = Token.objects.create(user=self.user)
+        # token with user, newest post, posts
+        with self.assertNumQueries(3):
+            response = self.client.get("/api/posts/", HTTP_AUTHORIZATION=f"Token {token.key}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["results"]), 10)
+
+
+class CursorPaginationTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username="testuser",
+            email="test@test.com",
+            password="12345"
+        )
+        self.posts = [Post.objects.create(text=f"Post {i}", author=self.user) for i in range(25)]
+        # Same publication date for every post, so pages are told apart by id only
+        Post.objects.update(pub_date=self.posts[0].pub_date)
+
+    def walk(self, url):
+        texts = []
+        response = self.client.get(url)
+        while True:
+            page = response.context["page"]
+            texts.extend(post.text for post in page)
+            if not page.has_next():
+                return texts, page
+            response = self.client.get(url, {"cursor": page.next_cursor})
+
+    def test_walk_forward_and_back(self):
+        texts, last_page = self.walk(reverse("profile", args=[self.user.username]))
+        self.assertEqual(texts, [f"Post {i}" for i in reversed(range(25))])
+        self.assertEqual(len(last_page), 5)
+        response = self.client.get(reverse("profile", args=[self.user.username]),
+                                   {"cursor": last_page.previous_cursor})
+        page = response.context["page"]
+        self.assertEqual([post.text for post in page], [f"Post {i}" for i in range(14, 4, -1)])
+        self.assertTrue(page.has_previous())
+        self.assertTrue(page.has_next())
+
+    def test_first_page_has_no_previous(self):
+        response = self.client.get(reverse("index"))
+        page = response.context["page"]
+        self.assertFalse(page.has_previous())
+        self.assertContains(response, f"?cursor={page.next_cursor}")
+
+    def test_malformed_cursor_gives_first_page(self):
+        response = self.client.get(reverse("index"), {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["page"][0].text, "Post 24")
+
+    def test_api_cursor(self):
+        token = Token.objects.create(user=self.user)
+        response = self.client.get("/api/posts/", HTTP_AUTHORIZATION=f"Token {token.key}")
+        data = response.json()
+        self.assertIsNone(data["previous"])
+        texts = [item["text"] for item in data["results"]]
+        while data["next"]:
+            data = self.client.get(data["next"], HTTP_AUTHORIZATION=f"Token {token.key}").json()
+            texts.extend(item["text"] for item in data["results"])
+        self.assertEqual(texts, [f"Post {i}" for i in reversed(range(25))])
+
+
+class TimelineTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username="testuser",
+            email="test@test.com",
+            password="12345"
+        )
+        self.author = User.objects.create_user(
+            username="testauthor",
+            email="author@test.com",
+            password="12345"
+        )
+        self.old_post = Post.objects.create(text="Before following", author=self.author)
+        self.client.login(username="testuser", password="12345")
+
+    def follow_texts(self):
+        return [post.text for post in self.client.get(reverse("follow_index")).context["page"]]
+
+    def test_follow_backfills_and_new_posts_fan_out(self):
+        self.client.get(reverse("profile_follow", args=[self.author.username]))
+        self.assertEqual(self.follow_texts(), ["Before following"])
+        Post.objects.create(text="After following", author=self.author)
+        self.assertEqual(self.follow_texts(), ["After following", "Before following"])
+        self.assertEqual(TimelineEntry.objects.filter(user=self.user).count(), 2)
+
+    def test_unfollow_prunes(self):
+        self.client.get(reverse("profile_follow", args=[self.author.username]))
+        self.client.get(reverse("profile_unfollow", args=[self.author.username]))
+        self.assertFalse(TimelineEntry.objects.filter(user=self.user).exists())
+        self.assertEqual(self.follow_texts(), [])
+
+    def test_hot_author_is_pulled(self):
+        with mock.patch.object(timeline, "FANOUT_LIMIT", 1):
+            self.client.get(reverse("profile_follow", args=[self.author.username]))
+            Post.objects.create(text="Hot post", author=self.author)
+            self.assertFalse(TimelineEntry.objects.filter(user=self.user).exists())
+            self.assertEqual(self.follow_texts(), ["Hot post", "Before following"])
+
+    def test_rebuild_command(self):
+        Follow.objects.create(user=self.user, author=self.author)
+        TimelineEntry.objects.all().delete()
+        call_command("rebuild_timelines", stdout=io.StringIO())
+        self.assertEqual(self.follow_texts(), ["Before following"])
+
+    def test_rebuild_of_some_users(self):
+        other = User.objects.create_user(username="other", password="12345")
+        Follow.objects.create(user=self.user, author=self.author)
+        Follow.objects.create(user=other, author=self.author)
+        Post.objects.create(text="Newer", author=self.author)
+        TimelineEntry.objects.all().delete()
+        with mock.patch.object(timeline, "BACKFILL_SIZE", 1):
+            self.assertEqual(timeline.rebuild([self.user.pk]), 1)
+        self.assertEqual(self.follow_texts(), ["Newer"])
+        self.assertFalse(TimelineEntry.objects.filter(user=other).exists())
+
+
+class RecommendationsTestCase(TestCase):
+    def setUp(self):
+        self.users = {
+            name: User.objects.create_user(username=name, password="12345")
+            for name in ("viewer", "first", "second", "fan", "reader", "lurker")
+        }
+        for name, posts in (("fan", 2), ("reader", 1), ("viewer", 1)):
+            for n in range(posts):
+                Post.objects.create(text=f"Post {n} of {name}", author=self.users[name])
+
+    def follow(self, user, author):
+        return Follow.objects.create(user=self.users[user], author=self.users[author])
+
+    def follow_all(self):
+        for user, author in (("viewer", "first"), ("viewer", "second"), ("fan", "first"),
+                             ("fan", "second"), ("reader", "first"), ("lurker", "second")):
+            self.follow(user, author)
+
+    def stored(self):
+        return {(row.user.username, row.author.username): round(row.score, 6)
+                for row in Suggestion.objects.select_related("user", "author")}
+
+    def test_rebuild_scores_other_followers_by_activity(self):
+        self.follow_all()
+        recommendations.rebuild(workers=1)
+        suggested = recommendations.for_user(self.users["viewer"])
+        self.assertEqual([row.author.username for row in suggested], ["fan", "reader"])
+        self.assertAlmostEqual(suggested[0].score, 2 * math.log(3))
+        self.assertAlmostEqual(suggested[1].score, math.log(2))
+
+    def test_follow_signals_keep_rebuild_results(self):
+        self.follow_all()
+        self.follow("first", "second")
+        self.follow("reader", "viewer")
+        self.follow("viewer", "fan")
+        Follow.objects.get(user=self.users["viewer"], author=self.users["second"]).delete()
+        incremental = self.stored()
+        recommendations.rebuild(workers=1)
+        self.assertEqual(incremental, self.stored())
+
+    def test_rebuild_replaces_rows_batch_by_batch(self):
+        self.follow_all()
+        recommendations.rebuild(workers=1)
+        expected = self.stored()
+        Suggestion.objects.create(user=self.users["lurker"], author=self.users["reader"], score=1)
+        with mock.patch.object(recommendations, "BATCH_SIZE", 2), CaptureQueriesContext(connection) as queries:
+            recommendations.rebuild(workers=1)
+        self.assertEqual(self.stored(), expected)
+        self.assertGreaterEqual(sum(query["sql"].startswith("DELETE") for query in queries), 3)
+
+    def test_deleting_users_leaves_no_suggestions_behind(self):
+        self.follow_all()
+        self.follow("viewer", "fan")
+        self.follow("fan", "viewer")
+        recommendations.rebuild(workers=1)
+        for name in ("fan", "viewer"):
+            user_id = self.users[name].pk
+            self.users[name].delete()
+            connection.check_constraints()
+            self.assertFalse(Suggestion.objects.filter(Q(user=user_id) | Q(author=user_id)).exists())
+
+    def test_parallel_scoring_matches_serial(self):
+        self.follow_all()
+        graph = recommendations.Graph.load()
+        serial = list(recommendations.score(graph, workers=1))
+        with mock.patch.object(recommendations, "CHUNK_SIZE", 2):
+            self.assertEqual(list(recommendations.score(graph, workers=2)), serial)
+
+    def test_hub_authors_are_left_out(self):
+        self.follow_all()
+        Follow.objects.get(user=self.users["lurker"]).delete()
+        with mock.patch.object(recommendations, "HUB_LIMIT", 2):
+            recommendations.rebuild(workers=1)
+            self.assertEqual([row.author.username for row in recommendations.for_user(self.users["viewer"])], ["fan"])
+            self.follow("reader", "second")
+            self.assertEqual(Suggestion.objects.filter(author=self.users["reader"]).count(), 0)
+
+    def test_suggestions_view(self):
+        self.follow_all()
+        recommendations.rebuild(workers=1)
+        url = reverse("follow_suggestions")
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(self.users["viewer"])
+        with self.assertNumQueries(2):
+            results = self.client.get(url).json()["results"]
+        self.assertEqual([result["username"] for result in results], ["fan", "reader"])
+        self.assertEqual(results[0]["url"], reverse("profile", args=["fan"]))
+
+
+class CountersTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username="testuser",
+            email="test@test.com",
+            password="12345"
+        )
+        self.author = User.objects.create_user(
+            username="testauthor",
+            email="author@test.com",
+            password="12345"
+        )
+        self.post = Post.objects.create(text="Random clever text", author=self.author)
+        self.client.login(username="testuser", password="12345")
+
+    def test_counters_follow_writes(self):
+        Post.objects.create(text="Second", author=self.author)
+        self.client.get(reverse("profile_follow", args=[self.author.username]))
+        self.client.post(reverse("add_comment", args=[self.author.username, self.post.pk]), {"text": "Hi"})
+        stats = UserStats.objects.get(user=self.author)
+        self.assertEqual((stats.posts_count, stats.followers_count, stats.following_count), (2, 1, 0))
+        self.assertEqual(UserStats.objects.get(user=self.user).following_count, 1)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 1)
+
+        response = self.client.get(reverse("profile", args=[self.author.username]))
+        self.assertContains(response, "Подписчиков: 1")
+        self.assertContains(response, "Записей: 2")
+
+        self.client.get(reverse("profile_unfollow", args=[self.author.username]))
+        Comment.objects.get(post=self.post).delete()
+        self.post.delete()
+        stats.refresh_from_db()
+        self.assertEqual((stats.posts_count, stats.followers_count), (1, 0))
+
+    def test_deleting_a_user(self):
+        Follow.objects.create(user=self.user, author=self.author)
+        Follow.objects.create(user=self.author, author=self.user)
+        Post.objects.create(text="Own post", author=self.user)
+        Comment.objects.create(post=self.post, author=self.user, text="Hi")
+        user_id = self.user.pk
+        self.user.delete()
+        connection.check_constraints()
+        self.assertFalse(UserStats.objects.filter(user_id=user_id).exists())
+        stats = UserStats.objects.get(user=self.author)
+        self.assertEqual((stats.posts_count, stats.followers_count, stats.following_count), (1, 0, 0))
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 0)
+
+    def test_reconcile_counters(self):
+        Comment.objects.bulk_create([Comment(post=self.post, author=self.user, text="Bulk") for _ in range(3)])
+        UserStats.objects.filter(user=self.author).update(posts_count=42)
+        UserStats.objects.filter(user=self.user).delete()
+        untouched = Post.objects.create(text="In sync", author=self.author)
+        call_command("reconcile_counters", stdout=io.StringIO())
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 3)
+        self.assertEqual(Post.objects.get(pk=untouched.pk).version, untouched.version)
+        self.assertEqual(UserStats.objects.get(user=self.author).posts_count, 2)
+        self.assertEqual(UserStats.objects.get(user=self.user).posts_count, 0)
+
+
+class PostCardCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username="testuser",
+            email="test@test.com",
+            password="12345"
+        )
+        self.post = Post.objects.create(text="Random clever text", author=self.user)
+        self.client.login(username="testuser", password="12345")
+
+    def test_cards_are_reused(self):
+        before = cards.stats.snapshot()
+        self.client.get(reverse("profile", args=[self.user.username]))
+        self.client.get(reverse("index"))
+        after = cards.stats.snapshot()
+        self.assertEqual(after["misses"] - before["misses"], 1)
+        self.assertEqual(after["hits"] - before["hits"], 1)
+
+    def test_edit_is_visible_right_away(self):
+        profile_url = reverse("profile", args=[self.user.username])
+        post_url = reverse("post", args=[self.user.username, self.post.pk])
+        self.assertContains(self.client.get(profile_url), "Random clever text")
+        self.client.post(reverse("post_edit", args=[self.user.username, self.post.pk]), {"text": "Edited text"})
+        self.assertContains(self.client.get(profile_url), "Edited text")
+        self.assertContains(self.client.get(post_url), "Edited text")
+
+    def test_group_rename_is_visible_right_away(self):
+        group = Group.objects.create(title="Old title", slug="renamed")
+        Post.objects.filter(pk=self.post.pk).update(group=group)
+        self.assertContains(self.client.get(reverse("index")), "Old title")
+        group.title = "New title"
+        group.save()
+        response = self.client.get(reverse("index"))
+        self.assertContains(response, "New title")
+        self.assertNotContains(response, "Old title")
+
+    def test_comment_updates_card(self):
+        self.assertContains(self.client.get(reverse("profile", args=[self.user.username])), "Добавить комментарий")
+        self.client.post(reverse("add_comment", args=[self.user.username, self.post.pk]), {"text": "Hi"})
+        self.assertContains(self.client.get(reverse("profile", args=[self.user.username])), "1 комментариев")
+
+
+class PageCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username="testuser",
+            email="test@test.com",
+            password="12345"
+        )
+        self.group = Group.objects.create(title="Test title", slug="testgroupf", description="Test description")
+        Post.objects.create(text="First post", author=self.user, group=self.group)
+
+    def test_pages_are_served_from_cache(self):
+        for url in (reverse("index"), reverse("group", args=[self.group.slug]),
+                    reverse("profile", args=[self.user.username])):
+            first = self.client.get(url)
+            # Only the validators query of the conditional GET layer
+            with self.assertNumQueries(1):
+                second = self.client.get(url)
+            self.assertEqual(first.content, second.content)
+
+    def test_new_post_is_visible_right_away(self):
+        urls = (reverse("index"), reverse("group", args=[self.group.slug]),
+                reverse("profile", args=[self.user.username]))
+        for url in urls:
+            self.client.get(url)
+        Post.objects.create(text="Second post", author=self.user, group=self.group)
+        for url in urls:
+            self.assertContains(self.client.get(url), "Second post")
+
+    def test_pages_are_cached_per_user(self):
+        self.client.get(reverse("index"))
+        self.client.login(username="testuser", password="12345")
+        self.assertContains(self.client.get(reverse("index")), "Пользователь: testuser")
+
+
+class SQLiteCacheTestCase(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = SQLiteCache(os.path.join(self.directory.name, "cache.sqlite3"), {})
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_get_set_many(self):
+        self.cache.set("text", "value")
+        self.cache.set_many({"number": 1, "data": {"a": [1, 2]}})
+        self.assertEqual(self.cache.get("text"), "value")
+        self.assertEqual(self.cache.get_many(["number", "data", "missing"]), {"number": 1, "data": {"a": [1, 2]}})
+        self.cache.delete("text")
+        self.assertIsNone(self.cache.get("text"))
+
+    def test_add_and_expiry(self):
+        self.assertTrue(self.cache.add("key", "first"))
+        self.assertFalse(self.cache.add("key", "second"))
+        self.assertEqual(self.cache.get("key"), "first")
+        self.cache.set("gone", "value", 0)
+        self.assertFalse(self.cache.has_key("gone"))
+        self.assertTrue(self.cache.add("gone", "again"))
+
+    def test_incr(self):
+        self.cache.set("counter", 1)
+        self.assertEqual(self.cache.incr("counter", 5), 6)
+        self.assertEqual(self.cache.get("counter"), 6)
+        with self.assertRaises(ValueError):
+            self.cache.incr("missing")
+
+    def test_shared_between_instances(self):
+        other = SQLiteCache(self.cache._location, {})
+        self.cache.set("shared", "value")
+        self.assertEqual(other.get("shared"), "value")
+        other.set("counter", 1)
+        self.assertEqual(self.cache.incr("counter"), 2)
+
+    def test_cull_keeps_entries_that_never_expire(self):
+        small = SQLiteCache(self.cache._location, {"OPTIONS": {"MAX_ENTRIES": 4, "CULL_FREQUENCY": 2}})
+        small.set("generation", 1, None)
+        for n in range(5):
+            small.set(f"page{n}", "html", 60 + n)
+        small._cull(small._connection())
+        self.assertEqual(small.get("generation"), 1)
+        self.assertEqual(sorted(small.get_many([f"page{n}" for n in range(5)])), ["page3", "page4"])
+
+    def test_take_token(self):
+        with mock.patch("yatube.sqlite_cache.time.time", return_value=1000.0) as clock:
+            self.assertEqual([self.cache.take_token("bucket", 2, 3) for _ in range(4)], [True, True, True, False])
+            clock.return_value = 1002.0
+            self.assertEqual([self.cache.take_token("bucket", 2, 3) for _ in range(2)], [True, False])
+            clock.return_value = 1100.0
+            self.assertEqual([self.cache.take_token("bucket", 2, 3) for _ in range(4)], [True, True, True, False])
+            clock.return_value = 1200.0
+            self.assertFalse(self.cache.take_token("costly", 2, 3, cost=4))
+            self.assertEqual([self.cache.take_token("costly", 2, 3, cost=2) for _ in range(2)], [True, False])
+            self.assertTrue(self.cache.take_token("costly", 2, 3))
+
+
+class RateLimitTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="writer", password="12345")
+        self.author = User.objects.create_user(username="author", password="12345")
+        self.client.force_login(self.user)
+
+    def test_new_post_gets_429_with_retry_after(self):
+        with mock.patch.dict(throttling.LIMITS, {"new_post": "2/m"}):
+            statuses = [self.client.post(reverse("new_post"), {"text": f"Post {n}"}).status_code for n in range(3)]
+            self.assertEqual(statuses, [302, 302, 429])
+            response = self.client.post(reverse("new_post"), {"text": "Again"})
+            self.assertEqual(response["Retry-After"], "30")
+            self.assertEqual(self.client.get(reverse("new_post")).status_code, 200)
+        self.assertEqual(Post.objects.filter(author=self.user).count(), 2)
+
+    def test_buckets_are_per_user_and_scope(self):
+        url = reverse("profile_follow", args=[self.author.username])
+        with mock.patch.dict(throttling.LIMITS, {"profile_follow": "1/h", "add_comment": "1/h"}):
+            self.assertEqual(self.client.get(url).status_code, 302)
+            self.assertEqual(self.client.get(url).status_code, 429)
+            post = Post.objects.create(text="Commented", author=self.author)
+            comment_url = reverse("add_comment", args=[self.author.username, post.pk])
+            self.assertEqual(self.client.post(comment_url, {"text": "Hi"}).status_code, 302)
+            self.client.force_login(self.author)
+            self.assertEqual(self.client.get(reverse("profile_follow", args=["writer"])).status_code, 302)
+
+    def test_staff_is_not_limited(self):
+        self.user.is_staff = True
+        self.user.save()
+        with mock.patch.dict(throttling.LIMITS, {"new_post": "1/m"}):
+            for n in range(3):
+                self.assertEqual(self.client.post(reverse("new_post"), {"text": f"Post {n}"}).status_code, 302)
+
+    def test_api_create(self):
+        auth = {"HTTP_AUTHORIZATION": f"Token {Token.objects.create(user=self.user).key}"}
+        with mock.patch.dict(throttling.LIMITS, {"api_new_post": "1/s"}):
+            self.assertEqual(self.client.post("/api/posts/", {"text": "First"}, **auth).status_code, 201)
+            response = self.client.post("/api/posts/", {"text": "Second"}, **auth)
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(response["Retry-After"], "1")
+            self.assertEqual(self.client.get("/api/posts/", **auth).status_code, 200)
+
+    def test_api_bulk_is_charged_per_post(self):
+        auth = {"HTTP_AUTHORIZATION": f"Token {Token.objects.create(user=self.user).key}"}
+
+        def bulk(count):
+            items = json.dumps([{"text": f"Bulk {n}"} for n in range(count)])
+            return self.client.post("/api/posts/bulk/", items, content_type="application/json", **auth)
+
+        with mock.patch.dict(throttling.LIMITS, {"api_new_post": "1/s", "api_bulk_post": "5/m"}):
+            self.assertEqual(bulk(3).status_code, 201)
+            response = bulk(3)
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(response["Retry-After"], "36")
+            self.assertEqual(bulk(2).status_code, 201)
+        self.assertEqual(Post.objects.filter(author=self.user).count(), 5)
+
+    def test_check_is_one_statement(self):
+        statements = []
+        connection = cache._connection()
+        connection.set_trace_callback(statements.append)
+        try:
+            request = RequestFactory().post("/new/")
+            request.user = self.user
+            with mock.patch.dict(throttling.LIMITS, {"new_post": "1/m"}):
+                self.assertEqual(throttling.take("new_post", request), 0)
+                self.assertEqual(throttling.take("new_post", request), 60)
+        finally:
+            connection.set_trace_callback(None)
+        self.assertEqual(len(statements), 2)
+
+    def test_other_cache_backends_count_per_window(self):
+        request = RequestFactory().post("/new/", REMOTE_ADDR="10.0.0.1")
+        request.user = AnonymousUser()
+        locmem = {"default": LocMemCache("throttling", {})}
+        with mock.patch.object(throttling, "caches", locmem), mock.patch.dict(throttling.LIMITS, {"new_post": "2/h"}):
+            waits = [throttling.take("new_post", request) for _ in range(3)]
+        self.assertEqual(waits[:2], [0, 0])
+        self.assertEqual(waits[2], 3600)
+
+
+class ConditionalGetTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username="testuser",
+            email="test@test.com",
+            password="12345"
+        )
+        self.group = Group.objects.create(title="Test title", slug="testgroupf", description="Test description")
+        self.post = Post.objects.create(text="First post", author=self.user, group=self.group)
+        self.urls = (
+            reverse("index"),
+            reverse("group", args=[self.group.slug]),
+            reverse("profile", args=[self.user.username]),
+            reverse("post", args=[self.user.username, self.post.pk]),
+        )
+
+    def test_not_modified(self):
+        for url in self.urls:
+            response = self.client.get(url)
+            self.assertTrue(response.has_header("ETag"))
+            revalidated = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+            self.assertEqual(revalidated.status_code, 304)
+            self.assertEqual(revalidated.content, b"")
+            since = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+            self.assertEqual(since.status_code, 304)
+
+    def test_changes_invalidate_validators(self):
+        etags = [self.client.get(url)["ETag"] for url in self.urls]
+        Comment.objects.create(post=self.post, author=self.user, text="New comment")
+        for url, etag in zip(self.urls, etags):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_bulk_created_post_changes_validators(self):
+        etag = self.client.get(reverse("index"))["ETag"]
+        Post.objects.bulk_create([Post(text="Bulk post", author=self.user)])
+        self.assertEqual(self.client.get(reverse("index"), HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_api_not_modified(self):
+        token = Token.objects.create(user=self.user)
+        response = self.client.get("/api/posts/", HTTP_AUTHORIZATION=f"Token {token.key}")
+        revalidated = self.client.get("/api/posts/", HTTP_AUTHORIZATION=f"Token {token.key}",
+                                      HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(revalidated.status_code, 304)
+
+
+class RenditionsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.media = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media.name)
+        self.settings_override.enable()
+        os.makedirs(os.path.join(self.media.name, "posts"))
+        Image.new("RGB", (300, 200), "red").save(os.path.join(self.media.name, "posts", "red.png"))
+        self.user = User.objects.create_user(
+            username="testuser",
+            email="test@test.com",
+            password="12345"
+        )
+        self.post = Post.objects.create(text="With image", author=self.user, image="posts/red.png")
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.media.cleanup()
+
+    def test_render_renditions(self):
+        source = os.path.join(self.media.name, "posts", "red.png")
+        written = imaging.render_renditions(source, renditions.targets("posts/red.png"))
+        self.assertEqual(len(written), len(renditions.RENDITIONS))
+        for rendition, (width, height, image_format) in renditions.RENDITIONS.items():
+            with Image.open(os.path.join(self.media.name, renditions.rendition_name("posts/red.png", rendition))) as image:
+                self.assertEqual((image.size, image.format), ((width, height), image_format))
+
+    def test_placeholder_until_rendered(self):
+        response = self.client.get(reverse("post", args=[self.user.username, self.post.pk]))
+        self.assertContains(response, renditions.PLACEHOLDER)
+        call_command("warm_renditions", workers=1, stdout=io.StringIO())
+        self.assertTrue(renditions.is_complete("posts/red.png"))
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.version, 2)
+        response = self.client.get(reverse("post", args=[self.user.username, self.post.pk]))
+        self.assertNotContains(response, renditions.PLACEHOLDER)
+        self.assertContains(response, "renditions/card/posts/red.jpg")
+
+
+class ContentAddressedImagesTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.media = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media.name)
+        self.settings_override.enable()
+        self.user = User.objects.create_user(
+            username="testuser",
+            email="test@test.com",
+            password="12345"
+        )
+        self.client.login(username="testuser", password="12345")
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.media.cleanup()
+
+    def upload(self, name):
+        image = io.BytesIO()
+        Image.new("RGB", (40, 30), "blue").save(image, "PNG")
+        image.seek(0)
+        image.name = name
+        self.client.post(reverse("new_post"), {"text": f"Post with {name}", "image": image})
+        return Post.objects.get(text=f"Post with {name}")
+
+    def test_identical_uploads_are_stored_once(self):
+        first = self.upload("first.png")
+        second = self.upload("second.PNG")
+        self.assertEqual(first.image.name, second.image.name)
+        digest = os.path.splitext(os.path.basename(first.image.name))[0]
+        self.assertEqual(len(digest), 64)
+        self.assertTrue(first.image.name.startswith(f"posts/{digest[:2]}/{digest[2:4]}/"))
+        stored = [files for _, _, files in os.walk(os.path.join(self.media.name, "posts")) if files]
+        self.assertEqual(stored, [[f"{digest}.png"]])
+
+    def test_normalize_original(self):
+        path = os.path.join(self.media.name, "large.jpg")
+        exif = Image.Exif()
+        exif[0x010e] = "Holiday"
+        Image.new("RGB", (3000, 1500), "green").save(path, "JPEG", exif=exif)
+        self.assertTrue(imaging.normalize_original(path, 1000))
+        with Image.open(path) as image:
+            self.assertEqual(image.size, (1000, 500))
+            self.assertEqual(dict(image.getexif()), {})
+        self.assertFalse(imaging.normalize_original(path, 1000))
+
+
+class SearchTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username="testuser", password="12345")
+        self.group = Group.objects.create(title="Test title", slug="testgroup", description="Test description")
+        self.cat = Post.objects.create(text="Кошка спит на диване", author=self.user, group=self.group)
+        self.dog = Post.objects.create(text="Собака спит во дворе", author=self.user)
+        self.cats = Post.objects.create(text="Кошка, кошка и ещё одна кошка", author=self.user)
+
+    def texts(self, query, **kwargs):
+        return [post.text for post in search.search(query, 10, **kwargs)]
+
+    def test_ranked_matches(self):
+        self.assertEqual(self.texts("КОШКА"), [self.cats.text, self.cat.text])
+        self.assertEqual(self.texts("спит"), [self.cat.text, self.dog.text])
+        self.assertEqual(self.texts("кошка двор"), [])
+        self.assertEqual(self.texts("кошка", group=self.group), [self.cat.text])
+
+    def test_query_syntax_is_not_interpreted(self):
+        for query in ('"', "кошка AND (", "NEAR(*", "   ", "-"):
+            search.search(query, 10)
+        self.assertEqual(self.texts('кошка" OR "собака'), [])
+
+    def test_index_follows_posts(self):
+        self.dog.text = "Собака лает"
+        self.dog.save()
+        self.cat.delete()
+        self.assertEqual(self.texts("спит"), [])
+        self.assertEqual(self.texts("лает"), [self.dog.text])
+        Post.objects.bulk_create([Post(text="Массовая кошка", author=self.user)])
+        self.assertIn("Массовая кошка", self.texts("кошка"))
+
+    def test_cursor_pages(self):
+        Post.objects.bulk_create([Post(text=f"Рыба номер {n}", author=self.user) for n in range(25)])
+        page, seen = search.search("рыба", 10), []
+        while True:
+            seen.extend(post.pk for post in page)
+            if not page.has_next():
+                break
+            page = search.search("рыба", 10, page.next_cursor)
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(len(set(seen)), 25)
+
+    def test_views(self):
+        response = self.client.get(reverse("search"), {"q": "кошка", "group": self.group.slug})
+        self.assertEqual([post.pk for post in response.context["page"]], [self.cat.pk])
+        self.assertEqual(self.client.get(reverse("search"), {"group": "missing", "q": "x"}).status_code, 404)
+
+        token = Token.objects.create(user=self.user)
+        response = self.client.get("/api/search/", {"q": "собака"}, HTTP_AUTHORIZATION=f"Token {token.key}")
+        self.assertEqual([post["text"] for post in response.json()["results"]], [self.dog.text])
+
+        admin = User.objects.create_superuser("admin", "admin@test.com", "12345")
+        self.client.force_login(admin)
+        response = self.client.get(reverse("admin:posts_post_changelist"), {"q": "собака"})
+        self.assertEqual([post.pk for post in response.context["cl"].result_list], [self.dog.pk])
+
+    def test_rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {search.TABLE}_data")
+        call_command("rebuild_search_index", stdout=io.StringIO())
+        self.assertEqual(self.texts("собака"), [self.dog.text])
+
+
+class BulkPostsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username="testuser", password="12345")
+        self.follower = User.objects.create_user(username="follower", password="12345")
+        Follow.objects.create(user=self.follower, author=self.user)
+        self.group = Group.objects.create(title="Test title", slug="testgroup", description="Test description")
+        token = Token.objects.create(user=self.user)
+        self.auth = {"HTTP_AUTHORIZATION": f"Token {token.key}"}
+
+    def post_bulk(self, items, ndjson=False):
+        if ndjson:
+            body = "\n".join(json.dumps(item) for item in items)
+            return self.client.post("/api/posts/bulk/", body, content_type="application/x-ndjson", **self.auth)
+        return self.client.post("/api/posts/bulk/", json.dumps(items), content_type="application/json", **self.auth)
+
+    def test_create_reports_errors_per_item(self):
+        response = self.post_bulk([
+            {"text": "First", "group": "testgroup"},
+            {"group": "testgroup"},
+            {"text": "Third", "group": "missing"},
+            {"text": "Fourth"},
+        ])
+        self.assertEqual(response.status_code, 207)
+        results = response.json()["results"]
+        self.assertEqual([result["index"] for result in results], [0, 1, 2, 3])
+        self.assertIn("text", results[1]["errors"])
+        self.assertIn("group", results[2]["errors"])
+        first, fourth = Post.objects.get(pk=results[0]["id"]), Post.objects.get(pk=results[3]["id"])
+        self.assertEqual((first.text, first.group, first.author), ("First", self.group, self.user))
+        self.assertEqual((fourth.text, fourth.group), ("Fourth", None))
+        self.assertEqual(UserStats.for_user(self.user).posts_count, 2)
+        self.assertEqual(TimelineEntry.objects.filter(user=self.follower).count(), 2)
+
+    def test_ndjson_in_constant_queries(self):
+        def create(count):
+            items = [{"text": f"Post {n}", "group": "testgroup"} for n in range(count)]
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.post_bulk(items, ndjson=True).status_code, 201)
+            return len(queries)
+        create(1)  # caches the token
+        self.assertEqual(create(2), create(40))
+        self.assertEqual(Post.objects.filter(group=self.group).count(), 43)
+        self.assertEqual(self.post_bulk([], ndjson=True).status_code, 400)
+        response = self.client.post("/api/posts/bulk/", '{"text": "x"}\n{broken',
+                                    content_type="application/x-ndjson", **self.auth)
+        self.assertEqual(response.status_code, 400)
+
+    def test_partial_update(self):
+        own = Post.objects.create(text="Own post", author=self.user)
+        other = Post.objects.create(text="Other post", author=self.follower)
+        response = self.client.patch("/api/posts/bulk/", json.dumps([
+            {"id": own.pk, "group": "testgroup"},
+            {"id": other.pk, "text": "Hijacked"},
+            {"text": "No id"},
+        ]), content_type="application/json", **self.auth)
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([result.get("id") for result in response.json()["results"]], [own.pk, None, None])
+        own_before = own.version
+        own.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((own.text, own.group, own.version), ("Own post", self.group, own_before + 1))
+        self.assertEqual(other.text, "Other post")
+
+    def test_single_create_sets_author(self):
+        response = self.client.post("/api/posts/", {"text": "Single"}, **self.auth)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Post.objects.get(text="Single").author, self.user)
+
+
+class PostProjectionTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username="testuser", first_name="Test", password="12345")
+        self.group = Group.objects.create(title="Test title", slug="testgroup", description="Test description")
+        self.plain = Post.objects.create(text="Plain post", author=self.user)
+        self.full = Post.objects.create(text="Full post", author=self.user, group=self.group,
+                                        image="posts/ab/cd/abcd.jpg")
+        token = Token.objects.create(user=self.user)
+        self.auth = {"HTTP_AUTHORIZATION": f"Token {token.key}"}
+
+    def get(self, url, **params):
+        return self.client.get(url, params, **self.auth)
+
+    def test_default_output_matches_serializer(self):
+        request = RequestFactory().get("/api/posts/")
+        expected = PostSerializer([self.full, self.plain], many=True, context={"request": request}).data
+        self.assertEqual(self.get("/api/posts/").json()["results"], json.loads(json.dumps(expected)))
+        detail = self.get(f"/api/posts/{self.full.pk}/").json()
+        self.assertEqual(detail, json.loads(json.dumps(expected[0])))
+        self.assertEqual(self.get("/api/posts/999999/").status_code, 404)
+        self.assertEqual(self.get("/api/posts/abc/").status_code, 404)
+
+    def test_fields_and_expand(self):
+        response = self.get("/api/posts/", fields="id,pub_date,author", expand="group")
+        plain, full = response.json()["results"][::-1]
+        self.assertEqual(list(full), ["id", "pub_date", "author", "group"])
+        self.assertEqual(full["id"], self.full.pk)
+        self.assertEqual(full["author"], "testuser")
+        self.assertEqual(full["group"], {"slug": "testgroup", "title": "Test title", "description": "Test description"})
+        self.assertIsNone(plain["group"])
+        self.assertTrue(full["pub_date"].endswith("Z"))
+        author = self.get("/api/posts/", fields="text", expand="author").json()["results"][0]["author"]
+        self.assertEqual(author, {"id": self.user.pk, "username": "testuser", "first_name": "Test", "last_name": ""})
+        self.assertEqual(self.get("/api/posts/", fields="text,password").status_code, 400)
+        self.assertEqual(self.get("/api/posts/", expand="comments").status_code, 400)
+
+    def test_detail_checks_object_permissions(self):
+        class OwnPostsOnly(permissions.BasePermission):
+            def has_object_permission(self, request, view, obj):
+                return False
+
+        with mock.patch.object(views.PostViewSet, "permission_classes", [OwnPostsOnly]):
+            self.assertEqual(self.get(f"/api/posts/{self.full.pk}/").status_code, 403)
+
+    def test_pages_of_rows(self):
+        Post.objects.bulk_create([Post(text=f"Post {n}", author=self.user) for n in range(15)])
+        first = self.get("/api/posts/", fields="id").json()
+        second = self.client.get(first["next"], **self.auth).json()
+        ids = [post["id"] for post in first["results"] + second["results"]]
+        self.assertEqual(len(ids), 17)
+        self.assertEqual(len(set(ids)), 17)
+
+    def test_renderer_matches_stock_json(self):
+        data = {"text": "Привет", "when": self.full.pub_date, "items": [1, None, {"a": "b"}]}
+        self.assertEqual(json.loads(ORJSONRenderer().render(data)), json.loads(JSONRenderer().render(data)))
+
+
+class QueryPlanTestCase(TestCase):
+    def test_views_avoid_scans_and_sorts(self):
+        output = io.StringIO()
+        command = explain_views.Command(stdout=output)
+        with override_settings(CACHES=explain_views.NO_CACHE):
+            problems = command.explain_views()
+        self.assertEqual(problems, 0, output.getvalue())
+
+    def test_follow_is_unique(self):
+        user = User.objects.create_user(username="testuser", password="12345")
+        author = User.objects.create_user(username="testauthor", password="12345")
+        Follow.objects.create(user=user, author=author)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Follow.objects.create(user=user, author=author)
+
+
+class DatabaseRoutingTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username="testuser", password="12345")
+        self.post = Post.objects.create(text="First post", author=self.user)
+
+    def routed_alias(self, method="get", cookies=None):
+        @databases.read_from_replica
+        def view(request):
+            return router.db_for_read(Post)
+        request = getattr(RequestFactory(), method)("/")
+        request.COOKIES.update(cookies or {})
+        with mock.patch("yatube.databases.replica_available", return_value=True):
+            return view(request)
+
+    def test_reads_of_decorated_views_go_to_replica(self):
+        self.assertEqual(self.routed_alias(), "replica")
+        self.assertEqual(self.routed_alias("post"), "default")
+        self.assertEqual(self.routed_alias(cookies={databases.PIN_COOKIE: "1"}), "default")
+        self.assertEqual(router.db_for_read(Post), "default")
+        self.assertEqual(router.db_for_write(Post), "default")
+        # In tests the replica mirrors the primary, so it is never used.
+        self.assertFalse(databases.replica_available())
+
+    def test_writes_pin_client_to_primary(self):
+        self.client.login(username="testuser", password="12345")
+        self.assertNotIn(databases.PIN_COOKIE, self.client.get(reverse("index")).cookies)
+        response = self.client.post(reverse("add_comment", args=["testuser", self.post.pk]), {"text": "Hi"})
+        self.assertEqual(response.cookies[databases.PIN_COOKIE]["max-age"], databases.STICKY_SECONDS)
+
+    def test_staleness_of_replica_reads(self):
+        @databases.read_from_replica
+        def stale(request):
+            return databases.may_be_stale(time.time() - 1), databases.may_be_stale(time.time() - 60)
+        with mock.patch("yatube.databases.replica_available", return_value=True):
+            # Without a recorded sync the replica is assumed to catch up in STICKY_SECONDS.
+            self.assertEqual(stale(RequestFactory().get("/")), (True, False))
+            databases.mark_synced(time.time() - 120)
+            self.assertEqual(stale(RequestFactory().get("/")), (True, True))
+            databases.mark_synced(time.time())
+            self.assertEqual(stale(RequestFactory().get("/")), (False, False))
+        self.assertFalse(databases.may_be_stale(time.time()))
+
+    def test_pages_of_fresh_generations_are_filled_from_primary(self):
+        @databases.read_from_replica
+        @page_cache.cache_by_generation(lambda: [page_cache.GLOBAL])
+        def page(request):
+            return HttpResponse(router.db_for_read(Post))
+        request = RequestFactory().get("/page/")
+        request.user = self.user
+        with mock.patch("yatube.databases.replica_available", return_value=True):
+            with mock.patch("posts.page_cache.may_be_stale", return_value=True):
+                self.assertEqual(page(request).content, b"default")
+            self.assertEqual(page(request).content, b"default")
+
+        with mock.patch("posts.conditional.may_be_stale", return_value=True):
+            self.assertFalse(self.client.get(reverse("index")).has_header("ETag"))
+
+    def test_comment_pages_of_fresh_generations_are_read_from_primary(self):
+        read_from = []
+        get_page = comments.CursorPaginator.get_page
+
+        def recording(paginator, cursor=None):
+            read_from.append(router.db_for_read(Comment))
+            with databases.replica_reads(False):
+                return get_page(paginator, cursor)
+
+        @databases.read_from_replica
+        def thread(request):
+            return comments.get_page(self.post.pk)
+
+        with mock.patch("yatube.databases.replica_available", return_value=True), \
+                mock.patch.object(comments.CursorPaginator, "get_page", recording):
+            with mock.patch("posts.comments.may_be_stale", return_value=True):
+                thread(RequestFactory().get("/"))
+            cache.clear()
+            with mock.patch("posts.comments.may_be_stale", return_value=False):
+                thread(RequestFactory().get("/"))
+        self.assertEqual(read_from, ["default", "replica"])
+
+    def test_copy_database(self):
+        with tempfile.TemporaryDirectory() as directory:
+            source, target = os.path.join(directory, "db.sqlite3"), os.path.join(directory, "replica.sqlite3")
+            with sqlite3.connect(source) as db:
+                db.execute("CREATE TABLE t (value)")
+                db.execute("INSERT INTO t VALUES (1)")
+            databases.copy_database(source, target)
+            with sqlite3.connect(source) as db:
+                db.execute("INSERT INTO t VALUES (2)")
+            databases.copy_database(source, target)
+            replica = sqlite3.connect(target)
+            self.assertEqual(replica.execute("SELECT value FROM t").fetchall(), [(1,), (2,)])
+            replica.close()
+
+
+class BenchCommandTestCase(TestCase):
+    options = {
+        "users": 20, "groups": 2, "posts": 100, "follows": 5, "comments": 1, "seed": 7,
+        "repeat": 3, "warmup": 1, "no_cache": False,
+    }
+
+    def setUp(self):
+        cache.clear()
+
+    def test_times_every_view(self):
+        results = bench.Command().run(self.options)
+        self.assertEqual(results["dataset"]["posts"], 100)
+        self.assertEqual(UserStats.objects.aggregate(posts=Sum("posts_count"))["posts"], 101)
+        for name in ("index", "profile", "post", "profile_follow", "api posts"):
+            view = results["views"][name]
+            self.assertLessEqual(view["p50_ms"], view["p95_ms"])
+            self.assertLessEqual(view["p95_ms"], view["p99_ms"])
+            self.assertGreater(view["queries"], 0)
+        self.assertGreater(results["views"]["index"]["bytes"], 0)
+
+    def test_dataset_is_reproducible(self):
+        with transaction.atomic():
+            first = bench.seed_dataset(users=10, posts=50, seed=3)
+            authors = list(Post.objects.order_by("pk").values_list("author__username", "text"))
+            transaction.set_rollback(True)
+        self.assertEqual(bench.seed_dataset(users=10, posts=50, seed=3), first)
+        self.assertEqual(list(Post.objects.order_by("pk").values_list("author__username", "text")), authors)
+
+    def test_compare_reports_regressions(self):
+        baseline = {"views": {"index": {"p95_ms": 10.0, "queries": 3}}}
+        self.assertEqual(bench.compare({"views": {"index": {"p95_ms": 12.0, "queries": 3}}}, baseline, 0.25), [])
+        regressions = bench.compare({"views": {"index": {"p95_ms": 20.0, "queries": 4}}}, baseline, 0.25)
+        self.assertEqual(len(regressions), 2)
+
+
+class RequestProfilingTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username="testuser", password="12345")
+        Post.objects.create(text="First post", author=self.user)
+
+    def test_server_timing_header(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("index"))
+        timing = dict(
+            (part.split(";")[0], part) for part in response["Server-Timing"].split(", ") if ";" in part
+        )
+        self.assertEqual(set(timing), {"db", "tpl", "cache", "total"})
+        self.assertIn(f'desc="{len(queries)} queries"', timing["db"])
+        self.assertGreater(float(timing["tpl"].split("dur=")[1]), 0)
+        # The page is cached by the first request.
+        self.assertIn("hits", self.client.get(reverse("index"))["Server-Timing"])
+
+    def test_log_line(self):
+        with self.assertLogs("yatube.requests", "INFO") as logs:
+            self.client.get(reverse("profile", args=[self.user.username]))
+        self.assertEqual(len(logs.records), 1)
+        line = logs.records[0].getMessage()
+        self.assertIn("path=/testuser/ status=200", line)
+        self.assertRegex(line, r"queries=\d+ template_ms=[\d.]+ cache_ms=[\d.]+ cache_hits=\d+ cache_misses=\d+$")
+
+    def test_slow_sampled_requests_are_dumped(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with mock.patch.multiple(profiling, SAMPLE_RATE=1.0, SLOW_MS=0, PROFILE_DIR=directory):
+                self.client.get(reverse("index"))
+            with mock.patch.multiple(profiling, SAMPLE_RATE=1.0, SLOW_MS=60000, PROFILE_DIR=directory):
+                self.client.get(reverse("index"))
+            dumps = os.listdir(directory)
+            self.assertEqual(len(dumps), 1)
+            self.assertRegex(dumps[0], r"-GET-root-\d+ms\.prof$")
+            stats = pstats.Stats(os.path.join(directory, dumps[0]))
+            self.assertGreater(stats.total_calls, 0)
+
+
+class MetricsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        patcher = mock.patch.object(metrics, "METRICS_DIR", directory.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+        self.client = Client()
+        self.user = User.objects.create_user(username="testuser", password="12345")
+        Post.objects.create(text="First post", author=self.user)
+
+    def metric(self, cls, name, *args, **kwargs):
+        self.addCleanup(metrics.REGISTRY.pop, name)
+        return cls(name, "Test metric.", *args, **kwargs)
+
+    def test_requests_are_recorded_per_route(self):
+        self.client.get(reverse("index"))
+        self.client.get(reverse("index"))
+        self.client.get("/nobody/12345/")
+        text = self.client.get(reverse("metrics")).content.decode()
+        self.assertIn('yatube_http_request_duration_seconds_count{route="index",method="GET"} 2', text)
+        self.assertIn('yatube_http_responses_total{route="index",status="200"} 2', text)
+        self.assertIn('yatube_http_responses_total{route="post",status="404"} 1', text)
+        self.assertIn('yatube_http_request_queries_bucket{route="index",le="+Inf"} 2', text)
+        self.assertIn("# TYPE yatube_post_card_cache_lookups_total counter", text)
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = self.metric(metrics.Histogram, "yatube_test_seconds", ["route"], buckets=(0.005, 0.25))
+        for value in (0.003, 0.2, 0.25, 10):
+            histogram.observe(value, "index")
+        text = metrics.exposition()
+        self.assertIn('yatube_test_seconds_bucket{route="index",le="0.005"} 1', text)
+        self.assertIn('yatube_test_seconds_bucket{route="index",le="0.25"} 3', text)
+        self.assertIn('yatube_test_seconds_bucket{route="index",le="+Inf"} 4', text)
+        self.assertIn('yatube_test_seconds_sum{route="index"} 10.453', text)
+        self.assertIn('yatube_test_seconds_count{route="index"} 4', text)
+
+    def test_processes_are_added_up(self):
+        counter = self.metric(metrics.Counter, "yatube_test_events", ["kind"])
+        counter.inc("a", amount=2)
+        child = multiprocessing.get_context("fork").Process(target=lambda: [counter.inc("a") for _ in range(3)])
+        child.start()
+        child.join()
+        counter.inc("a")
+        self.assertEqual(counter.value("a"), 6)
+        self.assertEqual(len(os.listdir(metrics.METRICS_DIR)), 2)
+
+    def test_file_grows(self):
+        counter = self.metric(metrics.Counter, "yatube_test_keys", ["key"])
+        for n in range(3000):
+            counter.inc(f"key-{n}")
+        self.assertEqual(counter.value("key-2999"), 1)
+
+    def test_only_internal_hosts_and_staff(self):
+        url = reverse("metrics")
+        self.assertEqual(self.client.get(url, REMOTE_ADDR="10.0.0.1").status_code, 403)
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_login(self.user)
+        response = self.client.get(url, REMOTE_ADDR="10.0.0.1")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], metrics.CONTENT_TYPE)
+
+
+class ConcurrentLoadingTestCase(SimpleTestCase):
+    def test_gather_runs_on_the_pool(self):
+        with mock.patch.object(concurrency, "_serial", return_value=False):
+            names = concurrency.gather(*[lambda: threading.current_thread().name] * 3)
+        self.assertTrue(all(name.startswith("loader") for name in names))
+
+    def test_gather_is_serial_when_asked(self):
+        with concurrency.serial():
+            names = concurrency.gather(*[lambda: threading.current_thread().name] * 3)
+        self.assertEqual(names, [threading.current_thread().name] * 3)
+
+    def test_results_in_order_and_errors_raised(self):
+        with mock.patch.object(concurrency, "_serial", return_value=False):
+            self.assertEqual(concurrency.gather(lambda: time.sleep(0.02) or 1, lambda: 2), [1, 2])
+            with self.assertRaises(ZeroDivisionError):
+                concurrency.gather(lambda: 1, lambda: 1 / 0)
+
+    def test_replica_flag_is_carried_over(self):
+        with mock.patch.object(concurrency, "_serial", return_value=False), \
+                mock.patch("yatube.databases.replica_available", return_value=True), databases.replica_reads():
+            aliases = concurrency.gather(lambda: router.db_for_read(Post), lambda: router.db_for_read(Post))
+        self.assertEqual(aliases, [databases.REPLICA, databases.REPLICA])
+
+
+class ASGIHandlerTestCase(SimpleTestCase):
+    def call(self, wsgi_application, scope, body=b""):
+        messages = [{"type": "http.request", "body": body[:3], "more_body": True},
+                    {"type": "http.request", "body": body[3:], "more_body": False}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        scope = dict({"type": "http", "method": "GET", "path": "/", "query_string": b"", "headers": []}, **scope)
+        asyncio.run(ASGIHandler(wsgi_application, threads=2)(scope, receive, send))
+        return sent
+
+    def test_request_is_translated(self):
+        seen = {}
+
+        def application(environ, start_response):
+            seen.update(environ, body=environ["wsgi.input"].read())
+            start_response("201 Created", [("Content-Type", "text/plain"), ("Set-Cookie", "a=1")])
+            return [b"done"]
+
+        sent = self.call(application, {
+            "method": "POST", "path": "/путь/", "query_string": b"q=1",
+            "headers": [(b"content-type", b"application/json"), (b"x-token", b"a"), (b"x-token", b"b")],
+            "client": ("10.0.0.1", 5000),
+        }, body=b'{"text": 1}')
+        self.assertEqual(seen["REQUEST_METHOD"], "POST")
+        self.assertEqual(seen["PATH_INFO"].encode("latin1").decode(), "/путь/")
+        self.assertEqual(seen["QUERY_STRING"], "q=1")
+        self.assertEqual(seen["CONTENT_TYPE"], "application/json")
+        self.assertEqual(seen["HTTP_X_TOKEN"], "a,b")
+        self.assertEqual(seen["REMOTE_ADDR"], "10.0.0.1")
+        self.assertEqual(seen["body"], b'{"text": 1}')
+        self.assertEqual(sent[0]["status"], 201)
+        self.assertIn((b"set-cookie", b"a=1"), sent[0]["headers"])
+        self.assertEqual(sent[1:], [{"type": "http.response.body", "body": b"done", "more_body": False}])
+
+    def test_cookie_headers_are_joined_as_one_cookie_header(self):
+        seen = {}
+
+        def application(environ, start_response):
+            seen.update(environ)
+            start_response("200 OK", [])
+            return []
+
+        self.call(application, {"headers": [(b"cookie", b"a=1"), (b"cookie", b"sessionid=abc")]})
+        self.assertEqual(parse_cookie(seen["HTTP_COOKIE"]), {"a": "1", "sessionid": "abc"})
+
+    def test_streamed_response_stays_streamed(self):
+        def application(environ, start_response):
+            start_response("200 OK", [])
+            yield b"one"
+            yield b""
+            yield b"two"
+
+        sent = self.call(application, {})
+        self.assertEqual(
+            [(message.get("body"), message.get("more_body")) for message in sent[1:]],
+            [(b"one", True), (b"two", False)],
+        )
+
+
+class CommentThreadTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username="testuser", password="12345")
+        self.readers = [User.objects.create_user(username=f"reader{n}", password="12345") for n in range(3)]
+        self.post = Post.objects.create(text="Popular post", author=self.user)
+        for n in range(25):
+            Comment.objects.create(post=self.post, author=self.readers[n % 3], text=f"Comment number {n}")
+        self.post_url = reverse("post", args=[self.user.username, self.post.pk])
+        self.comments_url = reverse("post_comments", args=[self.user.username, self.post.pk])
+
+    def test_post_shows_newest_page(self):
+        # post counters, author with stats, post, comment page with authors
+        with self.assertNumQueries(4):
+            response = self.client.get(self.post_url)
+        page = response.context["comments"]
+        self.assertEqual(len(page), comments.PER_PAGE)
+        self.assertEqual(page[0]["text"], "Comment number 24")
+        self.assertContains(response, f"?comments={page.next_cursor}")
+        older = self.client.get(self.post_url, {"comments": page.next_cursor}).context["comments"]
+        self.assertEqual([comment["text"] for comment in older], [f"Comment number {n}" for n in range(4, -1, -1)])
+
+    def test_json_endpoint(self):
+        first = self.client.get(self.comments_url).json()
+        self.assertEqual(len(first["results"]), comments.PER_PAGE)
+        self.assertEqual(first["results"][0]["author"], "reader0")
+        self.assertTrue(first["results"][0]["created"].endswith("Z"))
+        second = self.client.get(first["next"]).json()
+        self.assertEqual(len(second["results"]), 5)
+        self.assertIsNone(second["next"])
+        missing = reverse("post_comments", args=[self.user.username, self.post.pk + 1])
+        self.assertEqual(self.client.get(missing).status_code, 404)
+        other_author = reverse("post_comments", args=[self.readers[0].username, self.post.pk])
+        self.assertEqual(self.client.get(other_author).status_code, 404)
+
+    def test_new_comment_only_invalidates_the_head(self):
+        cursor = comments.get_page(self.post.pk).next_cursor
+        comments.get_page(self.post.pk, cursor)
+        self.client.force_login(self.readers[0])
+        self.client.post(reverse("add_comment", args=[self.user.username, self.post.pk]), {"text": "Newest"})
+        with self.assertNumQueries(0):
+            older = comments.get_page(self.post.pk, cursor)
+        self.assertEqual(len(older), 5)
+        self.assertEqual(comments.get_page(self.post.pk)[0]["text"], "Newest")
+
+    def test_deleted_comment_invalidates_the_thread(self):
+        cursor = comments.get_page(self.post.pk).next_cursor
+        self.assertEqual(len(comments.get_page(self.post.pk, cursor)), 5)
+        Comment.objects.get(text="Comment number 0").delete()
+        self.assertEqual(len(comments.get_page(self.post.pk, cursor)), 4)
+
+
+class ImportTestCase(TestCase):
+    RECORDS = [
+        {"type": "user", "id": "1", "username": "leo", "first_name": "Leo"},
+        {"type": "user", "id": "2", "username": "existing"},
+        {"type": "group", "id": "7", "slug": "cats", "title": "Cats"},
+        {"type": "post", "id": "10", "author": "1", "group": "7", "text": "Imported cat", "pub_date": "2019-05-01T10:00:00Z"},
+        {"type": "post", "id": "11", "author": "2", "text": "Imported dog", "pub_date": "2019-05-02T10:00:00Z"},
+        {"type": "comment", "post": "10", "author": "2", "text": "Nice cat", "created": "2019-05-03T10:00:00Z"},
+        {"type": "comment", "post": "11", "author": "1", "text": "Nice dog"},
+        {"type": "follow", "user": "2", "author": "1"},
+    ]
+
+    def setUp(self):
+        cache.clear()
+        self.existing = User.objects.create_user(username="existing", password="12345")
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, "w") as file:
+            file.write(content)
+        return path
+
+    def ndjson(self):
+        return self.write("community.ndjson", "".join(json.dumps(record) + "\n" for record in self.RECORDS))
+
+    def import_file(self, path, *args):
+        call_command("import_yatube", path, *args, stdout=io.StringIO())
+
+    def assert_imported(self):
+        leo = User.objects.get(username="leo")
+        self.assertFalse(leo.has_usable_password())
+        self.assertEqual(User.objects.filter(username="existing").count(), 1)
+        cat = Post.objects.get(text="Imported cat")
+        self.assertEqual((cat.author, cat.group.slug, cat.pub_date.year), (leo, "cats", 2019))
+        self.assertEqual(Post.objects.get(text="Imported dog").author, self.existing)
+        self.assertEqual(Comment.objects.get(text="Nice cat").post, cat)
+        self.assertEqual(Comment.objects.count(), 2)
+        self.assertTrue(Follow.objects.filter(user=self.existing, author=leo).exists())
+        # Derived data is rebuilt afterwards.
+        self.assertEqual(Post.objects.get(pk=cat.pk).comment_count, 1)
+        self.assertEqual(UserStats.objects.get(user=leo).followers_count, 1)
+        self.assertEqual(list(search.filter_posts(Post.objects.all(), "cat")), [cat])
+        self.assertTrue(TimelineEntry.objects.filter(user=self.existing, post=cat).exists())
+
+    def test_ndjson_import(self):
+        self.import_file(self.ndjson(), "--chunk-size", "3")
+        self.assert_imported()
+        # The index triggers are back.
+        Post.objects.create(text="Another cat", author=self.existing)
+        self.assertEqual(search.filter_posts(Post.objects.all(), "cat").count(), 2)
+
+    def test_csv_import(self):
+        columns = ["type", "id", "username", "first_name", "slug", "title", "author", "group",
+                   "post", "user", "text", "pub_date", "created"]
+        lines = [",".join(columns)]
+        for record in self.RECORDS:
+            lines.append(",".join(json.dumps(record[column]) if column in record else "" for column in columns))
+        self.import_file(self.write("community.csv", "\n".join(lines) + "\n"))
+        self.assert_imported()
+
+    def test_resumes_after_a_crash(self):
+        path = self.ndjson()
+        write_chunk = importer.Importer.write_chunk
+        calls = []
+
+        def crash_on_third(run, *args):
+            calls.append(args)
+            if len(calls) == 3:
+                raise RuntimeError("Killed")
+            return write_chunk(run, *args)
+
+        with mock.patch.object(importer.Importer, "write_chunk", crash_on_third):
+            with self.assertRaises(RuntimeError):
+                self.import_file(path, "--chunk-size", "3")
+        self.assertEqual(ImportProgress.objects.get().line, 6)
+        self.assertEqual(Post.objects.count(), 2)
+
+        self.import_file(path, "--chunk-size", "3")
+        self.assert_imported()
+        self.assertTrue(ImportProgress.objects.get().finished)
+        # Running it again imports nothing twice.
+        self.import_file(path)
+        self.assertEqual(Post.objects.count(), 2)
+
+    def test_unknown_reference(self):
+        path = self.write("bad.ndjson", json.dumps({"type": "post", "author": "404", "text": "Orphan"}) + "\n")
+        with self.assertRaisesMessage(CommandError, "Line 1: unknown user '404' in author."):
+            self.import_file(path)
+        self.assertFalse(Post.objects.exists())
+
+    def test_failed_import_restores_the_index_triggers(self):
+        path = self.write("bad.ndjson", json.dumps({"type": "post", "author": "404", "text": "Orphan"}) + "\n")
+        with self.assertRaises(CommandError):
+            self.import_file(path, "--no-rebuild")
+        kitten = Post.objects.create(text="kitten", author=self.existing)
+        self.assertEqual(list(search.filter_posts(Post.objects.all(), "kitten")), [kitten])
+
+    def test_restart_after_committed_rows_is_refused(self):
+        path = self.ndjson()
+        self.import_file(path)
+        with self.assertRaisesMessage(CommandError, "Records up to line 8"):
+            self.import_file(path, "--restart")
+        self.assertEqual(Post.objects.count(), 2)
+        self.assertEqual(Comment.objects.count(), 2)
+
+
+class ExportTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username="testuser", password="12345")
+        self.author = User.objects.create_user(username="testauthor", password="12345")
+        self.group = Group.objects.create(title="Test title", slug="testgroup", description="Test description")
+        for n in range(5):
+            Post.objects.create(text=f"Exported post {n}", author=self.user, group=self.group if n % 2 else None)
+        other = Post.objects.create(text="Someone else's post", author=self.author)
+        Comment.objects.create(post=other, author=self.user, text="Exported comment")
+        Follow.objects.create(user=self.user, author=self.author)
+        self.client.force_login(self.user)
+
+    def export(self, **headers):
+        response = self.client.get(reverse("profile_export", args=[self.user.username]), **headers)
+        self.assertTrue(response.streaming)
+        return response, b"".join(response.streaming_content)
+
+    def parse(self, content):
+        return [json.loads(line) for line in content.decode().splitlines()]
+
+    def test_export(self):
+        response, content = self.export()
+        self.assertEqual(response["Content-Type"], export.CONTENT_TYPE)
+        records = self.parse(content)
+        self.assertEqual([record["type"] for record in records], ["user", "group"] + ["post"] * 5 + ["comment", "follow"])
+        self.assertEqual(records[0]["username"], "testuser")
+        self.assertEqual([record["text"] for record in records[2:7]], [f"Exported post {n}" for n in range(5)])
+        self.assertEqual(records[1]["id"], str(self.group.pk))
+        self.assertEqual(records[3]["group"], str(self.group.pk))
+        self.assertEqual(records[-1]["author_username"], "testauthor")
+        self.assertNotIn("Someone else's post", content.decode())
+
+    def test_gzip_while_streaming(self):
+        plain = self.export()[1]
+        response, content = self.export(HTTP_ACCEPT_ENCODING="gzip, deflate")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response["Vary"])
+        self.assertEqual(gzip.decompress(content), plain)
+
+    def test_keyset_batches(self):
+        with mock.patch.object(export, "BATCH_SIZE", 2), CaptureQueriesContext(connection) as queries:
+            records = list(export.records(self.user))
+        self.assertEqual(len(records), 9)
+        # groups 1, posts 3 (2 + 2 + 1), comments 1, follows 1.
+        self.assertEqual(len(queries), 6)
+        self.assertTrue(all("OFFSET" not in query["sql"] for query in queries))
+
+    def test_only_for_the_user_and_staff(self):
+        self.client.force_login(self.author)
+        response = self.client.get(reverse("profile_export", args=[self.user.username]))
+        self.assertEqual(response.status_code, 403)
+        self.author.is_staff = True
+        self.author.save()
+        self.assertEqual(self.client.get(reverse("profile_export", args=[self.user.username])).status_code, 200)
+
+    def test_command_and_import(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "testuser.ndjson.gz")
+            call_command("export_user", "testuser", "--output", path, stdout=io.StringIO())
+            with gzip.open(path) as file:
+                records = self.parse(file.read())
+            self.assertEqual(len(records), 9)
+            # Posts and groups import back; the user and group are merged.
+            posts_only = os.path.join(directory, "posts.ndjson")
+            with open(posts_only, "w") as file:
+                for record in records:
+                    if record["type"] in ("user", "group", "post"):
+                        file.write(json.dumps(record) + "\n")
+            call_command("import_yatube", posts_only, stdout=io.StringIO())
+        self.assertEqual(Post.objects.filter(author=self.user, text="Exported post 1", group=self.group).count(), 2)
+
+
+class StaticBuildTestCase(TestCase):
+    BUNDLES = {"site.css": ["css/base.css"], "site.js": ["vendor/lib.min.js", "js/app.js"]}
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root, build, sources = (os.path.join(directory.name, name) for name in ("root", "build", "sources"))
+        files = {
+            "css/base.css": "/*! License */\n/* Comment */\nbody {\n  background: url(\"../img/dot.svg\");\n}\n" * 20,
+            "img/dot.svg": "<svg xmlns='http://www.w3.org/2000/svg'></svg>",
+            "vendor/lib.min.js": "var lib=1",
+            "js/app.js": "console.log(lib);\n",
+        }
+        for name, content in files.items():
+            os.makedirs(os.path.dirname(os.path.join(sources, name)), exist_ok=True)
+            with open(os.path.join(sources, name), "w") as file:
+                file.write(content)
+        settings = override_settings(
+            STATIC_ROOT=self.root,
+            STATICFILES_DIRS=[build, sources],
+            STATICFILES_FINDERS=["django.contrib.staticfiles.finders.FileSystemFinder"],
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        for name, value in (("BUNDLES", self.BUNDLES), ("BUILD_DIR", build)):
+            patcher = mock.patch.object(assets, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_sources_until_built(self):
+        self.assertEqual(
+            assets.bundle_tags("site.js"),
+            '<script src="/static/vendor/lib.min.js"></script><script src="/static/js/app.js"></script>',
+        )
+
+    def test_build(self):
+        call_command("build_static", stdout=io.StringIO())
+        tag = assets.bundle_tags("site.js")
+        hashed = tag[len('<script src="/static/'):-len('"></script>')]
+        self.assertRegex(hashed, r"^bundles/site\.[0-9a-f]{12}\.js$")
+        with open(os.path.join(self.root, hashed)) as file:
+            self.assertEqual(file.read(), "var lib=1;\nconsole.log(lib);\n")
+
+        css_name = assets.bundle_tags("site.css").split('href="/static/')[1].split('"')[0]
+        with open(os.path.join(self.root, css_name)) as file:
+            css = file.read()
+        # Minified, licenses kept, urls rebased to the bundle and hashed.
+        self.assertTrue(css.startswith("/*! License */ body{background: url("))
+        self.assertNotIn("Comment", css)
+        self.assertRegex(css, r'url\("../img/dot\.[0-9a-f]{12}\.svg"\)')
+        with gzip.open(os.path.join(self.root, css_name + ".gz")) as file:
+            self.assertEqual(file.read().decode(), css)
+
+    def test_serve_precompressed_and_immutable(self):
+        call_command("build_static", stdout=io.StringIO())
+        hashed = assets.bundle_tags("site.css").split('href="')[1].split('"')[0]
+        response = self.client.get(hashed, HTTP_ACCEPT_ENCODING="gzip, deflate, br")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(response["Content-Type"], "text/css")
+        self.assertEqual(response["Cache-Control"], assets.IMMUTABLE)
+        self.assertEqual(response["Vary"], "Accept-Encoding")
+        with open(os.path.join(self.root, hashed[len("/static/"):] + ".gz"), "rb") as file:
+            self.assertEqual(b"".join(response.streaming_content), file.read())
+
+        plain = self.client.get("/static/bundles/site.css")
+        self.assertNotIn("Content-Encoding", plain)
+        self.assertEqual(plain["Cache-Control"], assets.REVALIDATE)
+        self.assertEqual(self.client.get("/static/missing.css").status_code, 404)
+        self.assertEqual(self.client.get("/static/../settings.py").status_code, 404)
+
+    def test_minify_css_keeps_strings(self):
+        self.assertEqual(
+            assets.minify_css('a , b {\n  content : "x ; y  {}" ;\n  width: calc(1px + 2px);\n}\n'),
+            'a,b{content : "x ; y  {}";width: calc(1px + 2px)}',
+        )
@@ -0,0 +1,159 @@
+"""Materialized follow feed.
+
+Posts are pushed into the ``TimelineEntry`` rows of every follower when they
+are written (fan-out on write), so ``follow_index`` reads one user's timeline
+through a single index range scan instead of joining ``Follow`` and ``Post``.
+
+Authors with at least ``TIMELINE_FANOUT_LIMIT`` followers are not fanned out:
+their posts are pulled at read time and merged with the stored entries.
+"""
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import connection
+
+from .models import Follow, Post, TimelineEntry, UserStats
+from .pagination import CursorPage, CursorPaginator
+
+FANOUT_LIMIT = getattr(settings, "TIMELINE_FANOUT_LIMIT", 1000)
+BACKFILL_SIZE = getattr(settings, "TIMELINE_BACKFILL_SIZE", 100)
+BATCH_SIZE = 500
+
+TimelineRow = namedtuple("TimelineRow", ["pub_date", "post_id"])
+
+
+def hot_author_ids(author_ids):
+    """Returns the ids among ``author_ids`` served in pull mode."""
+    return set(
+        UserStats.objects.filter(user__in=author_ids, followers_count__gte=FANOUT_LIMIT)
+        .values_list("user", flat=True)
+    )
+
+
+def is_hot(author_id):
+    return UserStats.objects.filter(user=author_id, followers_count__gte=FANOUT_LIMIT).exists()
+
+
+def fan_out(post):
+    """Pushes a new post into the timelines of its author's followers."""
+    fan_out_many(post.author_id, [post])
+
+
+def fan_out_many(author_id, posts):
+    """Pushes new posts of one author into the timelines of their followers.
+
+    Entries are copied from the follow and post tables with INSERT ... SELECT,
+    so a batch of posts costs one statement per BATCH_SIZE posts however many
+    followers the author has.
+    """
+    if not posts or is_hot(author_id):
+        return
+    ops = connection.ops
+    entries, follows, post_table = (
+        ops.quote_name(model._meta.db_table) for model in (TimelineEntry, Follow, Post)
+    )
+    ids = [post.pk for post in posts]
+    with connection.cursor() as cursor:
+        for start in range(0, len(ids), BATCH_SIZE):
+            batch = ids[start:start + BATCH_SIZE]
+            cursor.execute(
+                f"{ops.insert_statement(ignore_conflicts=True)} {entries} (user_id, post_id, author_id, pub_date)"
+                f" SELECT f.user_id, p.id, p.author_id, p.pub_date FROM {follows} f"
+                f" JOIN {post_table} p ON p.author_id = f.author_id"
+                f" WHERE f.author_id = %s AND p.id IN ({', '.join(['%s'] * len(batch))})"
+                f" {ops.ignore_conflicts_suffix_sql(ignore_conflicts=True)}",
+                [author_id, *batch],
+            )
+
+
+def backfill(user_id, author_id):
+    """Copies recent posts of a newly followed author into the user's timeline."""
+    if is_hot(author_id):
+        return
+    recent = Post.objects.filter(author=author_id).order_by("-pub_date", "-id")[:BACKFILL_SIZE]
+    TimelineEntry.objects.bulk_create(
+        (TimelineEntry(user_id=user_id, post_id=post_id, author_id=author_id, pub_date=pub_date)
+         for post_id, pub_date in recent.values_list("id", "pub_date")),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def prune(user_id, author_id):
+    """Drops an unfollowed author's posts from the user's timeline."""
+    TimelineEntry.objects.filter(user=user_id, author=author_id).delete()
+
+
+def rebuild(user_ids=None):
+    """Recreates timelines from the follow graph. Returns the number of entries written.
+
+    Like ``fan_out_many`` it copies rows with INSERT ... SELECT, one statement
+    per followed author for the recent posts of the author and all their
+    followers, instead of one ``backfill`` per follow.
+    """
+    follows = Follow.objects.all()
+    entries = TimelineEntry.objects.all()
+    followers = ""
+    if user_ids is not None:
+        user_ids = [int(pk) for pk in user_ids]
+        follows = follows.filter(user__in=user_ids)
+        entries = entries.filter(user__in=user_ids)
+        followers = f" AND f.user_id IN ({', '.join(['%s'] * len(user_ids))})"
+    entries.delete()
+    ops = connection.ops
+    entry_table, follow_table, post_table = (
+        ops.quote_name(model._meta.db_table) for model in (TimelineEntry, Follow, Post)
+    )
+    sql = (
+        f"{ops.insert_statement(ignore_conflicts=True)} {entry_table} (user_id, post_id, author_id, pub_date)"
+        f" SELECT f.user_id, p.id, p.author_id, p.pub_date FROM {follow_table} f"
+        f" JOIN (SELECT id, author_id, pub_date FROM {post_table} WHERE author_id = %s"
+        f" ORDER BY pub_date DESC, id DESC LIMIT %s) p ON p.author_id = f.author_id"
+        f" WHERE f.author_id = %s{followers} {ops.ignore_conflicts_suffix_sql(ignore_conflicts=True)}"
+    )
+    author_ids = list(follows.order_by("author").values_list("author", flat=True).distinct())
+    with connection.cursor() as cursor:
+        for start in range(0, len(author_ids), BATCH_SIZE):
+            batch = author_ids[start:start + BATCH_SIZE]
+            hot = hot_author_ids(batch)
+            for author_id in batch:
+                if author_id not in hot:
+                    cursor.execute(sql, [author_id, BACKFILL_SIZE, author_id, *(user_ids or [])])
+    return entries.count()
+
+
+class TimelinePaginator(CursorPaginator):
+    """Keyset paginator over a user's stored timeline merged with the posts
+    of followed hot authors. Pages hold fully loaded feed posts."""
+
+    def __init__(self, user, per_page):
+        super().__init__(TimelineEntry.objects.filter(user=user), per_page, keys=("pub_date", "post_id"))
+        followed = Follow.objects.filter(user=user).values_list("author", flat=True)
+        self.pull_author_ids = hot_author_ids(followed)
+
+    def fetch(self, position, reverse, limit):
+        rows = [
+            TimelineRow(*row) for row in
+            self.keyset(self.queryset, self.keys, position, reverse)
+            .values_list("pub_date", "post_id")[:limit]
+        ]
+        if self.pull_author_ids:
+            pulled = self.keyset(
+                Post.objects.filter(author__in=self.pull_author_ids), ("pub_date", "id"), position, reverse
+            )
+            rows = sorted(
+                {row.post_id: row for row in rows + [
+                    TimelineRow(*row) for row in pulled.values_list("pub_date", "id")[:limit]
+                ]}.values(),
+                reverse=not reverse,
+            )[:limit]
+        return rows
+
+    def get_page(self, cursor=None):
+        page = super().get_page(cursor)
+        posts = Post.objects.feed().in_bulk([row.post_id for row in page])
+        return CursorPage(
+            [posts[row.post_id] for row in page if row.post_id in posts],
+            next_cursor=page.next_cursor,
+            previous_cursor=page.previous_cursor,
+        )
@@ -5,15 +5,21 @@ from . import views
 
 router = routers.DefaultRouter()
 router.register(r'posts', views.PostViewSet)
+router.register(r'search', views.PostSearchViewSet, basename='search')
 
 urlpatterns = [
     path("", views.index, name="index"),
     path("group/<slug>", views.group_posts, name="group"),
     path("new/", views.new_post, name="new_post"),
     path("follow/", views.follow_index, name="follow_index"),
+    path("follow/suggestions/", views.follow_suggestions, name="follow_suggestions"),
+    path("cache-stats/", views.cache_stats, name="cache_stats"),
+    path("search/", views.search_posts, name="search"),
     path('<str:username>/', views.profile, name='profile'),
+    path('<str:username>/export/', views.profile_export, name='profile_export'),
     path('<str:username>/<int:post_id>/', views.post_view, name='post'),
     path('<str:username>/<int:post_id>/edit/', views.post_edit, name='post_edit'),
+    path('<str:username>/<int:post_id>/comments/', views.post_comments, name='post_comments'),
     path("<username>/<int:post_id>/comment", views.add_comment, name="add_comment"),
     path("<str:username>/follow/", views.profile_follow, name="profile_follow"),
     path("<str:username>/unfollow/", views.profile_unfollow, name="profile_unfollow"),
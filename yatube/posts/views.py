@@ -1,25 +1,47 @@
+import re
+
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.core.paginator import Paginator
 from django.shortcuts import render, get_object_or_404, redirect, get_list_or_404
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
-from django.views.decorators.cache import cache_page
-from rest_framework.decorators import api_view
+from django.http import Http404, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.decorators import method_decorator
+from django.urls import reverse
+from django.utils.text import compress_sequence
+from rest_framework.decorators import action, api_view
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import JSONParser
 from rest_framework.response import Response
-from rest_framework import viewsets
+from rest_framework import generics, status, viewsets
 from rest_framework import permissions
+from rest_framework.utils.urls import replace_query_param
+
+from yatube.concurrency import gather
+from yatube.databases import read_from_replica
+from yatube.throttling import TokenBucketThrottle, rate_limit, take
 
+from . import bulk, cards, comments, export, recommendations, renditions, search
+from .conditional import conditional, group_scope, index_scope, post_scope, profile_scope
 from .forms import PostForm, CommentForm
-from .models import Post, Group, Comment, Follow
+from .models import Post, Group, Comment, Follow, UserStats
+from .page_cache import GLOBAL, author_namespace, cache_by_generation, group_namespace
+from .pagination import CursorPaginator, PostCursorPagination
+from .parsers import NDJSONParser
+from .projections import Projection
 from .serializers import PostSerializer
+from .timeline import TimelinePaginator
 
 
-@cache_page(15)
+@read_from_replica
+@conditional(index_scope)
+@cache_by_generation(lambda: [GLOBAL])
 def index(request):
     """Shows main page of the site."""
-    post_list = Post.objects.order_by('-pub_date').all()
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    post_list = Post.objects.feed()
+    paginator = CursorPaginator(post_list, 10)
+    page = paginator.get_page(request.GET.get('cursor'))
     return render(
         request,
         'index.html',
@@ -27,20 +49,35 @@ def index(request):
     )
 
 
+@read_from_replica
+@conditional(group_scope)
+@cache_by_generation(lambda slug: [group_namespace(slug)])
 def group_posts(request, slug):
     """Get all posts of the group and split it on pages."""
     group = get_object_or_404(Group, slug=slug)
-    posts = Post.objects.filter(group=group).order_by("-pub_date")
-    paginator = Paginator(posts, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    posts = Post.objects.feed().filter(group=group)
+    paginator = CursorPaginator(posts, 10)
+    page = paginator.get_page(request.GET.get('cursor'))
     return render(request, "group.html", {"page": page,"group":group})
 
+def search_posts(request):
+    """Shows posts matching the search query, best matches first."""
+    query = request.GET.get('q', '').strip()
+    group = None
+    if request.GET.get('group'):
+        group = get_object_or_404(Group, slug=request.GET['group'])
+    page = search.search(query, 10, request.GET.get('cursor'), group) if query else None
+    return render(request, "search.html", {
+        "page": page, "query": query, "group": group, "groups": Group.objects.order_by("title"),
+    })
+
+
 @login_required
+@rate_limit("new_post")
 def new_post(request):
     """Function to show user new post creation form."""
     if request.method == 'POST':
-        form = PostForm(request.POST)
+        form = PostForm(request.POST, files=request.FILES or None)
         if form.is_valid():
             author = request.user
             text = form.cleaned_data['text']
@@ -48,44 +85,85 @@ def new_post(request):
             image = form.cleaned_data['image']
             post = Post(author=author, text=text, group=group, image=image)
             post.save()
+            renditions.schedule(post.image)
             return redirect('index')
         return render(request, 'new_post.html', {'form': form})
     form = PostForm()
     return render(request, 'new_post.html', {'form': form})
 
 
+@read_from_replica
+@conditional(profile_scope)
+@cache_by_generation(lambda username: [author_namespace(username)])
 def profile(request, username):
     """Shows user profile with number of followers, following and total number of posts.
     Also show all user's posts and split it on pages."""
-    is_author = False
-    user = get_object_or_404(User, username=username)
-    posts = Post.objects.filter(author=user).order_by('-id')
-    overall = len(posts)
-    paginator = Paginator(posts, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
-    try:
-        author = get_object_or_404(User, username=username)
-        following = Follow.objects.get(user=request.user, author=author)
-    except:
-        following = False
-
-    if request.user == user:
-        is_author = True
+    viewer = request.user
+    is_following = viewer.is_authenticated and viewer.username != username
+    # The pieces only depend on the username, so they are loaded concurrently.
+    user, page, following = gather(
+        lambda: get_object_or_404(User.objects.select_related("stats"), username=username),
+        lambda: CursorPaginator(
+            Post.objects.feed().filter(author__username=username), 10,
+        ).get_page(request.GET.get('cursor')),
+        lambda: is_following and Follow.objects.filter(user=viewer, author__username=username).exists(),
+    )
+    stats = UserStats.for_user(user)
+    is_author = viewer == user
     return render(request, 'profile.html', {"user": user, "is_author": is_author, "page": page,
-                                            "overall": overall, "profile":user, "following": following})
+                                            "stats": stats, "profile":user, "following": following})
 
 
+@read_from_replica
+@conditional(post_scope)
 def post_view(request, username, post_id):
     """Show single post on the page."""
     is_author = False
-    user = get_object_or_404(User, username=username)
-    posts = Post.objects.filter(author=user)
-    overall = len(posts)
-    post = get_object_or_404(Post, pk=post_id)
-    items = Comment.objects.filter(post_id=post_id)
+    user, post, thread = gather(
+        lambda: get_object_or_404(User.objects.select_related("stats"), username=username),
+        lambda: get_object_or_404(Post.objects.feed(), pk=post_id),
+        lambda: comments.get_page(post_id, request.GET.get("comments")),
+    )
+    stats = UserStats.for_user(user)
     form = CommentForm()
-    return render(request, 'post.html', {"user": user, "is_author": is_author, "post": post, "overall": overall, "items": items, "form":form})
+    return render(request, 'post.html', {"user": user, "is_author": is_author, "post": post, "stats": stats, "comments": thread, "form":form})
+
+
+@read_from_replica
+def post_comments(request, username, post_id):
+    """A page of the post's comments as JSON, for loading more of them."""
+    if not Post.objects.filter(pk=post_id, author__username=username).exists():
+        raise Http404
+    page = comments.get_page(post_id, request.GET.get("cursor"))
+    next_url = None
+    if page.has_next():
+        next_url = replace_query_param(request.build_absolute_uri(), "cursor", page.next_cursor)
+    return JsonResponse({
+        "next": next_url,
+        "next_cursor": page.next_cursor,
+        "results": list(page),
+    })
+
+
+# As GZipMiddleware reads Accept-Encoding.
+ACCEPTS_GZIP = re.compile(r"\bgzip\b")
+
+
+@login_required
+def profile_export(request, username):
+    """Streams the user's data as NDJSON (see ``posts.export``), gzipped for
+    clients that accept it. For the user and staff."""
+    user = get_object_or_404(User, username=username)
+    if request.user != user and not request.user.is_staff:
+        return HttpResponseForbidden()
+    chunks = export.ndjson(export.records(user))
+    gzipped = ACCEPTS_GZIP.search(request.META.get("HTTP_ACCEPT_ENCODING", "")) is not None
+    response = StreamingHttpResponse(compress_sequence(chunks) if gzipped else chunks, content_type=export.CONTENT_TYPE)
+    if gzipped:
+        response["Content-Encoding"] = "gzip"
+    patch_vary_headers(response, ("Accept-Encoding",))
+    response["Content-Disposition"] = f'attachment; filename="{user.username}.ndjson"'
+    return response
 
 
 @login_required
@@ -101,6 +179,8 @@ def post_edit(request, username, post_id):
         if form.is_valid():
             print(form.cleaned_data)
             form.save()
+            if 'image' in form.changed_data:
+                renditions.schedule(post.image)
             return redirect("post", username=request.user.username, post_id=post_id)
 
     return render(
@@ -108,6 +188,12 @@ def post_edit(request, username, post_id):
     )
 
 
+@staff_member_required
+def cache_stats(request):
+    """Hit/miss counters of the post card cache in all workers."""
+    return JsonResponse({"post_cards": cards.stats.snapshot()})
+
+
 def page_not_found(request, exception):
     return render(
         request,
@@ -122,6 +208,7 @@ def server_error(request):
 
 
 @login_required
+@rate_limit("add_comment")
 def add_comment(request, username, post_id):
     """Function to write."""
     if request.method == 'POST':
@@ -134,16 +221,31 @@ def add_comment(request, username, post_id):
             comment.save()
     return redirect('post', username=username, post_id=post_id)
 
+@read_from_replica
 @login_required
 def follow_index(request):
-    following_posts = Post.objects.filter(author__following__user=request.user)
-    paginator = Paginator(following_posts, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    paginator = TimelinePaginator(request.user, 10)
+    page = paginator.get_page(request.GET.get('cursor'))
     return render(request, "follow.html", {'page': page})
 
 
+@read_from_replica
 @login_required
+def follow_suggestions(request):
+    """Authors suggested to the user, see ``posts.recommendations``."""
+    return JsonResponse({"results": [
+        {
+            "username": suggestion.author.username,
+            "full_name": suggestion.author.get_full_name(),
+            "url": reverse("profile", args=[suggestion.author.username]),
+            "score": suggestion.score,
+        }
+        for suggestion in recommendations.for_user(request.user)
+    ]})
+
+
+@login_required
+@rate_limit("profile_follow", methods=None)
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
     print(author)
@@ -169,7 +271,120 @@ def hello(request):
     return Response({'message': 'Привет, мир!'})
 
 
+BULK_MAX_ITEMS = getattr(settings, "BULK_MAX_ITEMS", 1000)
+
+
 class PostViewSet(viewsets.ModelViewSet):
-    queryset = Post.objects.all().order_by('-pub_date')
+    queryset = Post.objects.feed()
+    serializer_class = PostSerializer
+    pagination_class = PostCursorPagination
+    permission_classes = [permissions.IsAuthenticated]
+
+    @method_decorator(read_from_replica)
+    @method_decorator(conditional(index_scope))
+    def list(self, request, *args, **kwargs):
+        """Reads go through a projection instead of the serializer."""
+        projection = Projection.from_request(request)
+        rows = self.paginate_queryset(projection.rows(self.filter_queryset(self.get_queryset())))
+        return self.get_paginated_response(projection(rows))
+
+    @method_decorator(read_from_replica)
+    def retrieve(self, request, *args, **kwargs):
+        projection = Projection.from_request(request)
+        row = generics.get_object_or_404(projection.rows(self.get_queryset()), pk=kwargs["pk"])
+        # Object permissions get the values() row instead of a Post instance.
+        self.check_object_permissions(request, row)
+        return Response(projection([row])[0])
+
+    def get_throttles(self):
+        # Bulk requests are charged per post once parsed, see bulk().
+        if self.action == "create":
+            return [TokenBucketThrottle("api_new_post")]
+        return super().get_throttles()
+
+    def perform_create(self, serializer):
+        serializer.save(author=self.request.user)
+
+    def get_bulk_items(self, request):
+        """The request body as a list of objects: a JSON array or NDJSON."""
+        items = request.data
+        if not isinstance(items, list):
+            raise ValidationError("Expected a list of posts.")
+        if len(items) > BULK_MAX_ITEMS:
+            raise ValidationError(f"At most {BULK_MAX_ITEMS} posts per request.")
+        groups = {item.get("group") for item in items if isinstance(item, dict)}
+        context = self.get_serializer_context()
+        # Every item is validated against the groups loaded here, in one query.
+        context["groups"] = Group.objects.in_bulk([slug for slug in groups if isinstance(slug, str)],
+                                                  field_name="slug")
+        return items, context
+
+    def bulk_response(self, results, success):
+        if all("errors" in result for result in results):
+            code = status.HTTP_400_BAD_REQUEST
+        elif any("errors" in result for result in results):
+            code = status.HTTP_207_MULTI_STATUS
+        else:
+            code = success
+        return Response({"results": results}, status=code)
+
+    @action(detail=False, methods=["post"], parser_classes=[JSONParser, NDJSONParser])
+    def bulk(self, request):
+        """Creates a list of posts in one transaction. Invalid items are
+        reported by their index and do not stop the valid ones."""
+        items, context = self.get_bulk_items(request)
+        wait = take("api_bulk_post", request, cost=len(items))
+        if wait:
+            self.throttled(request, wait)
+        valid, results = [], []
+        for index, item in enumerate(items):
+            serializer = self.get_serializer(data=item, context=context)
+            if serializer.is_valid():
+                valid.append((index, serializer.validated_data))
+            else:
+                results.append({"index": index, "errors": serializer.errors})
+        posts = bulk.create_posts(request.user, [data for _, data in valid])
+        results.extend({"index": index, "id": post.pk} for (index, _), post in zip(valid, posts))
+        results.sort(key=lambda result: result["index"])
+        return self.bulk_response(results, status.HTTP_201_CREATED)
+
+    @bulk.mapping.patch
+    def bulk_update(self, request):
+        """Partially updates a list of the user's posts, each item naming its post by ``id``."""
+        items, context = self.get_bulk_items(request)
+        ids = [item.get("id") for item in items if isinstance(item, dict)]
+        posts = Post.objects.select_related("group").filter(author=request.user).in_bulk(
+            [pk for pk in ids if isinstance(pk, int)]
+        )
+        changes, results = [], []
+        for index, item in enumerate(items):
+            post = posts.get(item.get("id")) if isinstance(item, dict) else None
+            if post is None:
+                results.append({"index": index, "errors": {"id": ["Post not found."]}})
+                continue
+            serializer = self.get_serializer(post, data=item, partial=True, context=context)
+            if serializer.is_valid():
+                changes.append((post, serializer.validated_data))
+                results.append({"index": index, "id": post.pk})
+            else:
+                results.append({"index": index, "errors": serializer.errors})
+        bulk.update_posts(request.user, changes)
+        return self.bulk_response(results, status.HTTP_200_OK)
+
+
+class PostSearchViewSet(viewsets.GenericViewSet):
+    """Full-text search over posts: ``?q=`` with an optional ``?group=`` slug."""
     serializer_class = PostSerializer
     permission_classes = [permissions.IsAuthenticated]
+
+    def list(self, request):
+        group = None
+        if request.query_params.get("group"):
+            group = get_object_or_404(Group, slug=request.query_params["group"])
+        page = search.search(
+            request.query_params.get("q", ""), 10, request.query_params.get("cursor"), group,
+        )
+        next_link = None
+        if page.has_next():
+            next_link = replace_query_param(request.build_absolute_uri(), "cursor", page.next_cursor)
+        return Response({"next": next_link, "results": self.get_serializer(page, many=True).data})
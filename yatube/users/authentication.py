@@ -0,0 +1,110 @@
+"""Authentication with token and session users read through the cache.
+
+``TokenAuthentication`` joins ``Token`` and ``User`` on every API call and
+``AuthenticationMiddleware`` loads the session's user on every page. Both
+are cached for ``AUTH_CACHE_TIMEOUT`` seconds in the shared cache (session
+data itself is cached by the ``cached_db`` session engine).
+
+Entries hold the user's fields but the password hash, and the session auth
+hash derived from it; the users built from them have ``password`` deferred,
+so saving one never overwrites it. Entries are dropped by the signals in
+``users/signals.py`` when a token is deleted or a user is saved (password
+change, deactivation) or deleted. Bulk ``update()`` calls skip signals and
+are only picked up after the timeout.
+"""
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user_model, load_backend
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.utils.crypto import constant_time_compare
+from django.utils.functional import SimpleLazyObject
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+AUTH_TIMEOUT = getattr(settings, "AUTH_CACHE_TIMEOUT", 60)
+
+
+def token_cache_key(key):
+    # Keys are credentials, so only their digest is stored.
+    return f"auth_token:{hashlib.sha256(key.encode()).hexdigest()}"
+
+
+def user_cache_key(user_id):
+    return f"auth_user:{user_id}"
+
+
+def cache_entry(user):
+    fields = {
+        field.attname: getattr(user, field.attname)
+        for field in user._meta.concrete_fields if field.attname != "password"
+    }
+    return {"fields": fields, "session_hash": user.get_session_auth_hash()}
+
+
+def cached_user(entry):
+    fields = entry["fields"]
+    return get_user_model().from_db("default", list(fields), list(fields.values()))
+
+
+def forget_user(user):
+    """Drops the cached entries of ``user`` and of their tokens."""
+    from rest_framework.authtoken.models import Token
+
+    keys = [user_cache_key(user.pk)]
+    keys += [token_cache_key(key) for key in Token.objects.filter(user=user).values_list("key", flat=True)]
+    cache.delete_many(keys)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        cache_key = token_cache_key(key)
+        entry = cache.get(cache_key)
+        if entry is None:
+            token = self.get_model().objects.select_related("user").filter(key=key).first()
+            if token is None:
+                raise exceptions.AuthenticationFailed(_("Invalid token."))
+            user = token.user
+            cache.set(cache_key, cache_entry(user), AUTH_TIMEOUT)
+        else:
+            user = cached_user(entry)
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(_("User inactive or deleted."))
+        return user, key
+
+
+def get_user(request):
+    """``django.contrib.auth.get_user`` with the user read through the cache."""
+    session = request.session
+    try:
+        user_id = get_user_model()._meta.pk.to_python(session[SESSION_KEY])
+        backend_path = session[BACKEND_SESSION_KEY]
+    except KeyError:
+        return AnonymousUser()
+    if backend_path not in settings.AUTHENTICATION_BACKENDS:
+        return AnonymousUser()
+    cache_key = user_cache_key(user_id)
+    entry = cache.get(cache_key)
+    if entry is None:
+        user = load_backend(backend_path).get_user(user_id)
+        if user is None:
+            return AnonymousUser()
+        entry = cache_entry(user)
+        cache.set(cache_key, entry, AUTH_TIMEOUT)
+    else:
+        user = cached_user(entry)
+    # A password change invalidates the hash of every other session.
+    session_hash = session.get(HASH_SESSION_KEY)
+    if not (session_hash and constant_time_compare(session_hash, entry["session_hash"])):
+        session.flush()
+        return AnonymousUser()
+    return user
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    def process_request(self, request):
+        super().process_request(request)
+        request.user = SimpleLazyObject(lambda: get_user(request))
@@ -1,3 +1,79 @@
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
 
-# Create your tests here.
+from .authentication import cached_user, token_cache_key, user_cache_key
+
+
+class CachedAuthenticationTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username="testuser", password="12345")
+        self.token = Token.objects.create(user=self.user)
+        self.auth = {"HTTP_AUTHORIZATION": f"Token {self.token.key}"}
+
+    def tables_queried(self, *args, **kwargs):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(*args, **kwargs)
+        sql = " ".join(query["sql"] for query in queries)
+        return response, {table for table in ("authtoken_token", "auth_user", "django_session") if table in sql}
+
+    def test_token_user_is_cached(self):
+        self.client.get("/api/posts/", **self.auth)
+        response, tables = self.tables_queried("/api/posts/", **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(tables, set())
+
+    def test_revoked_token_stops_working_right_away(self):
+        self.assertEqual(self.client.get("/api/posts/", **self.auth).status_code, 200)
+        self.token.delete()
+        self.assertEqual(self.client.get("/api/posts/", **self.auth).status_code, 401)
+
+    def test_deactivated_user_is_rejected(self):
+        self.client.login(username="testuser", password="12345")
+        self.client.get(reverse("follow_index"))
+        self.client.get("/api/posts/", **self.auth)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get("/api/posts/", **self.auth).status_code, 401)
+        self.assertRedirects(self.client.get(reverse("follow_index")),
+                             f"{reverse('login')}?next={reverse('follow_index')}")
+
+    def test_session_user_is_cached(self):
+        self.client.login(username="testuser", password="12345")
+        self.client.get(reverse("follow_index"))
+        response, tables = self.tables_queried(reverse("follow_index"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(tables, set())
+
+    def test_password_change_ends_other_sessions(self):
+        self.client.login(username="testuser", password="12345")
+        self.client.get(reverse("follow_index"))
+        self.user.set_password("54321")
+        self.user.save()
+        self.assertEqual(self.client.get(reverse("follow_index")).status_code, 302)
+
+    def test_password_hash_is_not_cached(self):
+        self.client.login(username="testuser", password="12345")
+        self.client.get(reverse("follow_index"))
+        self.client.get("/api/posts/", **self.auth)
+        for key in (user_cache_key(self.user.pk), token_cache_key(self.token.key)):
+            self.assertNotIn("password", cache.get(key)["fields"])
+        # Saving a cached user keeps the password.
+        cached_user(cache.get(user_cache_key(self.user.pk))).save()
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password("12345"))
+
+    def test_logout_ends_session(self):
+        self.client.login(username="testuser", password="12345")
+        cookie = self.client.cookies["sessionid"].value
+        self.client.get(reverse("follow_index"))
+        self.client.get(reverse("logout"))
+        other = Client()
+        other.cookies["sessionid"] = cookie
+        self.assertEqual(other.get(reverse("follow_index")).status_code, 302)
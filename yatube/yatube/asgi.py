@@ -0,0 +1,143 @@
+"""
+ASGI config for yatube project.
+
+Django 2.2 has no ASGI support of its own, so ``ASGIHandler`` adapts the WSGI
+application: the event loop reads requests and writes responses, and each
+request runs on a bounded thread pool of ``ASGI_THREADS`` threads. A slow
+request then holds one thread instead of a whole worker process. Run it with
+any ASGI server, for example::
+
+    uvicorn yatube.asgi:application --workers 4
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.wsgi import get_wsgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+
+
+class ASGIHandler:
+    """An ASGI 3 application running a WSGI application on a thread pool."""
+
+    # Request bodies larger than this are spooled to disk.
+    BODY_MEMORY_SIZE = 2 * 1024 * 1024
+
+    def __init__(self, wsgi_application, threads):
+        self.wsgi_application = wsgi_application
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="asgi")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.lifespan(receive, send)
+        if scope["type"] != "http":
+            raise ValueError(f"Unsupported ASGI scope type: {scope['type']}.")
+        body = await self.read_body(receive)
+        if body is None:
+            return  # The client went away.
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self.executor, self.run_wsgi, loop, scope, body, send)
+        finally:
+            body.close()
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.executor.shutdown(wait=True)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def read_body(self, receive):
+        body = tempfile.SpooledTemporaryFile(max_size=self.BODY_MEMORY_SIZE)
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                body.close()
+                return None
+            body.write(message.get("body", b""))
+            if not message.get("more_body", False):
+                body.seek(0)
+                return body
+
+    @staticmethod
+    def environ(scope, body):
+        server = scope.get("server") or ("localhost", 80)
+        environ = {
+            "REQUEST_METHOD": scope["method"],
+            "SCRIPT_NAME": scope.get("root_path", "").encode("utf8").decode("latin1"),
+            "PATH_INFO": scope["path"].encode("utf8").decode("latin1"),
+            "QUERY_STRING": scope.get("query_string", b"").decode("latin1"),
+            "SERVER_NAME": server[0],
+            "SERVER_PORT": str(server[1] or 80),
+            "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": scope.get("scheme", "http"),
+            "wsgi.input": body,
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": True,
+            "wsgi.run_once": False,
+        }
+        if scope.get("client"):
+            environ["REMOTE_ADDR"], environ["REMOTE_PORT"] = scope["client"][0], str(scope["client"][1])
+        for name, value in scope.get("headers", []):
+            name = name.decode("latin1").upper().replace("-", "_")
+            if name not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+                name = f"HTTP_{name}"
+            value = value.decode("latin1")
+            if name in environ:
+                # HTTP/2 clients send each cookie in a header of its own.
+                separator = "; " if name == "HTTP_COOKIE" else ","
+                value = f"{environ[name]}{separator}{value}"
+            environ[name] = value
+        return environ
+
+    def run_wsgi(self, loop, scope, body, send):
+        """Runs the request on a pool thread, passing the response to ``send``
+        on the event loop chunk by chunk, so streamed responses stay streamed."""
+        def call(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        start = {}
+
+        def start_response(status, headers, exc_info=None):
+            start.update(
+                type="http.response.start",
+                status=int(status.split(" ", 1)[0]),
+                headers=[(name.lower().encode("latin1"), value.encode("latin1")) for name, value in headers],
+            )
+
+        response = self.wsgi_application(self.environ(scope, body), start_response)
+        pending = None
+        try:
+            for chunk in response:
+                if not chunk:
+                    continue
+                if pending is None:
+                    call(start)
+                else:
+                    call({"type": "http.response.body", "body": pending, "more_body": True})
+                pending = chunk
+        finally:
+            if hasattr(response, "close"):
+                response.close()
+        if pending is None:
+            call(start)
+        # Most responses are a single chunk and go out in one message.
+        call({"type": "http.response.body", "body": pending or b"", "more_body": False})
+
+
+def get_asgi_application():
+    from django.conf import settings
+    return ASGIHandler(get_wsgi_application(), getattr(settings, "ASGI_THREADS", 32))
+
+
+application = get_asgi_application()
@@ -0,0 +1,219 @@
+"""Static asset pipeline: bundles, content-hashed names and precompression.
+
+``manage.py build_static`` concatenates the sources of every bundle in
+``STATIC_BUNDLES`` into ``STATIC_BUILD_DIR`` (minifying what isn't minified
+yet), collects all static files into ``STATIC_ROOT`` under content-hashed
+names with a manifest (``ManifestStorage``), and writes ``.gz`` and ``.br``
+copies of the hashed text files next to them.
+
+``serve`` answers ``STATIC_URL`` from ``STATIC_ROOT`` with the smallest
+precompressed copy the client accepts; hashed names never change content,
+so they are cached for a year as immutable. Templates load bundles with
+``{% bundle "site.js" %}``, which falls back to the sources one by one
+until the bundle is built.
+
+brotli and rjsmin are optional: without them no ``.br`` files are written
+and JavaScript is bundled as it is.
+"""
+import gzip
+import mimetypes
+import os
+import posixpath
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.templatetags.static import static
+from django.utils._os import safe_join
+from django.utils.html import format_html
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+BUNDLES = getattr(settings, "STATIC_BUNDLES", {})
+BUILD_DIR = getattr(settings, "STATIC_BUILD_DIR", os.path.join(settings.BASE_DIR, "static_build"))
+BUNDLE_PREFIX = "bundles"
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "public, max-age=0, must-revalidate"
+COMPRESSIBLE = {".css", ".js", ".json", ".map", ".svg", ".txt", ".html", ".xml", ".eot", ".ttf"}
+# Below this size compression saves less than it costs.
+COMPRESS_MIN_SIZE = 256
+
+CSS_TOKENS = re.compile(r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|/\*.*?\*/|\s+|[^"\'/\s]+|/', re.DOTALL)
+CSS_SEPARATORS = "{};,"
+CSS_URL = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+
+
+class ManifestStorage(ManifestStaticFilesStorage):
+    """Hashed names from the manifest written by ``build_static``. Files not
+    collected yet (in development and tests) keep their plain names."""
+
+    manifest_strict = False
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
+
+    def is_built(self, name):
+        return self.hash_key(self.clean_name(name)) in self.hashed_files
+
+    def is_hashed(self, name):
+        if not hasattr(self, "_hashed_names"):
+            self._hashed_names = set(self.hashed_files.values())
+        return name in self._hashed_names
+
+
+def bundle_path(name):
+    return f"{BUNDLE_PREFIX}/{name}"
+
+
+def _plain(token):
+    return token[0] not in "\"'"
+
+
+def minify_css(css):
+    """Drops comments (but ``/*!`` licenses), the whitespace around
+    ``{};,`` and the last semicolon of blocks. Strings are kept as they are."""
+    out = []
+    for token in CSS_TOKENS.findall(css):
+        if token.startswith("/*") and not token.startswith("/*!"):
+            continue
+        if token.isspace():
+            if out and out[-1] != " " and not (_plain(out[-1]) and out[-1][-1] in CSS_SEPARATORS):
+                out.append(" ")
+            continue
+        if _plain(token) and not token.startswith("/*"):
+            token = token.replace(";}", "}")
+            if token[0] in CSS_SEPARATORS and out and out[-1] == " ":
+                out.pop()
+            if token[0] == "}" and out and _plain(out[-1]) and out[-1].endswith(";"):
+                out[-1] = out[-1][:-1]
+                if not out[-1]:
+                    out.pop()
+        out.append(token)
+    return "".join(out).strip()
+
+
+def _rebase_urls(css, source, bundle):
+    """Rewrites relative ``url()``s of ``source`` to be relative to ``bundle``."""
+    def rebase(match):
+        quote, url = match.groups()
+        if re.match(r"^(?:[a-z]+:|/|#)", url, re.IGNORECASE):
+            return match.group(0)
+        target = posixpath.normpath(posixpath.join(posixpath.dirname(source), url))
+        return f"url({quote}{posixpath.relpath(target, posixpath.dirname(bundle))}{quote})"
+    return CSS_URL.sub(rebase, css)
+
+
+def build_bundle(name, sources):
+    """Returns the content of bundle ``name`` made of the static files ``sources``."""
+    parts = []
+    for source in sources:
+        path = finders.find(source)
+        if path is None:
+            raise FileNotFoundError(f"Static file {source!r} of bundle {name!r} was not found.")
+        with open(path, encoding="utf-8") as file:
+            content = file.read()
+        minified = ".min." in posixpath.basename(source)
+        if name.endswith(".css"):
+            content = _rebase_urls(content, source, bundle_path(name))
+            parts.append(content if minified else minify_css(content))
+        else:
+            parts.append(content if minified or rjsmin is None else rjsmin.jsmin(content))
+    # A file that doesn't end its last statement must not run into the next one.
+    return ("\n" if name.endswith(".css") else ";\n").join(part.strip() for part in parts) + "\n"
+
+
+def build_bundles():
+    """Writes every bundle into ``BUILD_DIR``. Returns ``{name: size}``."""
+    sizes = {}
+    for name, sources in BUNDLES.items():
+        content = build_bundle(name, sources).encode()
+        path = os.path.join(BUILD_DIR, *bundle_path(name).split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as file:
+            file.write(content)
+        sizes[name] = len(content)
+    return sizes
+
+
+def precompress(root=None, names=None):
+    """Writes ``.gz`` (and ``.br``) copies of the hashed text files of the
+    manifest, when they come out smaller. Returns the number written."""
+    root = root or settings.STATIC_ROOT
+    names = names if names is not None else staticfiles_storage.hashed_files.values()
+    written = 0
+    for name in names:
+        if posixpath.splitext(name)[1].lower() not in COMPRESSIBLE:
+            continue
+        path = os.path.join(root, *name.split("/"))
+        with open(path, "rb") as file:
+            content = file.read()
+        if len(content) < COMPRESS_MIN_SIZE:
+            continue
+        encoded = {".gz": gzip.compress(content, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            encoded[".br"] = brotli.compress(content, quality=11)
+        for suffix, data in encoded.items():
+            if len(data) < len(content):
+                with open(path + suffix, "wb") as file:
+                    file.write(data)
+                written += 1
+    return written
+
+
+def bundle_tags(name):
+    """HTML loading bundle ``name``, or its sources until it is built."""
+    path = bundle_path(name)
+    built = getattr(staticfiles_storage, "is_built", lambda name: False)(path)
+    sources = [path] if built else BUNDLES[name]
+    template = '<script src="{}"></script>' if name.endswith(".js") else '<link rel="stylesheet" href="{}">'
+    return "".join(format_html(template, static(source)) for source in sources)
+
+
+def _accepts(request, encoding):
+    return re.search(rf"\b{encoding}\b", request.META.get("HTTP_ACCEPT_ENCODING", "")) is not None
+
+
+def serve(request, path):
+    """Serves a collected static file, precompressed when the client accepts it."""
+    name = posixpath.normpath(path).lstrip("/")
+    try:
+        full_path = safe_join(settings.STATIC_ROOT, name)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not os.path.isfile(full_path):
+        raise Http404
+    served, encoding = full_path, None
+    for candidate, suffix in (("br", ".br"), ("gzip", ".gz")):
+        if _accepts(request, candidate) and os.path.isfile(full_path + suffix):
+            served, encoding = full_path + suffix, candidate
+            break
+    stat = os.stat(served)
+    if not was_modified_since(request.META.get("HTTP_IF_MODIFIED_SINCE"), stat.st_mtime, stat.st_size):
+        response = HttpResponseNotModified()
+    else:
+        content_type, _ = mimetypes.guess_type(full_path)
+        response = FileResponse(open(served, "rb"), content_type=content_type or "application/octet-stream")
+        response["Last-Modified"] = http_date(stat.st_mtime)
+        if encoding:
+            response["Content-Encoding"] = encoding
+    hashed = getattr(staticfiles_storage, "is_hashed", lambda name: False)(name)
+    response["Cache-Control"] = IMMUTABLE if hashed else REVALIDATE
+    response["Vary"] = "Accept-Encoding"
+    return response
@@ -0,0 +1,83 @@
+"""Concurrent loading of the independent pieces of a page.
+
+    user, page, following = gather(load_user, load_page, load_following)
+
+The callables run on a bounded thread pool, each thread with its own database
+connection, so a view waits for its slowest query instead of the sum of them.
+The pool is bounded by ``CONCURRENT_LOADING_WORKERS`` and so is the number of
+connections it opens; SQLite in WAL mode serves them side by side.
+
+Work stays serial on the calling thread when connections of other threads
+could not see the data it must read: inside an atomic block (tests,
+``ATOMIC_REQUESTS``), on a pool thread itself and within ``serial()``.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+
+from . import databases, profiling
+
+WORKERS = getattr(settings, "CONCURRENT_LOADING_WORKERS", 4)
+
+_pool = None
+_pool_lock = threading.Lock()
+_local = threading.local()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="loader")
+        return _pool
+
+
+@contextmanager
+def serial():
+    """Runs every ``gather`` of this thread serially, e.g. to capture all queries."""
+    previous = getattr(_local, "serial", False)
+    _local.serial = True
+    try:
+        yield
+    finally:
+        _local.serial = previous
+
+
+def _serial():
+    return (
+        WORKERS < 2
+        or getattr(_local, "in_pool", False)
+        or getattr(_local, "serial", False)
+        or any(connection.in_atomic_block for connection in connections.all())
+    )
+
+
+def _run(call, replica, profile):
+    _local.in_pool = True
+    close_old_connections()
+    try:
+        with databases.replica_reads(replica), profiling.part_of(profile):
+            return call()
+    finally:
+        # Connections outlive the task, like request connections outlive
+        # the request, until CONN_MAX_AGE or an error.
+        close_old_connections()
+        _local.in_pool = False
+
+
+def gather(*calls):
+    """Runs the callables and returns their results in order. The first
+    exception raised by any of them is raised once all have finished."""
+    if len(calls) < 2 or _serial():
+        return [call() for call in calls]
+    replica, profile = databases.reading_from_replica(), profiling.current()
+    pool = get_pool()
+    futures = [pool.submit(_run, call, replica, profile) for call in calls]
+    errors = [future.exception() for future in futures]
+    for error in errors:
+        if error is not None:
+            raise error
+    return [future.result() for future in futures]
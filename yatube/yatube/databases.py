@@ -0,0 +1,146 @@
+"""Read/write splitting between the ``default`` database and a ``replica``.
+
+Views decorated with ``read_from_replica`` read from the replica; all writes
+and every other read go to the primary. The replica lags behind, so once a
+request writes, ``ReplicaRoutingMiddleware`` pins that client to the primary
+for ``REPLICA_STICKY_SECONDS`` with a cookie.
+
+Locally the replica is a copy of the SQLite file refreshed by
+``manage.py sync_replica``. Until the copy exists, or when the alias mirrors
+the primary (as it does in tests), reads stay on the primary.
+
+``sync_replica`` records in the cache when the copy it made was taken, so
+``may_be_stale`` knows which writes the replica has. For replicas synced by
+other means it assumes they lag less than ``REPLICA_STICKY_SECONDS``.
+"""
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+REPLICA = "replica"
+PIN_COOKIE = "db_primary"
+STICKY_SECONDS = getattr(settings, "REPLICA_STICKY_SECONDS", 10)
+SYNCED_KEY = "replica_synced"
+
+_state = threading.local()
+_replica_ready = False
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    # WAL lets readers work while a writer holds the lock (the mode is stored
+    # in the file); NORMAL sync is safe with WAL and much cheaper.
+    if connection.vendor == "sqlite":
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+
+
+def replica_available():
+    """Whether the replica is a separate, already synced database."""
+    global _replica_ready
+    if _replica_ready:
+        return True
+    if REPLICA not in settings.DATABASES:
+        return False
+    replica = connections[REPLICA].settings_dict
+    if replica["NAME"] == connections["default"].settings_dict["NAME"]:
+        return False
+    _replica_ready = replica["ENGINE"] != "django.db.backends.sqlite3" or os.path.exists(replica["NAME"])
+    return _replica_ready
+
+
+def reading_from_replica():
+    return getattr(_state, "replica", False) and replica_available()
+
+
+def mark_synced(at):
+    """Records that the replica holds every write made before ``at``."""
+    cache.set(SYNCED_KEY, at, None)
+
+
+def may_be_stale(since):
+    """Whether data read now may miss a write made at ``since`` (a timestamp).
+    Anything derived from it must not be cached under post-write keys."""
+    if not reading_from_replica():
+        return False
+    synced = cache.get(SYNCED_KEY)
+    if synced is None:
+        return time.time() - since < STICKY_SECONDS
+    return synced <= since
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    """Sends the reads of this thread to the replica, if ``enabled``."""
+    previous = getattr(_state, "replica", False)
+    _state.replica = enabled
+    try:
+        yield
+    finally:
+        _state.replica = previous
+
+
+def read_from_replica(view):
+    """Serves GET/HEAD requests of ``view`` from the replica, unless the client
+    is pinned to the primary."""
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        if request.method not in ("GET", "HEAD") or PIN_COOKIE in request.COOKIES:
+            return view(request, *args, **kwargs)
+        with replica_reads():
+            return view(request, *args, **kwargs)
+    return wrapped
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if reading_from_replica():
+            return REPLICA
+        return None
+
+    def db_for_write(self, model, **hints):
+        _state.wrote = True
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA
+
+
+class ReplicaRoutingMiddleware:
+    """Pins clients whose request wrote to the database to the primary."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        _state.wrote = False
+        response = self.get_response(request)
+        if _state.wrote:
+            response.set_cookie(PIN_COOKIE, "1", max_age=STICKY_SECONDS, httponly=True, samesite="Lax")
+        return response
+
+
+def copy_database(source, target):
+    """Copies the SQLite database ``source`` into ``target`` with the online
+    backup API, so readers of ``target`` see either the old or the new copy."""
+    source_connection = sqlite3.connect(source)
+    target_connection = sqlite3.connect(target, timeout=30)
+    try:
+        source_connection.backup(target_connection)
+    finally:
+        target_connection.close()
+        source_connection.close()
@@ -0,0 +1,245 @@
+"""Counters and histograms shared by all worker processes, for Prometheus.
+
+Every process writes its samples into a memory-mapped file of its own in
+``METRICS_DIR``, so recording never waits on another process: it is a dict
+lookup and an in-place float update under a per-process lock. The
+``/metrics`` view reads every file and adds them up.
+
+    LOOKUPS = metrics.Counter("yatube_lookups", "Lookups.", ["result"])
+    LOOKUPS.inc("hit")
+
+Files of finished processes are kept, so counters survive worker restarts;
+empty the directory when deploying.
+"""
+import bisect
+import glob
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+METRICS_DIR = getattr(settings, "METRICS_DIR", os.path.join(settings.BASE_DIR, "metrics"))
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_USED = struct.Struct("Q")
+_LENGTH = struct.Struct("I")
+_VALUE = struct.Struct("d")
+
+REGISTRY = {}
+
+_lock = threading.Lock()
+_values = None
+
+
+class _Values:
+    """Samples of one process: ``[used bytes] ([key length][key][value])*``,
+    values aligned to 8 bytes."""
+
+    INITIAL_SIZE = 64 * 1024
+
+    def __init__(self, path):
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        if os.fstat(fd).st_size < self.INITIAL_SIZE:
+            os.ftruncate(fd, self.INITIAL_SIZE)
+        self._map = mmap.mmap(fd, 0)
+        os.close(fd)
+        self._positions = {key: position for key, position, _ in _entries(self._map)}
+        self._used = max(_USED.unpack_from(self._map, 0)[0], _USED.size)
+
+    def position(self, key):
+        position = self._positions.get(key)
+        if position is None:
+            position = self._append(key)
+        return position
+
+    def _append(self, key):
+        encoded = key.encode()
+        padded = len(encoded) + (-(_LENGTH.size + len(encoded)) % 8)
+        size = _LENGTH.size + padded + _VALUE.size
+        if self._used + size > len(self._map):
+            self._map.resize(max(len(self._map) * 2, self._used + size))
+        start = self._used
+        _LENGTH.pack_into(self._map, start, len(encoded))
+        self._map[start + _LENGTH.size:start + _LENGTH.size + len(encoded)] = encoded
+        position = start + _LENGTH.size + padded
+        _VALUE.pack_into(self._map, position, 0.0)
+        # Readers only look up to the used size, so it is written last.
+        self._used += size
+        _USED.pack_into(self._map, 0, self._used)
+        self._positions[key] = position
+        return position
+
+    def add(self, position, amount):
+        _VALUE.pack_into(self._map, position, _VALUE.unpack_from(self._map, position)[0] + amount)
+
+
+def _entries(buffer):
+    used = _USED.unpack_from(buffer, 0)[0]
+    offset = _USED.size
+    while offset < used:
+        length = _LENGTH.unpack_from(buffer, offset)[0]
+        key = bytes(buffer[offset + _LENGTH.size:offset + _LENGTH.size + length]).decode()
+        position = offset + _LENGTH.size + length + (-(_LENGTH.size + length) % 8)
+        yield key, position, _VALUE.unpack_from(buffer, position)[0]
+        offset = position + _VALUE.size
+
+
+def _process_values():
+    # Called with _lock held.
+    global _values
+    if _values is None:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        _values = _Values(os.path.join(METRICS_DIR, f"{os.getpid()}.db"))
+    return _values
+
+
+def _forget_positions():
+    global _values
+    _values = None
+    for metric in REGISTRY.values():
+        metric._children.clear()
+
+
+# A forked worker must not write into its parent's file.
+os.register_at_fork(after_in_child=_forget_positions)
+
+
+def reset():
+    """Deletes every sample of every process."""
+    with _lock:
+        _forget_positions()
+        for path in glob.glob(os.path.join(METRICS_DIR, "*.db")):
+            os.remove(path)
+
+
+def collect():
+    """Returns ``{(metric, sample suffix, labels, le): value}`` summed over all processes."""
+    totals = {}
+    for path in glob.glob(os.path.join(METRICS_DIR, "*.db")):
+        with open(path, "rb") as file:
+            try:
+                buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                continue  # An empty file, just created.
+        with buffer:
+            for key, _, value in _entries(buffer):
+                name, suffix, labels, le = json.loads(key)
+                sample = (name, suffix, tuple(labels), le)
+                totals[sample] = totals.get(sample, 0.0) + value
+    return totals
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        # label values -> positions in this process's file
+        self._children = {}
+        REGISTRY[name] = self
+
+    def _key(self, suffix, values, le=None):
+        return json.dumps([self.name, suffix, list(values), le], ensure_ascii=False)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *values, amount=1):
+        with _lock:
+            position = self._children.get(values)
+            if position is None:
+                position = self._children[values] = _process_values().position(self._key("_total", values))
+            _values.add(position, amount)
+
+    def value(self, *values):
+        """The total over all processes."""
+        return collect().get((self.name, "_total", values, None), 0.0)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets) + (math.inf,)
+
+    def _positions(self, values):
+        process_values = _process_values()
+        buckets = [process_values.position(self._key("_bucket", values, bound)) for bound in self.buckets]
+        return (
+            buckets,
+            process_values.position(self._key("_sum", values)),
+            process_values.position(self._key("_count", values)),
+        )
+
+    def observe(self, amount, *values):
+        index = bisect.bisect_left(self.buckets, amount)
+        with _lock:
+            positions = self._children.get(values)
+            if positions is None:
+                positions = self._children[values] = self._positions(values)
+            buckets, total, count = positions
+            # Buckets are stored per interval and made cumulative on export.
+            _values.add(buckets[index], 1)
+            _values.add(total, amount)
+            _values.add(count, 1)
+
+
+def _number(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, le=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if le is not None:
+        pairs.append(f'le="{_number(le)}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def exposition():
+    """All registered metrics in the Prometheus text format."""
+    samples = {}
+    for (name, suffix, values, le), value in collect().items():
+        samples.setdefault(name, []).append((suffix, values, le, value))
+    lines = []
+    for name, metric in sorted(REGISTRY.items()):
+        family = name + "_total" if metric.kind == "counter" else name
+        lines.append(f"# HELP {family} {metric.documentation}")
+        lines.append(f"# TYPE {family} {metric.kind}")
+        rows = samples.get(name, [])
+        if metric.kind == "histogram":
+            per_labels = {}
+            for suffix, values, le, value in rows:
+                per_labels.setdefault(values, {})[(suffix, le)] = value
+            for values, series in sorted(per_labels.items()):
+                cumulative = 0.0
+                for bound in metric.buckets:
+                    cumulative += series.get(("_bucket", bound), 0.0)
+                    lines.append(f"{name}_bucket{_labels(metric.labels, values, bound)} {_number(cumulative)}")
+                lines.append(f"{name}_sum{_labels(metric.labels, values)} {_number(series.get(('_sum', None), 0.0))}")
+                lines.append(f"{name}_count{_labels(metric.labels, values)} {_number(series.get(('_count', None), 0.0))}")
+        else:
+            for suffix, values, _, value in sorted(rows):
+                lines.append(f"{name}{suffix}{_labels(metric.labels, values)} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint, for hosts in ``INTERNAL_IPS`` and staff."""
+    if request.META.get("REMOTE_ADDR") not in settings.INTERNAL_IPS and not request.user.is_staff:
+        return HttpResponseForbidden()
+    return HttpResponse(exposition(), content_type=CONTENT_TYPE)
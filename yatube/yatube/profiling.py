@@ -0,0 +1,211 @@
+"""Always-on request profiling.
+
+``RequestProfilingMiddleware`` measures every request: SQL queries and their
+time (through ``execute_wrapper``, on every database alias), template render
+time (through the ``ProfiledDjangoTemplates`` backend), cache lookups (counted
+by ``yatube.sqlite_cache``) and the total. The figures go into a
+``Server-Timing`` header, which browser dev tools show per request, and a
+``key=value`` line on the ``yatube.requests`` logger, and are recorded per
+URL name in the ``yatube.metrics`` histograms and counters.
+
+A ``PROFILING_SAMPLE_RATE`` share of requests also runs under ``cProfile``;
+those slower than ``PROFILING_SLOW_MS`` are dumped into ``PROFILING_DIR`` for
+``python -m pstats`` or snakeviz.
+"""
+import cProfile
+import logging
+import os
+import random
+import re
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import DjangoTemplates, Template
+
+from . import metrics
+
+logger = logging.getLogger("yatube.requests")
+
+SAMPLE_RATE = getattr(settings, "PROFILING_SAMPLE_RATE", 0.0)
+SLOW_MS = getattr(settings, "PROFILING_SLOW_MS", 500)
+PROFILE_DIR = getattr(settings, "PROFILING_DIR", os.path.join(settings.BASE_DIR, "profiles"))
+SERVER_TIMING = getattr(settings, "PROFILING_SERVER_TIMING", True)
+
+METHODS = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"}
+
+REQUEST_SECONDS = metrics.Histogram(
+    "yatube_http_request_duration_seconds", "Request latency by URL name.", ["route", "method"],
+)
+RESPONSES = metrics.Counter("yatube_http_responses", "Responses by URL name and status.", ["route", "status"])
+REQUEST_QUERIES = metrics.Histogram(
+    "yatube_http_request_queries", "SQL queries per request by URL name.", ["route"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55),
+)
+CACHE_LOOKUPS = metrics.Counter("yatube_cache_lookups", "Cache lookups made by requests.", ["result"])
+
+_state = threading.local()
+_merge_lock = threading.Lock()
+
+
+class RequestProfile:
+    __slots__ = ("queries", "db", "template", "template_depth", "cache_hits", "cache_misses", "cache")
+
+    def __init__(self):
+        self.queries = 0
+        self.db = self.template = self.cache = 0.0
+        self.template_depth = self.cache_hits = self.cache_misses = 0
+
+    def merge(self, other):
+        self.queries += other.queries
+        self.db += other.db
+        self.template += other.template
+        self.cache += other.cache
+        self.cache_hits += other.cache_hits
+        self.cache_misses += other.cache_misses
+
+    def server_timing(self, total):
+        return (
+            f'db;dur={self.db * 1000:.1f};desc="{self.queries} queries", '
+            f"tpl;dur={self.template * 1000:.1f}, "
+            f'cache;dur={self.cache * 1000:.1f};desc="{self.cache_hits} hits, {self.cache_misses} misses", '
+            f"total;dur={total * 1000:.1f}"
+        )
+
+
+def current():
+    """The profile of the request handled by this thread, or None."""
+    return getattr(_state, "profile", None)
+
+
+def record_cache(hits, misses, seconds):
+    """Counts cache lookups towards the request handled by this thread."""
+    profile = getattr(_state, "profile", None)
+    if profile is not None:
+        profile.cache_hits += hits
+        profile.cache_misses += misses
+        profile.cache += seconds
+
+
+def _time_query(execute, sql, params, many, context):
+    profile = getattr(_state, "profile", None)
+    if profile is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.db += time.perf_counter() - started
+        profile.queries += 1
+
+
+@contextmanager
+def _timing_queries():
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(_time_query))
+        yield
+
+
+@contextmanager
+def part_of(profile):
+    """Counts the work done on this thread towards ``profile``, the profile of
+    a request handled by another thread (see ``yatube.concurrency``). Times
+    of work done in parallel add up, so they can exceed the total."""
+    if profile is None:
+        yield
+        return
+    child = _state.profile = RequestProfile()
+    try:
+        with _timing_queries():
+            yield
+    finally:
+        _state.profile = None
+        with _merge_lock:
+            profile.merge(child)
+
+
+class ProfiledTemplate(Template):
+    def render(self, context=None, request=None):
+        profile = getattr(_state, "profile", None)
+        if profile is None:
+            return super().render(context, request)
+        # Only the outermost render is timed; cards render inside pages.
+        profile.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            profile.template_depth -= 1
+            if not profile.template_depth:
+                profile.template += time.perf_counter() - started
+
+
+class ProfiledDjangoTemplates(DjangoTemplates):
+    """The Django template backend, with render time counted per request."""
+
+    def from_string(self, template_code):
+        return ProfiledTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return ProfiledTemplate(template.template, self)
+
+
+def record_metrics(request, response, profile, total):
+    match = request.resolver_match
+    route = match.view_name if match is not None else "unmatched"
+    REQUEST_SECONDS.observe(total, route, request.method if request.method in METHODS else "other")
+    RESPONSES.inc(route, response.status_code)
+    REQUEST_QUERIES.observe(profile.queries, route)
+    if profile.cache_hits:
+        CACHE_LOOKUPS.inc("hit", amount=profile.cache_hits)
+    if profile.cache_misses:
+        CACHE_LOOKUPS.inc("miss", amount=profile.cache_misses)
+
+
+def _dump_name(request, total):
+    path = re.sub(r"[^\w]+", "-", request.path).strip("-") or "root"
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{request.method}-{path[:80]}-{total * 1000:.0f}ms.prof"
+
+
+class RequestProfilingMiddleware:
+    """Adds a ``Server-Timing`` header and a log line to every response."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        profile = _state.profile = RequestProfile()
+        profiler = cProfile.Profile() if SAMPLE_RATE and random.random() < SAMPLE_RATE else None
+        started = time.perf_counter()
+        try:
+            with _timing_queries():
+                if profiler is not None:
+                    profiler.enable()
+                try:
+                    response = self.get_response(request)
+                finally:
+                    if profiler is not None:
+                        profiler.disable()
+        finally:
+            _state.profile = None
+        total = time.perf_counter() - started
+
+        if SERVER_TIMING:
+            response["Server-Timing"] = profile.server_timing(total)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(
+                "method=%s path=%s status=%s total_ms=%.1f db_ms=%.1f queries=%d template_ms=%.1f "
+                "cache_ms=%.1f cache_hits=%d cache_misses=%d",
+                request.method, request.path, response.status_code, total * 1000, profile.db * 1000,
+                profile.queries, profile.template * 1000, profile.cache * 1000, profile.cache_hits,
+                profile.cache_misses,
+            )
+        record_metrics(request, response, profile, total)
+        if profiler is not None and total * 1000 >= SLOW_MS:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            profiler.dump_stats(os.path.join(PROFILE_DIR, _dump_name(request, total)))
+        return response
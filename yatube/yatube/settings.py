@@ -61,11 +61,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'yatube.profiling.RequestProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'yatube.databases.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'users.authentication.CachedAuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     "debug_toolbar.middleware.DebugToolbarMiddleware",
@@ -78,8 +80,13 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
-    ]
+        'users.authentication.CachedTokenAuthentication',
+    ],
+    # orjson renders large lists several times faster; drop it to use the stock renderer.
+    'DEFAULT_RENDERER_CLASSES': [
+        'posts.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
 
 SITE_ID = 1
@@ -90,7 +97,8 @@ TEMPLATES_DIR = os.path.join(BASE_DIR, "templates")
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates that counts render time, see yatube/profiling.py.
+        'BACKEND': 'yatube.profiling.ProfiledDjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -104,24 +112,59 @@ TEMPLATES = [
     },
 ]
 
+# Shared by all worker processes on the host; see yatube/sqlite_cache.py.
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'yatube.sqlite_cache.SQLiteCache',
+        'LOCATION': os.getenv('CACHE_LOCATION', os.path.join(BASE_DIR, 'cache.sqlite3')),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
     }
 }
 
+# Runs the tests against a temporary cache file, so they neither see nor
+# clobber the development server's entries.
+TEST_RUNNER = 'yatube.test_runner.TemporaryCacheRunner'
+
+# Feed pages are invalidated by namespace generations when posts are written,
+# so they can be kept for a long time.
+PAGE_CACHE_TIMEOUT = 60 * 60 * 24
+
 WSGI_APPLICATION = 'yatube.wsgi.application'
+# yatube/asgi.py runs each request on a pool of this many threads.
+ASGI_THREADS = 32
+# Views load independent pieces of a page on a pool of this many threads,
+# each with its own database connection; see yatube/concurrency.py.
+CONCURRENT_LOADING_WORKERS = 4
 
 
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
+# Feed pages and API reads go to the replica, see yatube/databases.py. Locally
+# it is a copy of the primary refreshed by `manage.py sync_replica --interval 5`.
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+        # Seconds a connection waits for a locked database before failing.
+        'OPTIONS': {'timeout': 20},
+        'CONN_MAX_AGE': 60,
+    },
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.getenv('DATABASE_REPLICA', os.path.join(BASE_DIR, 'db.replica.sqlite3')),
+        'OPTIONS': {'timeout': 20},
+        'CONN_MAX_AGE': 60,
+        'TEST': {'MIRROR': 'default'},
+    },
 }
+DATABASE_ROUTERS = ['yatube.databases.PrimaryReplicaRouter']
+# Clients stay on the primary this long after writing, to cover replica lag.
+# Replicas not copied by sync_replica (which records how far the copy goes)
+# are assumed to lag less than this.
+REPLICA_STICKY_SECONDS = 10
 
 
 # Password validation
@@ -162,12 +205,99 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, "static")
+# manage.py build_static writes bundles here, collects everything into
+# STATIC_ROOT under content-hashed names and precompresses it, see yatube/assets.py.
+STATIC_BUILD_DIR = os.path.join(BASE_DIR, "static_build")
+STATICFILES_DIRS = [STATIC_BUILD_DIR]
+STATICFILES_STORAGE = 'yatube.assets.ManifestStorage'
+# Bundles (under bundles/) and the static files they are made of, in order.
+STATIC_BUNDLES = {
+    "site.css": ["bootstrap/dist/css/bootstrap.min.css"],
+    "site.js": ["jquery/dist/jquery.min.js", "bootstrap/dist/js/bootstrap.min.js"],
+    "comments.js": ["js/comments.js"],
+}
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Uploads are streamed to disk and hashed on the way, see posts/storage.py.
+FILE_UPLOAD_HANDLERS = ['posts.storage.HashingFileUploadHandler']
+# Uploaded originals are capped to this many pixels on their longer side.
+IMAGE_MAX_SIDE = 2048
+# Search ranks only this many of the newest matches of a query.
+SEARCH_MAX_CANDIDATES = 10000
+# Session data and the users of sessions and API tokens are cached, see users/authentication.py.
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+AUTH_CACHE_TIMEOUT = 60
+# Largest number of posts accepted by one bulk API request.
+BULK_MAX_ITEMS = 1000
+
+# Token buckets of the views that write, per user (per IP when anonymous):
+# "N/period" allows bursts of N requests and N per period on average. See
+# yatube/throttling.py; staff and scopes not listed here are not limited.
+# "api_bulk_post" counts posts, not requests, and must allow BULK_MAX_ITEMS.
+RATE_LIMITS = {
+    "new_post": "10/m",
+    "add_comment": "20/m",
+    "profile_follow": "30/m",
+    "api_new_post": "20/m",
+    "api_bulk_post": "1000/h",
+}
+RATE_LIMIT_CACHE = "default"
+
 LOGIN_URL = "/auth/login/"
 LOGIN_REDIRECT_URL = "index"
 
 EMAIL_BACKEND = "django.core.mail.backends.filebased.EmailBackend"
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, "sent_emails")
+
+# Follow feed: authors with this many followers are pulled at read time
+# instead of being pushed into every follower's timeline.
+TIMELINE_FANOUT_LIMIT = 1000
+TIMELINE_BACKFILL_SIZE = 100
+
+# "Who to follow": the number of suggestions stored per user, the follower
+# count above which authors are left out of scoring and the processes
+# scoring users in rebuild_recommendations; see posts/recommendations.py.
+RECOMMENDATIONS_TOP_K = 20
+RECOMMENDATIONS_HUB_LIMIT = 1000
+RECOMMENDATIONS_WORKERS = os.cpu_count() or 1
+
+# Comment threads are shown and loaded this many comments at a time.
+COMMENTS_PER_PAGE = 20
+
+# Rendered post cards are keyed by post version, so the timeout only bounds
+# how long unused versions stay around.
+POST_CARD_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Processes rendering image renditions in the background, see posts/renditions.py.
+THUMBNAIL_WORKERS = 2
+
+# Every request gets a Server-Timing header and a line on the yatube.requests
+# logger; this share of requests also runs under cProfile, and those slower
+# than PROFILING_SLOW_MS are dumped into PROFILING_DIR. See yatube/profiling.py.
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', '0.01'))
+PROFILING_SLOW_MS = 500
+PROFILING_DIR = os.path.join(BASE_DIR, 'profiles')
+PROFILING_SERVER_TIMING = True
+
+# Every worker process writes its metrics into a file of its own here; the
+# /metrics endpoint adds them up. Empty it when deploying. See yatube/metrics.py.
+METRICS_DIR = os.getenv('METRICS_DIR', os.path.join(BASE_DIR, 'metrics'))
+
+# The per-request lines of yatube.requests are INFO: set REQUEST_LOG_LEVEL=INFO
+# in deployments to get them; tests and benchmarks stay quiet.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'yatube.requests': {
+            'handlers': ['console'],
+            'level': os.getenv('REQUEST_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+    },
+}
@@ -0,0 +1,180 @@
+"""SQLite-backed cache shared by all worker processes on one host.
+
+Unlike ``LocMemCache`` every process sees the same entries, and unlike
+``FileBasedCache`` ``incr`` is atomic, so the cache can hold counters
+(page generations, rate limits) as well as rendered fragments.
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'yatube.sqlite_cache.SQLiteCache',
+            'LOCATION': '/path/to/cache.sqlite3',
+        }
+    }
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from .profiling import record_cache
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS cache ("
+    " key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL"
+    ") WITHOUT ROWID",
+    "CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)",
+)
+CULL_EVERY = 100
+
+
+class SQLiteCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._location = location
+        self._local = threading.local()
+        self._writes = 0
+
+    def _connection(self):
+        local = self._local
+        if getattr(local, "pid", None) != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self._location)), exist_ok=True)
+            connection = sqlite3.connect(self._location, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            for statement in SCHEMA:
+                connection.execute(statement)
+            local.connection, local.pid = connection, os.getpid()
+        return local.connection
+
+    @staticmethod
+    def _encode(value):
+        # Integers are stored as they are so that incr() can run in SQL.
+        if type(value) is int:
+            return value
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def _decode(value):
+        return value if isinstance(value, int) else pickle.loads(value)
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        connection = self._connection()
+        connection.execute("DELETE FROM cache WHERE key = ? AND expires <= ?", (key, time.time()))
+        cursor = connection.execute(
+            "INSERT OR IGNORE INTO cache (key, value, expires) VALUES (?, ?, ?)",
+            (key, self._encode(value), self.get_backend_timeout(timeout)),
+        )
+        return cursor.rowcount == 1
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        started = time.perf_counter()
+        row = self._connection().execute(
+            "SELECT value FROM cache WHERE key = ? AND (expires IS NULL OR expires > ?)", (key, time.time())
+        ).fetchone()
+        record_cache(row is not None, row is None, time.perf_counter() - started)
+        return default if row is None else self._decode(row[0])
+
+    def get_many(self, keys, version=None):
+        made = {self._key(key, version): key for key in keys}
+        if not made:
+            return {}
+        placeholders = ",".join("?" * len(made))
+        started = time.perf_counter()
+        rows = self._connection().execute(
+            f"SELECT key, value FROM cache WHERE key IN ({placeholders}) AND (expires IS NULL OR expires > ?)",
+            (*made, time.time()),
+        ).fetchall()
+        record_cache(len(rows), len(made) - len(rows), time.perf_counter() - started)
+        return {made[key]: self._decode(value) for key, value in rows}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self.get_backend_timeout(timeout)
+        rows = [(self._key(key, version), self._encode(value), expires) for key, value in data.items()]
+        connection = self._connection()
+        connection.executemany("INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)", rows)
+        self._writes += 1
+        if self._writes % CULL_EVERY == 0:
+            self._cull(connection)
+        return []
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        cursor = self._connection().execute(
+            "UPDATE cache SET expires = ? WHERE key = ? AND (expires IS NULL OR expires > ?)",
+            (self.get_backend_timeout(timeout), key, time.time()),
+        )
+        return cursor.rowcount == 1
+
+    def incr(self, key, delta=1, version=None):
+        made = self._key(key, version)
+        row = self._connection().execute(
+            "UPDATE cache SET value = value + ? WHERE key = ? AND typeof(value) = 'integer'"
+            " AND (expires IS NULL OR expires > ?) RETURNING value",
+            (delta, made, time.time()),
+        ).fetchone()
+        if row is None:
+            raise ValueError("Key '%s' not found" % key)
+        return row[0]
+
+    def take_token(self, key, interval, capacity, cost=1, version=None):
+        """Takes ``cost`` tokens from the bucket ``key``, which holds
+        ``capacity`` tokens and gets one back every ``interval`` seconds.
+        Returns whether there were enough.
+
+        The bucket is stored as the time it will be full again, in integer
+        microseconds (GCRA); one UPSERT checks and moves it forward, so
+        concurrent processes never take the same token. The row expires when
+        the bucket is full."""
+        if cost > capacity:
+            return False
+        now, step = int(time.time() * 1e6), int(interval * 1e6)
+        row = self._connection().execute(
+            "INSERT INTO cache (key, value, expires) VALUES (?1, ?2 + ?3, (?2 + ?3) / 1e6)"
+            " ON CONFLICT (key) DO UPDATE SET"
+            " value = max(value, ?2) + ?3, expires = (max(value, ?2) + ?3) / 1e6"
+            " WHERE typeof(value) = 'integer' AND max(value, ?2) + ?3 - ?2 <= ?4 RETURNING value",
+            (self._key(key, version), now, step * cost, step * capacity),
+        ).fetchone()
+        return row is not None
+
+    def delete(self, key, version=None):
+        self._connection().execute("DELETE FROM cache WHERE key = ?", (self._key(key, version),))
+
+    def delete_many(self, keys, version=None):
+        self._connection().executemany(
+            "DELETE FROM cache WHERE key = ?", [(self._key(key, version),) for key in keys]
+        )
+
+    def has_key(self, key, version=None):
+        return self.get(key, self, version=version) is not self
+
+    def clear(self):
+        self._connection().execute("DELETE FROM cache")
+
+    def _cull(self, connection):
+        connection.execute("DELETE FROM cache WHERE expires <= ?", (time.time(),))
+        count = connection.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        if count > self._max_entries and self._cull_frequency:
+            connection.execute(
+                # NULL sorts first; entries that never expire (page generations)
+                # go last.
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY expires IS NULL, expires LIMIT ?)",
+                (count // self._cull_frequency,),
+            )
+
+    def close(self, **kwargs):
+        # Connections are kept for the life of the thread.
+        pass
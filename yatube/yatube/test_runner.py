@@ -0,0 +1,32 @@
+"""Test runner giving the tests a cache of their own.
+
+The ``SQLiteCache`` file of ``CACHES`` is shared by every process on the
+host, the development server's included. ``TemporaryCacheRunner`` points
+every ``SQLiteCache`` at a file in a temporary directory while the tests run
+and removes the directory afterwards.
+"""
+import os
+import tempfile
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TemporaryCacheRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.cache_directory = tempfile.TemporaryDirectory(prefix="yatube-test-")
+        caches = {
+            alias: dict(config, LOCATION=os.path.join(self.cache_directory.name, f"{alias}.sqlite3"))
+            if config["BACKEND"] == "yatube.sqlite_cache.SQLiteCache" else config
+            for alias, config in settings.CACHES.items()
+        }
+        # Changing CACHES drops the cache connections already made.
+        self.cache_settings = override_settings(CACHES=caches)
+        self.cache_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.cache_settings.disable()
+        self.cache_directory.cleanup()
+        super().teardown_test_environment(**kwargs)
@@ -0,0 +1,116 @@
+"""Token-bucket rate limits of the views that write.
+
+Every scope of ``RATE_LIMITS`` gives each user (each IP address for
+anonymous clients) a bucket of ``N`` tokens refilled at ``N`` per period::
+
+    RATE_LIMITS = {"new_post": "10/m"}
+
+    @rate_limit("new_post")
+    def new_post(request): ...
+
+A request without a token gets 429 with ``Retry-After``. Buckets live in the
+``RATE_LIMIT_CACHE`` cache so all worker processes share them. With
+``SQLiteCache`` a check is one UPSERT (``take_token``); other backends count
+requests per fixed window with ``incr``, one round-trip once the window's
+counter exists. Scopes missing from ``RATE_LIMITS`` and staff users are not
+limited. ``TokenBucketThrottle`` applies the same limits to API views;
+``take(scope, request, cost=n)`` charges a request that does the work of
+``n`` (a bulk request, one token per item).
+"""
+import math
+import time
+from collections import namedtuple
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from rest_framework.throttling import BaseThrottle
+
+LIMITS = getattr(settings, "RATE_LIMITS", {})
+CACHE = getattr(settings, "RATE_LIMIT_CACHE", "default")
+KEY_PREFIX = "throttle"
+PERIODS = {"s": 1, "m": 60, "h": 60 * 60, "d": 60 * 60 * 24}
+
+Rate = namedtuple("Rate", ["interval", "capacity"])
+
+
+def parse_rate(rate):
+    """``"10/m"`` (or ``"10/min"``) -> 10 tokens, one back every 6 seconds."""
+    count, period = rate.split("/")
+    count = int(count)
+    return Rate(PERIODS[period[0]] / count, count)
+
+
+def client_key(request):
+    user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated:
+        return f"user:{user.pk}"
+    return f"ip:{request.META.get('REMOTE_ADDR', '')}"
+
+
+def _count_in_window(cache, key, rate, cost):
+    window = max(1, math.ceil(rate.interval * rate.capacity))
+    key = f"{key}:{int(time.time() // window)}"
+    try:
+        count = cache.incr(key, cost)
+    except ValueError:
+        count = cost if cache.add(key, cost, window) else cache.incr(key, cost)
+    return count <= rate.capacity, window
+
+
+def take(scope, request, cost=1):
+    """Takes ``cost`` tokens of ``scope`` for the client of ``request``.
+    Returns 0 when there were enough, otherwise the seconds to wait."""
+    rate = LIMITS.get(scope)
+    user = getattr(request, "user", None)
+    if rate is None or (user is not None and user.is_staff):
+        return 0
+    rate = parse_rate(rate)
+    cache = caches[CACHE]
+    key = f"{KEY_PREFIX}:{scope}:{client_key(request)}"
+    if hasattr(cache, "take_token"):
+        # A refused bucket has ``cost`` tokens again after at most ``cost``
+        # intervals; reading when exactly would cost a second round-trip.
+        allowed = cache.take_token(key, rate.interval, rate.capacity, cost)
+        wait = rate.interval * min(cost, rate.capacity)
+    else:
+        allowed, wait = _count_in_window(cache, key, rate, cost)
+    return 0 if allowed else max(1, math.ceil(wait))
+
+
+def too_many_requests(wait):
+    response = HttpResponse("Too many requests, try again later.", status=429, content_type="text/plain")
+    response["Retry-After"] = str(wait)
+    return response
+
+
+def rate_limit(scope, methods=("POST",)):
+    """Limits ``methods`` requests of a view (every request when ``methods``
+    is None) to the ``RATE_LIMITS`` rate of ``scope``."""
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            if methods is None or request.method in methods:
+                wait = take(scope, request)
+                if wait:
+                    return too_many_requests(wait)
+            return view(request, *args, **kwargs)
+        return wrapped
+    return decorator
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """DRF throttle taking tokens of ``scope``; DRF answers 429 with
+    ``Retry-After`` from ``wait()``."""
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.delay = 0
+
+    def allow_request(self, request, view):
+        self.delay = take(self.scope, request)
+        return not self.delay
+
+    def wait(self):
+        return self.delay
@@ -1,11 +1,13 @@
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.contrib.flatpages import views
 from django.conf.urls import handler404, handler500
 from django.conf import settings
 from django.conf.urls.static import static
 from rest_framework.authtoken import views as rfviews
 
+from yatube import assets, metrics
+
 
 
 handler404 = "posts.views.page_not_found"
@@ -16,6 +18,8 @@ urlpatterns = [
     path('about/', include('django.contrib.flatpages.urls')),
     path("auth/", include("users.urls")),
     path("auth/", include("django.contrib.auth.urls")),
+    path("metrics", metrics.metrics_view, name="metrics"),
+    re_path(rf"^{settings.STATIC_URL.strip('/')}/(?P<path>.+)$", assets.serve, name="static"),
     path("", include("posts.urls")),
 ]
 